@@ -0,0 +1,189 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from kline_store import KlineStore, INTERVAL_MS
+from strategy import (
+    rsi_macd_signal_array, grid_signal_array,
+    TRADE_QUANTITY, STOP_LOSS_PERCENT, TAKE_PROFIT_PERCENT, POSITION_COOLDOWN
+)
+
+# === Векторный бэктест стратегий RSI+MACD и сетки ===
+# Сигналы считаются сразу по всей истории, а симуляция идёт только по свечам
+# с сигналами: выход по TP/SL ищется векторно, без покадрового перебора.
+
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+KLINE_COLUMNS = [
+    'timestamp', 'Open', 'High', 'Low', 'Close', 'Volume',
+    'close_time', 'quote_asset_volume', 'number_of_trades',
+    'taker_buy_base_volume', 'taker_buy_quote_volume', 'ignore'
+]
+TRADE_COLUMNS = ['entry_time', 'exit_time', 'side', 'entry_price', 'exit_price', 'exit_reason', 'pnl', 'fees']
+
+
+# === Загрузка сохранённых свечей ===
+# CSV в формате Binance, Parquet или каталог хранилища kline_store (data/klines/BTCUSDT/1m)
+def load_klines(path):
+    if os.path.isdir(path):
+        interval = os.path.basename(os.path.normpath(path))
+        symbol_dir = os.path.dirname(os.path.normpath(path))
+        store = KlineStore(os.path.dirname(symbol_dir))
+        return store.load(os.path.basename(symbol_dir), interval)
+    if str(path).endswith('.parquet'):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path, header=None)
+        if not str(df.iloc[0, 0]).isdigit():  # CSV с заголовком
+            df = pd.read_csv(path)
+        else:
+            df.columns = KLINE_COLUMNS[:df.shape[1]]
+
+    df = df.rename(columns={c: c.capitalize() for c in ['open', 'high', 'low', 'close', 'volume']})
+    df = df.rename(columns={'open_time': 'timestamp'})
+    if 'timestamp' in df.columns:
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        df = df.set_index('timestamp')
+    return df[COLUMNS].astype(float).sort_index()
+
+
+def combined_signals(df, params=None):
+    signals = rsi_macd_signal_array(df, params)
+    grid = grid_signal_array(df['Close'].to_numpy(), params)
+    return merge_signals(signals, grid)
+
+
+def merge_signals(rsi_macd, grid):
+    # execute_strategy вызывается раньше execute_grid_strategy, поэтому сигнал RSI+MACD в приоритете
+    return np.where(rsi_macd != 0, rsi_macd, grid).astype(np.int8)
+
+
+# Первая свеча после entry, на которой срабатывает TP или SL (оба сразу → считаем SL)
+def _find_exit(high, low, entry, direction, take_profit, stop_loss, chunk=256):
+    n = len(high)
+    start = entry + 1
+    while start < n:
+        end = min(start + chunk, n)
+        if direction > 0:
+            hit_sl = low[start:end] <= stop_loss
+            hit_tp = high[start:end] >= take_profit
+        else:
+            hit_sl = high[start:end] >= stop_loss
+            hit_tp = low[start:end] <= take_profit
+        hits = np.flatnonzero(hit_sl | hit_tp)
+        if len(hits):
+            j = hits[0]
+            return start + j, ('stop_loss' if hit_sl[j] else 'take_profit')
+        start = end
+        chunk *= 2
+    return -1, None
+
+
+def run_backtest(df, interval='3m', quantity=TRADE_QUANTITY, take_profit_pct=TAKE_PROFIT_PERCENT,
+                 stop_loss_pct=STOP_LOSS_PERCENT, cooldown=POSITION_COOLDOWN, fee=0.0004, slippage=0.0,
+                 signals=None, params=None):
+    if signals is None:
+        signals = combined_signals(df, params)
+
+    times = df.index.as_unit('ms').asi8 if isinstance(df.index, pd.DatetimeIndex) else df.index.to_numpy()
+    trades = simulate(
+        times, df['High'].to_numpy(dtype=np.float64), df['Low'].to_numpy(dtype=np.float64),
+        df['Close'].to_numpy(dtype=np.float64), signals, interval_ms(interval, times),
+        quantity, take_profit_pct, stop_loss_pct, cooldown, fee, slippage
+    )
+
+    trades = pd.DataFrame(trades, columns=TRADE_COLUMNS)
+    trades['entry_time'] = pd.to_datetime(trades['entry_time'], unit='ms')
+    trades['exit_time'] = pd.to_datetime(trades['exit_time'], unit='ms')
+
+    equity = trades.set_index('exit_time')['pnl'].cumsum()
+    stats = summarize(trades['pnl'].to_numpy(), trades['fees'].to_numpy())
+    return {'trades': trades, 'equity': equity, 'stats': stats}
+
+
+def interval_ms(interval, times):
+    if interval in INTERVAL_MS:
+        return INTERVAL_MS[interval]
+    return int(np.median(np.diff(times[:1000]))) if len(times) > 1 else 0
+
+
+# === Симуляция брекета из place_order на массивах ===
+def simulate(times, high, low, close, signals, bar_ms, quantity=TRADE_QUANTITY,
+             take_profit_pct=TAKE_PROFIT_PERCENT, stop_loss_pct=STOP_LOSS_PERCENT,
+             cooldown=POSITION_COOLDOWN, fee=0.0004, slippage=0.0):
+    trades = []
+    next_allowed_ms = -np.inf
+    busy_until = -1  # индекс свечи, на которой закрылась текущая позиция
+
+    for i in np.flatnonzero(signals):
+        decision_ms = times[i] + bar_ms  # стратегия срабатывает на закрытии свечи
+        if i <= busy_until or decision_ms < next_allowed_ms:
+            continue
+
+        direction = int(signals[i])
+        entry_price = close[i] * (1 + slippage * direction)
+        take_profit = round(close[i] * (1 + take_profit_pct * direction), 2)
+        stop_loss = round(close[i] * (1 - stop_loss_pct * direction), 2)
+
+        exit_idx, reason = _find_exit(high, low, i, direction, take_profit, stop_loss)
+        if exit_idx < 0:
+            break  # позиция не закрылась до конца истории
+
+        exit_price = (stop_loss if reason == 'stop_loss' else take_profit) * (1 - slippage * direction)
+        gross = (exit_price - entry_price) * direction * quantity
+        fees = (entry_price + exit_price) * quantity * fee
+        trades.append((
+            int(times[i]), int(times[exit_idx]), 'long' if direction > 0 else 'short',
+            entry_price, exit_price, reason, gross - fees, fees
+        ))
+
+        busy_until = exit_idx
+        # Выход случился внутри свечи — считаем, что в её середине
+        next_allowed_ms = times[exit_idx] + bar_ms / 2 + cooldown * 1000
+
+    return trades
+
+
+def summarize(pnl, fees):
+    if len(pnl) == 0:
+        return {'trades': 0, 'pnl': 0.0, 'win_rate': 0.0, 'max_drawdown': 0.0, 'profit_factor': 0.0, 'fees': 0.0}
+    equity = np.cumsum(pnl)
+    drawdown = (np.maximum.accumulate(np.maximum(equity, 0)) - equity).max()
+    wins = pnl[pnl > 0].sum()
+    losses = -pnl[pnl < 0].sum()
+    return {
+        'trades': int(len(pnl)),
+        'pnl': float(pnl.sum()),
+        'win_rate': float((pnl > 0).mean()),
+        'max_drawdown': float(drawdown),
+        'profit_factor': float(wins / losses) if losses else float('inf'),
+        'fees': float(fees.sum()),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бэктест стратегий RSI+MACD и сетки")
+    parser.add_argument('path', help="CSV (формат Binance), Parquet или каталог kline_store со свечами")
+    parser.add_argument('--interval', default='3m')
+    parser.add_argument('--quantity', type=float, default=TRADE_QUANTITY)
+    parser.add_argument('--fee', type=float, default=0.0004, help="комиссия за сделку, доля")
+    parser.add_argument('--slippage', type=float, default=0.0, help="проскальзывание, доля")
+    parser.add_argument('--trades', help="куда сохранить список сделок (CSV)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    df = load_klines(args.path)
+    print(f"✅ Загружено {len(df)} свечей за {time.perf_counter() - started:.2f} с")
+
+    started = time.perf_counter()
+    result = run_backtest(df, args.interval, args.quantity, fee=args.fee, slippage=args.slippage)
+    print(f"⏱ Бэктест выполнен за {time.perf_counter() - started:.2f} с")
+
+    stats = result['stats']
+    print(f"📊 Сделок: {stats['trades']} | PnL: {stats['pnl']:.2f}$ | Win rate: {stats['win_rate']:.1%}")
+    print(f"📉 Макс. просадка: {stats['max_drawdown']:.2f}$ | Profit factor: {stats['profit_factor']:.2f}")
+    if args.trades:
+        result['trades'].to_csv(args.trades, index=False)
+        print(f"💾 Сделки сохранены в {args.trades}")
@@ -0,0 +1,389 @@
+import argparse
+import asyncio
+import contextlib
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from headless import import_bot
+from kline_store import INTERVAL_MS
+
+# === Бенчмарк горячего пути обработки свечей ===
+# Записанный (или синтетический) поток kline JSON с незакрытыми тиками и дублями
+# прогоняется через настоящие обработчики bot.py — конвейер, ingest_kline,
+# evaluate_strategies — с заглушками вместо биржи и Telegram. Каждый размер истории
+# считается в отдельном процессе, чтобы пиковая память не смешивалась.
+#   python benchmark.py --sizes 1000,100000,1000000 --out bench.json --compare prev.json
+#   python benchmark.py --record fixture.jsonl.gz --seconds 600   # запись живого потока
+
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+COMPONENT_REPEATS = 5
+
+
+# === Фикстура: по одному сырому кадру WebSocket на строку ===
+def synthesize_fixture(path, symbol='BTCUSDT', interval='1m', candles=2000, ticks=10,
+                       duplicate_every=50, start_ms=None, seed=42):
+    rng = np.random.default_rng(seed)
+    step = INTERVAL_MS[interval]
+    start_ms = start_ms or (int(time.time() * 1000) // step) * step
+    price = 30_000.0
+    stream = f"{symbol.lower()}@kline_{interval}"
+    with gzip.open(path, 'wt') as f:
+        for n in range(candles):
+            open_time = start_ms + n * step
+            open_price = high = low = close = price
+            volume = 0.0
+            for tick in range(ticks + 1):
+                close = close * (1 + rng.normal(0, 0.0007))
+                high, low = max(high, close), min(low, close)
+                volume += abs(rng.normal(5, 2))
+                final = tick == ticks
+                frame = _kline_frame(stream, symbol, interval, open_time, step, open_price, high, low, close,
+                                     volume, final, event_ms=open_time + (step * (tick + 1)) // (ticks + 1))
+                f.write(frame + "\n")
+                if final and duplicate_every and n % duplicate_every == duplicate_every - 1:
+                    f.write(frame + "\n")  # биржа иногда присылает закрытую свечу повторно
+            price = close
+    return path
+
+
+def _kline_frame(stream, symbol, interval, open_time, step, o, h, l, c, v, final, event_ms):
+    return json.dumps({'stream': stream, 'data': {
+        'e': 'kline', 'E': event_ms, 's': symbol, 'k': {
+            't': open_time, 'T': open_time + step - 1, 's': symbol, 'i': interval, 'f': 100, 'L': 200,
+            'o': f"{o:.2f}", 'c': f"{c:.2f}", 'h': f"{h:.2f}", 'l': f"{l:.2f}", 'v': f"{v:.3f}",
+            'n': 100, 'x': final, 'q': f"{v * c:.2f}", 'V': f"{v / 2:.3f}", 'Q': f"{v * c / 2:.2f}", 'B': '0'
+        }
+    }}, separators=(',', ':'))
+
+
+def read_fixture(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        return [line.rstrip('\n') for line in f if line.strip()]
+
+
+async def record_fixture(path, symbols, intervals, seconds):
+    import websockets
+    from websocket_handler import FUTURES_WS_URL, kline_streams
+
+    url = f"{FUTURES_WS_URL}/stream?streams={'/'.join(kline_streams(symbols, intervals))}"
+    count = 0
+    deadline = time.monotonic() + seconds
+    with gzip.open(path, 'wt') as f:
+        async with websockets.connect(url) as ws:
+            while time.monotonic() < deadline:
+                try:
+                    message = await asyncio.wait_for(ws.recv(), deadline - time.monotonic())
+                except asyncio.TimeoutError:
+                    break
+                f.write(message + "\n")
+                count += 1
+    return count
+
+
+# === Заглушки биржи и Telegram ===
+class StubGateway:
+    def __init__(self):
+        self.calls = 0
+        self._order_id = 0
+
+    def _order(self, symbol, side, order_type, stop_price='0'):
+        self._order_id += 1
+        return {'orderId': self._order_id, 'symbol': symbol, 'side': side, 'type': order_type,
+                'status': 'NEW', 'price': '0', 'stopPrice': str(stop_price)}
+
+    async def batch_orders(self, orders):
+        self.calls += 1
+        return [dict(self._order(o['symbol'], o['side'], o['type'], o.get('stopPrice', '0')),
+                     status='FILLED' if o['type'] == 'MARKET' else 'NEW') for o in orders], 0.0
+
+    async def create_order(self, symbol, side, type, **params):
+        self.calls += 1
+        return dict(self._order(symbol, side, type), status='FILLED')
+
+    async def cancel_order(self, symbol, order_id):
+        self.calls += 1
+        return {'orderId': order_id, 'symbol': symbol, 'side': 'SELL', 'type': 'STOP_MARKET', 'status': 'CANCELED'}
+
+    async def cancel_orders(self, symbol, order_ids):
+        self.calls += 1
+        return [{'orderId': order_id, 'symbol': symbol, 'side': 'SELL', 'type': 'STOP_MARKET', 'status': 'CANCELED'}
+                for order_id in order_ids]
+
+    async def cancel_all_open_orders(self, symbol):
+        self.calls += 1
+        return {'code': 200, 'msg': 'The operation of cancel all open order is done.'}
+
+    async def get_open_orders(self, symbol=None):
+        return []
+
+    async def position_information(self, symbol=None):
+        return []
+
+    async def close(self):
+        pass
+
+
+def _history(first_open_ms, step, size, last_price, seed=7):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0, 0.0015, size)
+    closes = last_price / np.exp(np.cumsum(returns[::-1]))[::-1]
+    opens = np.concatenate([[closes[0]], closes[:-1]])
+    spread = np.abs(rng.normal(0, 0.001, size)) * closes
+    index = pd.to_datetime(first_open_ms - step * np.arange(size, 0, -1), unit='ms')
+    return pd.DataFrame({
+        'Open': opens, 'High': np.maximum(opens, closes) + spread, 'Low': np.minimum(opens, closes) - spread,
+        'Close': closes, 'Volume': rng.uniform(1, 10, size)
+    }, index=index)
+
+
+def _percentiles(values):
+    if not values:
+        return {}
+    values = np.asarray(values)
+    return {
+        'count': int(len(values)),
+        'mean_ms': float(values.mean()),
+        'p50_ms': float(np.percentile(values, 50)),
+        'p90_ms': float(np.percentile(values, 90)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'max_ms': float(values.max()),
+    }
+
+
+def _time_calls(func, repeats=COMPONENT_REPEATS):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return _percentiles(samples)
+
+
+# === Один размер истории — в отдельном процессе ===
+def run_size(fixture_path, size, decoder=None, closed_only=True):
+    bot = import_bot()
+    from pipeline import KlinePipeline, BLOCK
+    from kline_codec import KlineDecoder
+    from symbol_state import build_symbol_states
+    from strategy import calculate_indicators, calculate_grid_levels
+    from charts import render_grid_chart, CHART_CANDLES
+
+    frames = read_fixture(fixture_path)
+    streams = {}
+    unique_closed = set()   # фикстура повторяет часть закрытых свечей — дубликаты стратегии не видят
+    for frame in frames:
+        msg = json.loads(frame)
+        msg = msg.get('data', msg)
+        if msg.get('e') == 'kline':
+            streams.setdefault((msg['s'], msg['k']['i']), msg['k'])
+            if msg['k']['x']:
+                unique_closed.add((msg['s'], msg['k']['i'], msg['k']['t']))
+    symbols = sorted({s for s, _ in streams})
+    intervals = sorted({i for _, i in streams})
+
+    gateway = StubGateway()
+    sent = []
+
+    # Свой экземпляр бота: заглушка биржи, уведомления в список, журнал и снимки без записи на диск.
+    # Возвращает бота и время загрузки истории
+    def make_trader():
+        states = build_symbol_states(symbols, intervals, capacity=size, features=bot.strategy_registry.requirements())
+        started = time.perf_counter()
+        for (symbol, interval), kline in streams.items():
+            history = _history(kline['t'], INTERVAL_MS[interval], size, float(kline['o']))
+            states[symbol].seed(interval, history)
+        seeded = time.perf_counter() - started
+        trader = bot.Trader(gateway, states, bot.strategy_registry, sent.append)
+        trader.order_cache.synced = True
+        return trader, seeded
+
+    trader, seed_s = make_trader()
+
+    latencies = []
+    evaluated = {'throughput': 0, 'latency': 0}
+    phase = 'throughput'
+
+    # Каждая сделка «закрывается» сразу, чтобы каждая свеча проходила полный путь решения
+    async def on_closed(symbol, interval):
+        evaluated[phase] += 1
+        await trader.evaluate_strategies(symbol, interval)
+        state = trader.symbol_states[symbol]
+        trader.order_cache.orders.clear()
+        state.active_position = None
+        state.position_closed_recently = False
+
+    # BLOCK вместо склейки задач по умолчанию: иначе при быстрой подаче стратегии видят
+    # только последнюю из накопившихся свечей символа и замер пропускает путь решения
+    def make_pipeline():
+        return KlinePipeline(trader.ingest_kline, on_closed, workers=2, job_policy=BLOCK,
+                             decoder=KlineDecoder(decoder, closed_only=closed_only))
+
+    async def drained(pipeline):
+        while any(len(q) for q in pipeline.queues()):
+            await asyncio.sleep(0)
+        for _ in range(3):
+            await asyncio.sleep(0)
+
+    async def throughput():
+        pipeline = make_pipeline()
+        task = asyncio.create_task(pipeline.run())
+        started = time.perf_counter()
+        for frame in frames:
+            await pipeline.feed(frame)
+        await drained(pipeline)
+        elapsed = time.perf_counter() - started
+        task.cancel()
+        return elapsed, pipeline.metrics()
+
+    # Задержка без очереди: следующий кадр подаётся только после полной обработки предыдущего
+    async def latency():
+        pipeline = make_pipeline()
+        task = asyncio.create_task(pipeline.run())
+        for frame in frames:
+            closed = '"x":true' in frame
+            started = time.perf_counter()
+            await pipeline.feed(frame)
+            await drained(pipeline)
+            if closed:
+                latencies.append((time.perf_counter() - started) * 1000)
+        task.cancel()
+
+    # Повторный прогон идёт по тем же свечам — дубликаты отбрасываются, поэтому
+    # для замера задержки состояние строится заново
+    with contextlib.redirect_stdout(io.StringIO()):
+        elapsed, pipeline_metrics = asyncio.run(throughput())
+        phase = 'latency'
+        trader, _ = make_trader()
+        asyncio.run(latency())
+
+    symbol, interval = next(iter(streams))
+    state = trader.symbol_states[symbol]
+    candles = state.candles[interval]
+    levels = [float(x) for x in calculate_grid_levels(candles)['levels']]
+    components = {
+        'calculate_indicators': _time_calls(lambda: calculate_indicators(candles)),
+        'calculate_grid_levels': _time_calls(lambda: calculate_grid_levels(candles)),
+        'render_grid_chart': _time_calls(
+            lambda: render_grid_chart(candles.to_frame(tail=CHART_CANDLES), levels, symbol, interval), repeats=3
+        ),
+        'grid_chart_cached': _time_calls(
+            lambda: asyncio.run(bot.chart_renderer.grid_chart(symbol, interval, candles, levels)), repeats=3
+        ),
+    }
+    bot.chart_renderer.close()
+
+    return {
+        'history': size,
+        'decoder': KlineDecoder(decoder).backend,
+        'closed_only': closed_only,
+        'frames': len(frames),
+        'closed_candles': len(latencies),
+        'unique_closed_candles': len(unique_closed),
+        # Свечи, дошедшие до evaluate_strategies: должно совпадать с unique_closed_candles
+        'evaluated_candles': evaluated['throughput'],
+        'evaluated_candles_latency': evaluated['latency'],
+        'seed_s': seed_s,
+        'throughput_msgs_per_s': len(frames) / elapsed,
+        'replay_s': elapsed,
+        'candle_latency': _percentiles(latencies),
+        'components': components,
+        'orders_sent': gateway.calls,
+        'notifications': len(sent),
+        'pipeline': pipeline_metrics,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmark(fixture_path, sizes, label=None, decoder=None, closed_only=True):
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for size in sizes:
+        # Не multiprocessing.Pool: его процессы-демоны не могут запускать рисовальщик графиков
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            result = pool.submit(run_size, fixture_path, size, decoder, closed_only).result()
+        results.append(result)
+        print(f"📊 история {size}: {result['throughput_msgs_per_s']:.0f} сообщ/с | "
+              f"свеча p50 {result['candle_latency']['p50_ms']:.2f} мс, p99 {result['candle_latency']['p99_ms']:.2f} мс | "
+              f"пик памяти {result['peak_rss_mb']:.0f} МБ | "
+              f"стратегии: {result['evaluated_candles']}/{result['unique_closed_candles']} свечей")
+    return {
+        'timestamp': pd.Timestamp.now(tz='UTC').isoformat(),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'fixture': label or os.path.abspath(fixture_path),
+        'results': results,
+    }
+
+
+def compare(current, previous):
+    before = {r['history']: r for r in previous['results']}
+    for result in current['results']:
+        old = before.get(result['history'])
+        if old is None:
+            continue
+        speed = result['throughput_msgs_per_s'] / old['throughput_msgs_per_s'] - 1
+        p99 = result['candle_latency']['p99_ms'] / old['candle_latency']['p99_ms'] - 1
+        memory = result['peak_rss_mb'] - old['peak_rss_mb']
+        print(f"↔️ история {result['history']}: пропускная способность {speed:+.1%} | "
+              f"p99 свечи {p99:+.1%} | память {memory:+.0f} МБ (к {previous.get('commit')})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк обработки свечей")
+    parser.add_argument('--fixture', help="записанный поток (jsonl или jsonl.gz); без него — синтетический")
+    parser.add_argument('--sizes', default=",".join(map(str, DEFAULT_SIZES)), help="размеры истории через запятую")
+    parser.add_argument('--candles', type=int, default=2000, help="закрытых свечей в синтетическом потоке")
+    parser.add_argument('--ticks', type=int, default=10, help="незакрытых тиков на свечу")
+    parser.add_argument('--decoder', choices=['msgspec', 'orjson', 'json'], help="JSON-декодер (по умолчанию самый быстрый)")
+    parser.add_argument('--all-ticks', action='store_true', help="разбирать и незакрытые тики")
+    parser.add_argument('--out', default='benchmark_results.json')
+    parser.add_argument('--compare', help="предыдущий файл результатов для сравнения")
+    parser.add_argument('--record', help="записать живой поток в этот файл и выйти")
+    parser.add_argument('--seconds', type=float, default=300)
+    parser.add_argument('--symbols', default='BTCUSDT')
+    parser.add_argument('--intervals', default='1m')
+    args = parser.parse_args()
+
+    if args.record:
+        count = asyncio.run(record_fixture(args.record, args.symbols.split(','), args.intervals.split(','), args.seconds))
+        print(f"💾 Записано {count} кадров в {args.record}")
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fixture = args.fixture or synthesize_fixture(
+            os.path.join(tmp, 'fixture.jsonl.gz'), args.symbols.split(',')[0], args.intervals.split(',')[0],
+            args.candles, args.ticks
+        )
+        report = run_benchmark(fixture, [int(s) for s in args.sizes.split(',')],
+                               label=None if args.fixture else f"synthetic:{args.candles}x{args.ticks + 1}",
+                               decoder=args.decoder, closed_only=not args.all_ticks)
+
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Результаты сохранены в {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
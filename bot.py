@@ -1,24 +1,30 @@
-import os
+from __future__ import annotations
+
 import time
-import json
+BOOT_STARTED = time.perf_counter()  # отсчёт отчёта о старте — до тяжёлых импортов
+
+import os
 import asyncio
-import pandas as pd
+import importlib
+import threading
+from datetime import datetime
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
-from binance.client import Client as BinanceClient
-from binance.exceptions import BinanceAPIException
-from telegram import Update
-from telegram.ext import Application, CommandHandler, ContextTypes
-from io import BytesIO
-import mplfinance as mpf
-import nest_asyncio
 
+# python-telegram-bot (с httpx) импортируется в run_telegram_bot, параллельно с загрузкой истории
+if TYPE_CHECKING:
+    from telegram import Update
+    from telegram.ext import ContextTypes
 
-nest_asyncio.apply()
 
 # === Настройки проекта ===
 load_dotenv()
-SYMBOL = "BTCUSDT"
-INTERVAL = "3m"
+# Корзина инструментов и интервалов: SYMBOLS=BTCUSDT,ETHUSDT INTERVALS=3m,15m
+# Интервалы, которых нет у биржи (15s, v50, t500), собираются локально из aggTrade
+SYMBOLS = [s.strip().upper() for s in os.getenv("SYMBOLS", "BTCUSDT").split(",") if s.strip()]
+INTERVALS = [i.strip() for i in os.getenv("INTERVALS", "3m").split(",") if i.strip()]
+SYMBOL = SYMBOLS[0]  # символ по умолчанию для команд Telegram
+INTERVAL = INTERVALS[0]
 TRADE_QUANTITY = 0.002  # Количество BTC для торговли
 
 # === Инициализация API клиента (Testnet Futures) ===
@@ -27,414 +33,868 @@ BINANCE_FUTURES_SECRET_KEY = os.getenv("BINANCE_FUTURES_SECRET_KEY")
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 
-# Подключаемся к тестовой сети
-client = BinanceClient(
-    api_key=BINANCE_FUTURES_API_KEY,
-    api_secret=BINANCE_FUTURES_SECRET_KEY,
-    testnet=True
+from execution import AsyncFuturesGateway, ExchangeAPIError, REQUEST_ERRORS, FUTURES_TESTNET_URL, format_latencies
+from order_manager import OrderManager, BracketError
+from paper_exchange import PaperExchange, PaperGateway, PaperClient, PaperUserStream, TAKER_FEE, SLIPPAGE
+from websocket_handler import BinanceFuturesWebSocketManager, BinanceUserDataStream
+from order_state import OrderStateCache, PROTECTIVE_TYPES
+from strategy import (
+    calculate_grid_levels, load_params, PARAMS,
+    STOP_LOSS_PERCENT, TAKE_PROFIT_PERCENT, POSITION_COOLDOWN
 )
-
-# Импорты после инициализации
-from websocket_handler import BinanceFuturesWebSocketManager
-from strategy import execute_strategy, execute_grid_strategy
+from strategy_runtime import StrategyContext, build_registry
+from candle_store import DUPLICATE, OUT_OF_ORDER, SharedCandleBuffer, segment_name
+from symbol_state import build_symbol_states
+from kline_store import KlineStore, INTERVAL_MS
+from trade_bars import TradeBarAggregator, parse_bar_spec
 from notifier import create_notifier
+from charts import ChartRenderer, CHART_CANDLES
+from snapshot import SnapshotStore
+from pipeline import KlinePipeline
+from kline_codec import KlineDecoder
+from metrics import REGISTRY, start_metrics_server
+from rate_limit import LOW
+from order_book import OrderBookManager
+from trade_journal import TradeJournal
 
 send_telegram_message = create_notifier(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID)
 
-# === Хранилище данных ===
-df_stream = pd.DataFrame(columns=['Open', 'High', 'Low', 'Close', 'Volume'])
+# Асинхронный шлюз для ордеров и запросов из event loop (можно направить на mock_exchange.py)
+gateway = AsyncFuturesGateway(
+    api_key=BINANCE_FUTURES_API_KEY,
+    api_secret=BINANCE_FUTURES_SECRET_KEY,
+    base_url=os.getenv("BINANCE_FUTURES_REST_URL", FUTURES_TESTNET_URL)
+)
+
+# Локальный стакан L2 (ORDER_BOOK=1): снимок REST + поток @depth@100ms. Снимок — публичный запрос,
+# поэтому стакан берётся с биржи и в режиме бумажной торговли
+ORDER_BOOK = os.getenv("ORDER_BOOK") == "1"
+MAX_ENTRY_SLIPPAGE = float(os.getenv("MAX_ENTRY_SLIPPAGE", "0.001"))  # 0.1% от середины стакана
+order_books = OrderBookManager(gateway, SYMBOLS) if ORDER_BOOK else None
+
+# Бумажная торговля: ордеры исполняет симулятор по потоку свечей, история — по-прежнему с биржи
+PAPER_TRADING = os.getenv("PAPER_TRADING") == "1"
+paper_exchange = None
+if PAPER_TRADING:
+    paper_exchange = PaperExchange(
+        balance=float(os.getenv("PAPER_BALANCE", "10000")),
+        fee_rate=float(os.getenv("PAPER_FEE", str(TAKER_FEE))),
+        slippage=float(os.getenv("PAPER_SLIPPAGE", str(SLIPPAGE)))
+    )
+    gateway = PaperGateway(paper_exchange, market_data=gateway)  # свечи для догрузки — с биржи
+    print("📄 Режим бумажной торговли: ордеры исполняются симулятором")
+
+# Синхронный клиент python-binance — только для истории при старте (потоки prepare_interval).
+# Пакет binance (~0.8 с импорта) загружается при первом запросе, а не при import bot
+client = None
+_client_lock = threading.Lock()
+
+
+def market_client():
+    global client
+    with _client_lock:
+        if client is None:
+            from binance.client import Client as BinanceClient
+            # Тестовая сеть; без ping в конструкторе: клиент не ходит в сеть до первого запроса
+            client = BinanceClient(api_key=BINANCE_FUTURES_API_KEY, api_secret=BINANCE_FUTURES_SECRET_KEY,
+                                   testnet=True, ping=False)
+            if paper_exchange is not None:
+                client = PaperClient(paper_exchange, market_data=client)   # история — по-прежнему с биржи
+        return client
+
+
+# Часы бота: паузы между сделками, метки журнала и догрузки. Прогон по истории
+# подставляет часы бумажной биржи, которые идут по времени свечей
+class WallClock:
+    def time(self):
+        return time.time()
+
+
+# Параметры стратегий, подобранные optimizer.py (если файл есть)
+STRATEGY_PARAMS_FILE = os.getenv("STRATEGY_PARAMS", "strategy_params.json")
+if os.path.exists(STRATEGY_PARAMS_FILE):
+    load_params(STRATEGY_PARAMS_FILE)
+    print(f"⚙️ Параметры стратегии загружены из {STRATEGY_PARAMS_FILE}")
+
+# Стратегии на каждую свечу: STRATEGIES=rsi_macd,grid; их намерения сводятся в одну сделку
+strategy_registry = build_registry(
+    [name.strip() for name in os.getenv("STRATEGIES", "rsi_macd,grid").split(",") if name.strip()],
+    min_net=float(os.getenv("STRATEGY_MIN_NET", "0"))
+)
 
-# === Переменные управления позицией ===
-active_position = None  # 'long' / 'short' / None
-entry_price = 0.0
-oco_set = False
-position_closed_recently = False
-last_position_close_time = 0
-STOP_LOSS_PERCENT = 0.003  # 0.3%
-TAKE_PROFIT_PERCENT = 0.005  # 0.5%
+# === Хранилище данных ===
+# Свечи, индикаторы и флаги позиции — отдельно для каждого символа
+CANDLE_CAPACITY = 1000
+# У шарда supervisor.py свечи пишутся в кольца разделяемой памяти, созданные супервизором
+CANDLE_SHM = os.getenv("CANDLE_SHM")
+symbol_states = build_symbol_states(
+    SYMBOLS, INTERVALS, capacity=CANDLE_CAPACITY, features=strategy_registry.requirements(),
+    make_buffer=(lambda symbol, interval, capacity: SharedCandleBuffer.attach(
+        segment_name(CANDLE_SHM, symbol, interval), capacity)) if CANDLE_SHM else None
+)
+EXCHANGE_INTERVALS = [i for i in INTERVALS if i in INTERVAL_MS]
+BAR_SPECS = [i for i in INTERVALS if i not in INTERVAL_MS]
+for spec in BAR_SPECS:
+    parse_bar_spec(spec)  # ошибка в INTERVALS видна сразу при старте
+order_cache = OrderStateCache()  # наши ордера и позиции по данным user data stream
+kline_store = KlineStore()  # свечи на диске: data/klines/{SYMBOL}/{interval}/{день}.npy
+chart_renderer = ChartRenderer()  # /gridchart рисуется в отдельном процессе, PNG кэшируется
+snapshots = SnapshotStore(keep=CANDLE_CAPACITY, state_name=os.getenv("SNAPSHOT_STATE", "state.pkl"))  # журнал свечей и снимок позиций для тёплого рестарта
+journal = TradeJournal()  # сигналы, ордера и исполнения: data/journal/trades.bin, статистика для /stats
 
 # === Функция загрузки исторических данных (Testnet Futures) ===
+# История читается из локального хранилища, с биржи догружается только недостающий хвост
 def load_historical_data(symbol="BTCUSDT", interval="1m", hours=24):
+    from binance.exceptions import BinanceAPIException
+
     print(f"⏳ Загрузка исторических данных за {hours} часов...")
-    end_time = pd.Timestamp.now(tz='UTC')
-    start_time = end_time - pd.Timedelta(hours=hours)
-    start_ts = int(start_time.timestamp() * 1000)
-    end_ts = int(end_time.timestamp() * 1000)
+    start_ts = int((trader.clock.time() - hours * 3600) * 1000)
     try:
-        klines = client.get_klines(symbol=symbol, interval=interval, startTime=start_ts, endTime=end_ts)
-        if not klines:
-            print("❌ Нет исторических данных за этот период.")
-            return pd.DataFrame(columns=['Open', 'High', 'Low', 'Close', 'Volume'])
-
-        df = pd.DataFrame(klines, columns=[
-            'timestamp', 'Open', 'High', 'Low', 'Close', 'Volume',
-            'close_time', 'quote_asset_volume', 'number_of_trades',
-            'taker_buy_base_volume', 'taker_buy_quote_volume', 'ignore'
-        ])
-
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        df.set_index('timestamp', inplace=True)
-        df[['Open', 'High', 'Low', 'Close', 'Volume']] = df[
-            ['Open', 'High', 'Low', 'Close', 'Volume']
-        ].astype(float)
-        df = df[['Open', 'High', 'Low', 'Close', 'Volume']]
-        print(f"✅ Загружено {len(df)} исторических свечей")
-        return df
-
+        kline_store.sync(market_client(), symbol, interval, start_ts)
     except BinanceAPIException as e:
         print("❌ Ошибка при загрузке исторических данных:", e)
-        send_telegram_message(f"❌ [HIST] Не удалось загрузить историю: {e}")
-        return pd.DataFrame(columns=['Open', 'High', 'Low', 'Close', 'Volume'])
-
+        trader.notify(f"❌ [HIST] Не удалось загрузить историю: {e}")
 
-# === Функция размещения ордера с TP и SL ===
-def place_order(symbol, side, quantity):
-    global active_position, entry_price, oco_set, position_closed_recently, last_position_close_time
+    df = kline_store.load(symbol, interval, start_ms=start_ts)
+    if df.empty:
+        print("❌ Нет исторических данных за этот период.")
+        return df
+    print(f"✅ Загружено {len(df)} исторических свечей")
+    return df
+
+
+# === Тёплый перезапуск из снимка ===
+def capture_state():
+    return {
+        'symbols': {symbol: state.capture() for symbol, state in symbol_states.items()},
+        'orders': dict(order_cache.orders),
+        'positions': dict(order_cache.positions),
+        'entry_prices': dict(order_cache.entry_prices),
+    }
+
+
+# Возвращает {(symbol, interval): время последней восстановленной свечи}
+def restore_snapshot():
+    snapshot = snapshots.load_state()
+    saved = snapshot['state'] if snapshot else {}
+    restored = {}
+    for state in symbol_states.values():
+        saved_symbol = saved.get('symbols', {}).get(state.symbol, {})
+        for interval in state.intervals:
+            records = snapshots.load_candles(state.symbol, interval, limit=CANDLE_CAPACITY)
+            if not len(records):
+                continue
+            indicators_time, indicators = saved_symbol.get('indicators', {}).get(interval, (None, None))
+            exact = state.restore(interval, records, indicators, indicators_time)
+            restored[(state.symbol, interval)] = state.candles[interval].last_time
+            print(f"♻️ {state.symbol} {interval}: восстановлено {len(records)} свечей"
+                  f"{'' if exact else ', индикаторы пересчитаны'}")
+        if saved_symbol:
+            state.apply_capture(saved_symbol)
+
+    if saved:
+        # До сверки по REST это лишь последнее известное состояние: synced остаётся False
+        order_cache.orders = saved.get('orders', {})
+        order_cache.positions = saved.get('positions', {})
+        order_cache.entry_prices = saved.get('entry_prices', {})
+        print(f"♻️ Снимок позиций от {datetime.fromtimestamp(snapshot['saved_at']):%Y-%m-%d %H:%M:%S} восстановлен")
+    return restored
+
+
+# Догрузка только свечей, пропущенных пока бот был остановлен
+def load_gap(state, interval, last_time):
+    from binance.exceptions import BinanceAPIException
+
+    start_ms = last_time + INTERVAL_MS[interval]
     try:
-        latest_price = df_stream.iloc[-1]['Close']
-        if position_closed_recently and time.time() - last_position_close_time < 60:
-            print("⏳ Ждём перед новой сделкой...")
+        kline_store.fetch(market_client(), state.symbol, interval, start_ms)
+    except BinanceAPIException as e:
+        print("❌ Ошибка при догрузке пропуска:", e)
+        return 0
+    return append_gap(state, interval, start_ms)
+
+
+def append_gap(state, interval, start_ms):
+    gap = kline_store.load(state.symbol, interval, start_ms=start_ms)
+    appended = state.append_history(interval, gap)
+    for row in appended:
+        snapshots.record_candle(state.symbol, interval, *row)
+    return len(appended)
+
+
+# Ордера, позиции и уведомления для стадии стратегий. В шарде supervisor.py подменяется
+# на RemoteDesk: те же вызовы уходят по IPC в процесс-супервизор
+class LocalDesk:
+    def __init__(self, trader):
+        self.trader = trader
+
+    async def has_active_orders(self, symbol):
+        return await self.trader.has_active_orders(symbol)
+
+    async def place_order(self, symbol, side, quantity, strategy=''):
+        return await self.trader.place_order(symbol, side, quantity, strategy=strategy)
+
+    async def monitor_active_orders(self, symbol):
+        await self.trader.monitor_active_orders(symbol)
+
+    def notify(self, message):
+        self.trader.notify(message)
+
+    def record_signal(self, symbol, strategy, side, price):
+        self.trader.journal.record_signal(int(self.trader.clock.time() * 1000), symbol, strategy, side, price)
+
+
+# === Торговое ядро: закрытая свеча → индикаторы → стратегии → ордера; события биржи → состояние ===
+# Зависимости передаются явно. Бот собирает экземпляр из настроек окружения (ниже), прогон
+# по истории и бенчмарк — свой: бумажная биржа, часы по свечам, журнал и снимки без записи на диск
+class Trader:
+    def __init__(self, gateway, symbol_states, strategy_registry, notify, order_books=None, clock=None,
+                 desk=None, order_cache=None, journal=None, snapshots=None):
+        self.gateway = gateway
+        self.order_manager = OrderManager(gateway)  # вход с TP/SL и отмены — пакетными запросами
+        self.order_books = order_books
+        self.symbol_states = symbol_states
+        self.strategy_registry = strategy_registry
+        self.notify = notify
+        self.clock = clock if clock is not None else WallClock()
+        self.desk = desk if desk is not None else LocalDesk(self)   # в шарде supervisor.py — RemoteDesk
+        self.order_cache = order_cache if order_cache is not None else OrderStateCache()
+        self.journal = journal if journal is not None else TradeJournal(root=None)
+        self.snapshots = snapshots if snapshots is not None else SnapshotStore(root=None)
+
+    def book_for(self, symbol):
+        return self.order_books.get(symbol) if self.order_books is not None else None
+
+    # Ожидаемая средняя цена рыночного входа по локальному стакану, без запросов к бирже.
+    # None — стакан не покроет объём или проскальзывание больше MAX_ENTRY_SLIPPAGE: вход пропускается.
+    # fill — готовый cost_to_fill из процесса, где живёт стакан (шард supervisor.py)
+    def expected_entry_price(self, symbol, side, quantity, last_price, fill=None):
+        if fill is None:
+            book = self.book_for(symbol)
+            if book is None:
+                return last_price
+            fill = book.cost_to_fill(side, quantity)
+        if fill['filled'] < quantity:
+            print(f"⚠️ {symbol}: в стакане не хватает ликвидности на {quantity} — вход пропущен")
             return None
-
-        # Сначала отменяем все старые ордера
-        cancel_all_orders(symbol)
-
-        if side == 'buy':
-            order = client.futures_create_order(
-                symbol=symbol,
-                side='BUY',
-                type='MARKET',
-                quantity=quantity
-            )
-            take_profit = round(latest_price * (1 + TAKE_PROFIT_PERCENT), 2)
-            stop_loss = round(latest_price * (1 - STOP_LOSS_PERCENT), 2)
-            if take_profit <= 0 or stop_loss <= 0:
-                print("⚠️ Неверные значения TP/SL — меньше или равно нулю")
-                send_telegram_message("⚠️ [ОРДЕР] TP/SL не могут быть ≤ 0")
+        if fill['slippage'] > MAX_ENTRY_SLIPPAGE:
+            print(f"⚠️ {symbol}: ожидаемое проскальзывание {fill['slippage']:.3%} > {MAX_ENTRY_SLIPPAGE:.3%} — вход пропущен")
+            return None
+        return fill['avg_price']
+
+    # === Функция размещения ордера с TP и SL ===
+    # strategy — стратегии решения: журнал приписывает им исполнения открытой позиции
+    async def place_order(self, symbol, side, quantity, fill=None, strategy=''):
+        state = self.symbol_states[symbol]
+        try:
+            latest_price = state.last_price
+            if state.position_closed_recently and self.clock.time() - state.last_position_close_time < POSITION_COOLDOWN:
+                print("⏳ Ждём перед новой сделкой...")
                 return None
 
-            # Take Profit
-            client.futures_create_order(
-                symbol=symbol,
-                side='SELL',
-                type='TAKE_PROFIT_MARKET',
-                stopPrice=round(take_profit, 2),
-                closePosition=True
-            )
-
-            # Stop Loss
-            client.futures_create_order(
-                symbol=symbol,
-                side='SELL',
-                type='STOP_MARKET',
-                stopPrice=round(stop_loss, 2),
-                closePosition=True
-            )
-
-            message = f"📈 [BUY] Куплено {quantity} {symbol}\nЦена: {latest_price:.2f}$\nTP: {take_profit:.2f}$\nSL: {stop_loss:.2f}$"
-            send_telegram_message(message)
-            active_position = 'long'
-            entry_price = latest_price
-            oco_set = True
-            position_closed_recently = False
-
-        elif side == 'sell' and active_position is None:
-            # Продажа шортовой позиции
-            order = client.futures_create_order(
-                symbol=symbol,
-                side='SELL',
-                type='MARKET',
-                quantity=quantity
-            )
-            take_profit = round(latest_price * (1 - TAKE_PROFIT_PERCENT), 2)
-            stop_loss = round(latest_price * (1 + STOP_LOSS_PERCENT), 2)
-            if take_profit <= 0 or stop_loss <= 0:
-                print("⚠️ Неверные значения TP/SL — меньше или равно нулю")
-                send_telegram_message("⚠️ [ОРДЕР] TP/SL не могут быть ≤ 0")
+            # Сначала отменяем все старые ордера
+            await self.cancel_all_orders(symbol)
+
+            if side == 'buy':
+                # TP/SL — от ожидаемой средней цены исполнения, а не от последней сделки
+                latest_price = self.expected_entry_price(symbol, 'buy', quantity, latest_price, fill)
+                if latest_price is None:
+                    return None
+                take_profit = round(latest_price * (1 + TAKE_PROFIT_PERCENT), 2)
+                stop_loss = round(latest_price * (1 - STOP_LOSS_PERCENT), 2)
+                if take_profit <= 0 or stop_loss <= 0:
+                    print("⚠️ Неверные значения TP/SL — меньше или равно нулю")
+                    self.notify("⚠️ [ОРДЕР] TP/SL не могут быть ≤ 0")
+                    return None
+
+                # Вход по рынку, Take Profit и Stop Loss — одним пакетом
+                self.journal.attribute(symbol, strategy)
+                order, brackets, latencies = await self.order_manager.place_bracket(symbol, 'BUY', quantity, take_profit, stop_loss)
+                print(f"⏱ Задержка ордеров: {format_latencies(latencies)}")
+                for placed in brackets:
+                    self.order_cache.apply_order(placed)
+
+                message = f"📈 [BUY] Куплено {quantity} {symbol}\nЦена: {latest_price:.2f}$\nTP: {take_profit:.2f}$\nSL: {stop_loss:.2f}$"
+                self.notify(message)
+                state.active_position = 'long'
+                state.entry_price = latest_price
+                state.oco_set = True
+                state.position_closed_recently = False
+
+            elif side == 'sell' and state.active_position is None:
+                # Продажа шортовой позиции
+                latest_price = self.expected_entry_price(symbol, 'sell', quantity, latest_price, fill)
+                if latest_price is None:
+                    return None
+                take_profit = round(latest_price * (1 - TAKE_PROFIT_PERCENT), 2)
+                stop_loss = round(latest_price * (1 + STOP_LOSS_PERCENT), 2)
+                if take_profit <= 0 or stop_loss <= 0:
+                    print("⚠️ Неверные значения TP/SL — меньше или равно нулю")
+                    self.notify("⚠️ [ОРДЕР] TP/SL не могут быть ≤ 0")
+                    return None
+
+                self.journal.attribute(symbol, strategy)
+                order, brackets, latencies = await self.order_manager.place_bracket(symbol, 'SELL', quantity, take_profit, stop_loss)
+                print(f"⏱ Задержка ордеров: {format_latencies(latencies)}")
+                for placed in brackets:
+                    self.order_cache.apply_order(placed)
+
+                message = f"📉 [SHORT] Продано {quantity} {symbol}\nЦена: {latest_price:.2f}$\nTP: {take_profit:.2f}$\nSL: {stop_loss:.2f}$"
+                self.notify(message)
+                state.active_position = 'short'
+                state.entry_price = latest_price
+                state.oco_set = True
+                state.position_closed_recently = False
+
+            elif side == 'sell' and state.active_position == 'long':
+                # Простая продажа без OCO
+                order = await self.gateway.create_order(
+                    symbol=symbol,
+                    side='SELL',
+                    type='MARKET',
+                    quantity=quantity
+                )
+                message = f"📉 Продано {quantity} {symbol} по {latest_price:.2f}"
+                self.notify(message)
+                state.active_position = None
+                state.entry_price = 0.0
+                state.oco_set = False
+                state.position_closed_recently = True
+                state.last_position_close_time = self.clock.time()
+
+                # Отменяем оставшиеся ордера
+                await self.cancel_all_orders(symbol)
+
+            elif side == 'buy' and state.active_position == 'short':
+                # Закрытие шортовой позиции
+                order = await self.gateway.create_order(
+                    symbol=symbol,
+                    side='BUY',
+                    type='MARKET',
+                    quantity=quantity
+                )
+                message = f"📈 [COVER] Куплено {quantity} {symbol} для закрытия шорта\nЦена: {latest_price:.2f}"
+                self.notify(message)
+                state.active_position = None
+                state.entry_price = 0.0
+                state.oco_set = False
+                state.position_closed_recently = True
+                state.last_position_close_time = self.clock.time()
+
+                # Отменяем оставшиеся ордера
+                await self.cancel_all_orders(symbol)
+
+            else:
+                print("❌ Неизвестная сторона ордера или состояние")
                 return None
 
-            # Take Profit
-            client.futures_create_order(
-                symbol=symbol,
-                side='BUY',
-                type='TAKE_PROFIT_MARKET',
-                stopPrice=round(take_profit, 2),
-                closePosition=True
-            )
-
-            # Stop Loss
-            client.futures_create_order(
-                symbol=symbol,
-                side='BUY',
-                type='STOP_MARKET',
-                stopPrice=round(stop_loss, 2),
-                closePosition=True
-            )
+            return order
+
+        except BracketError as e:
+            print("❌ Ошибка пакета ордеров:", e)
+            self.notify(f"❌ [ОРДЕР] {e}")
+            state.oco_set = False
+        except ExchangeAPIError as e:
+            print("❌ Ошибка Binance:", e)
+            self.notify(f"❌ [ОРДЕР] Ошибка: {e}")
+            state.oco_set = False
+        except REQUEST_ERRORS as e:
+            print("❌ Сетевая ошибка при размещении ордера:", e)
+            self.notify(f"❌ [ОРДЕР] Сетевая ошибка: {e}")
+            state.oco_set = False
+        return None
 
-            message = f"📉 [SHORT] Продано {quantity} {symbol}\nЦена: {latest_price:.2f}$\nTP: {take_profit:.2f}$\nSL: {stop_loss:.2f}$"
-            send_telegram_message(message)
-            active_position = 'short'
-            entry_price = latest_price
-            oco_set = True
-            position_closed_recently = False
-
-        elif side == 'sell' and active_position == 'long':
-            # Простая продажа без OCO
-            order = client.futures_create_order(
-                symbol=symbol,
-                side='SELL',
-                type='MARKET',
-                quantity=quantity
+    # === Отмена всех ордеров типа SL/TP ===
+    async def cancel_all_orders(self, symbol="BTCUSDT"):
+        try:
+            # Список берём из локального кэша, без запроса истории ордеров
+            stop_orders = self.order_cache.open_orders(symbol, types=PROTECTIVE_TYPES)
+            if stop_orders:
+                print(f"🛑 Отменяем {len(stop_orders)} ордеров")
+                # Если у символа открыты только наши TP/SL и кэш сверен — хватит одного cancel-all
+                only_protective = self.order_cache.synced and len(stop_orders) == len(self.order_cache.open_orders(symbol))
+                canceled, failed = await self.order_manager.cancel_orders(symbol, stop_orders, cancel_all=only_protective)
+                for order in canceled:
+                    self.order_cache.apply_order(order)
+                self.notify(f"❌ [ORDERS] {len(canceled)} ордеров отменено")
+                if failed:
+                    print(f"⚠️ Не отменено {len(failed)} ордеров:", [result.get('msg') for _, result in failed])
+                    self.notify(f"⚠️ [ORDERS] Не удалось отменить {len(failed)} ордеров")
+            else:
+                print("✅ Нет активных ордеров SL/TP")
+        except REQUEST_ERRORS as e:
+            print("❌ Ошибка при отмене ордеров:", e)
+            self.notify(f"❌ [ORDERS] Не удалось отменить ордера: {e}")
+
+    # === Проверка наличия активных ордеров ===
+    async def has_active_orders(self, symbol="BTCUSDT"):
+        # REST нужен только пока кэш не сверен (старт или обрыв user data stream)
+        if not self.order_cache.synced:
+            await self.reconcile_order_state()
+        return self.order_cache.has_active_orders(symbol)
+
+    # === Сверка локального состояния ордеров с биржей (REST, сразу по всем символам) ===
+    async def reconcile_order_state(self):
+        try:
+            orders, positions = await asyncio.gather(
+                self.gateway.get_open_orders(),
+                self.gateway.position_information()
             )
-            message = f"📉 Продано {quantity} {symbol} по {latest_price:.2f}"
-            send_telegram_message(message)
-            active_position = None
-            entry_price = 0.0
-            oco_set = False
-            position_closed_recently = True
-            last_position_close_time = time.time()
-
-            # Отменяем оставшиеся ордера
-            cancel_all_orders(symbol)
-
-        elif side == 'buy' and active_position == 'short':
-            # Закрытие шортовой позиции
-            order = client.futures_create_order(
-                symbol=symbol,
-                side='BUY',
-                type='MARKET',
-                quantity=quantity
-            )
-            message = f"📈 [COVER] Куплено {quantity} {symbol} для закрытия шорта\nЦена: {latest_price:.2f}"
-            send_telegram_message(message)
-            active_position = None
-            entry_price = 0.0
-            oco_set = False
-            position_closed_recently = True
-            last_position_close_time = time.time()
-
-            # Отменяем оставшиеся ордера
-            cancel_all_orders(symbol)
-
-        else:
-            print("❌ Неизвестная сторона ордера или состояние")
-            return None
+            self.order_cache.reconcile(orders, positions)
+            for symbol in self.symbol_states:
+                self.sync_position_state(symbol)
+        except REQUEST_ERRORS as e:
+            print("❌ Ошибка сверки ордеров:", e)
+
+    # === Флаги позиции следуют за состоянием биржи ===
+    def sync_position_state(self, symbol):
+        state = self.symbol_states[symbol]
+        side = self.order_cache.position_side(symbol)
+        if state.active_position is not None and side is None:
+            print(f"🏁 Позиция {symbol} закрыта на бирже")
+            state.position_closed_recently = True
+            state.last_position_close_time = self.clock.time()
+        state.active_position = side
+        state.entry_price = self.order_cache.entry_price(symbol)
+        state.oco_set = self.order_cache.has_active_orders(symbol)
+
+    # === События user data stream (ORDER_TRADE_UPDATE / ACCOUNT_UPDATE) ===
+    async def process_user_event(self, msg):
+        if msg.get('e') == 'ORDER_TRADE_UPDATE':
+            self.journal.record_order_event(msg)
+        for symbol in self.order_cache.apply_event(msg):
+            if symbol in self.symbol_states:
+                self.sync_position_state(symbol)
+        if msg.get('e') == 'ORDER_TRADE_UPDATE' and msg['o'].get('X') == 'FILLED' and msg['o'].get('o') in PROTECTIVE_TYPES:
+            await self.cancel_bracket_siblings(msg['o']['s'])
+
+    # === Сработал TP или SL: вторая нога защиты отменяется, иначе она блокирует новые входы ===
+    async def cancel_bracket_siblings(self, symbol):
+        remaining = self.order_cache.open_orders(symbol, types=PROTECTIVE_TYPES)
+        if not remaining:
+            return
+        try:
+            canceled, failed = await self.order_manager.cancel_siblings(symbol, remaining)
+        except REQUEST_ERRORS as e:
+            print(f"❌ Не удалось отменить оставшуюся защиту {symbol}:", e)
+            self.notify(f"⚠️ [ORDERS] {symbol}: оставшийся TP/SL не отменён: {e}")
+            return
+        for order in canceled:
+            self.order_cache.apply_order(order)
+        if failed:
+            self.notify(f"⚠️ [ORDERS] {symbol}: не удалось отменить {len(failed)} ордеров защиты")
+        if symbol in self.symbol_states:
+            self.sync_position_state(symbol)
+
+    def on_user_stream_disconnect(self):
+        # Без потока событий кэш может устареть — до сверки проверяем по REST
+        self.order_cache.synced = False
+
+    # === Стадия агрегатора: закрытая свеча → буфер и индикаторы ===
+    # Вызывается конвейером строго по порядку, без await — только быстрые вычисления.
+    def ingest_kline(self, kline):
+        symbol = kline.symbol
+        interval = kline.interval
+        state = self.symbol_states.get(symbol)
+        if state is None or interval not in state.candles:
+            return False
+        candles = state.candles[interval]
+
+        close_price = kline.close
+        # Добавляем новую свечу (дубликаты и свечи не по порядку отбрасываются)
+        status = candles.append(kline.open_time, kline.open, kline.high, kline.low, close_price, kline.volume)
+        if status == DUPLICATE:
+            print(f"🔁 {symbol} {interval}: эта свеча уже есть — пропускаем")
+            return False
+        if status == OUT_OF_ORDER:
+            print(f"⏪ {symbol} {interval}: свеча старше последней в истории — пропускаем")
+            return False
+
+        print(f"🕯️ {symbol} {interval} | Закрыта по {close_price:.2f} | Свечей: {len(candles)}")
+
+        # Индикаторы обновляются инкрементально
+        state.indicators[interval].update(close_price)
+        state.last_price = close_price
+        self.snapshots.record_candle(symbol, interval, kline.open_time, kline.open, kline.high, kline.low, close_price, kline.volume)
+        return True
+
+    # === Стадия стратегий: решения по закрытой свече ===
+    async def evaluate_strategies(self, symbol, interval):
+        state = self.symbol_states[symbol]
+        candles = state.candles[interval]
+        indicators = state.indicators[interval]
 
-        return order
+        # Если есть активные ордера → запрещаем новые сделки
+        if await self.desk.has_active_orders(symbol):
+            print(f"🚫 {symbol}: нельзя открывать новую позицию — есть активные ордера")
+            return
 
-    except BinanceAPIException as e:
-        print("❌ Ошибка Binance:", e)
-        send_telegram_message(f"❌ [ОРДЕР] Ошибка: {e}")
-        oco_set = False
-    return None
+        # Стратегии выдают намерения, арбитраж сводит их в одно решение
+        decision = self.strategy_registry.decide(StrategyContext(symbol, interval, candles, indicators, self.book_for(symbol)))
+        if decision is not None:
+            for intent in decision.intents:
+                self.desk.record_signal(symbol, intent.strategy, intent.side, state.last_price)
+            if decision.side is None:
+                print(f"⚖️ {symbol}: сигналы стратегий погасили друг друга "
+                      f"({', '.join(f'{i.strategy} {i.side}' for i in decision.intents)})")
+            else:
+                for intent in decision.intents:
+                    self.desk.notify(intent.message)
+                strategy = "+".join(sorted({intent.strategy for intent in decision.intents}))
+                await self.desk.place_order(symbol, decision.side, decision.quantity, strategy)
 
+        # Периодическая проверка ордеров
+        if candles.count % 5 == 0:
+            await self.desk.monitor_active_orders(symbol)
 
-# === Отмена всех ордеров типа SL/TP ===
-def cancel_all_orders(symbol="BTCUSDT"):
-    try:
-        open_orders = client.futures_get_all_orders(symbol=symbol, limit=50)
-        stop_orders = [
-            o for o in open_orders
-            if o['status'] == 'NEW' and o['type'] in ['TAKE_PROFIT_MARKET', 'STOP_MARKET']
-        ]
-        if stop_orders:
-            print(f"🛑 Отменяем {len(stop_orders)} ордеров")
-            for order in stop_orders:
-                client.futures_cancel_order(symbol=symbol, orderId=order['orderId'])
-            send_telegram_message(f"❌ [ORDERS] {len(stop_orders)} ордеров отменено")
+    # === Мониторинг активных ордеров ===
+    async def monitor_active_orders(self, symbol="BTCUSDT"):
+        state = self.symbol_states[symbol]
+        open_orders = self.order_cache.open_orders(symbol)
+        if open_orders:
+            print(f"📊 Найдено {len(open_orders)} активных ордеров")
+            for order in open_orders:
+                print(f"🧾 ID: {order['orderId']} | Цена: {order['price']} | Стоп: {order['stopPrice']}")
+            state.oco_set = True
         else:
-            print("✅ Нет активных ордеров SL/TP")
-    except BinanceAPIException as e:
-        print("❌ Ошибка при отмене ордеров:", e)
-        send_telegram_message(f"❌ [ORDERS] Не удалось отменить ордера: {e}")
-
+            print("✅ Нет активных ордеров")
+            state.oco_set = False
 
-# === Проверка наличия активных ордеров ===
-def has_active_orders(symbol="BTCUSDT"):
-    try:
-        orders = client.futures_get_all_orders(symbol=symbol, limit=50)
-        active = [o for o in orders if o['status'] == 'NEW' and o['type'] in ['TAKE_PROFIT_MARKET', 'STOP_MARKET']]
-        return len(active) > 0
-    except BinanceAPIException as e:
-        print("❌ Ошибка проверки ордеров:", e)
-        return False
 
+# Экземпляр бота из настроек окружения: стакан, кэш ордеров, журнал и снимки — общие с командами Telegram
+trader = Trader(gateway, symbol_states, strategy_registry, send_telegram_message, order_books=order_books,
+                order_cache=order_cache, journal=journal, snapshots=snapshots)
 
-# === Обработка сообщений из WebSocket ===
-async def process_message(msg):
-    global df_stream, active_position, entry_price, oco_set
-    try:
-        if isinstance(msg, str):
-            try:
-                msg = json.loads(msg)
-            except json.JSONDecodeError:
-                return
 
-        # Сервисное сообщение
-        if 'result' in msg and msg['result'] is None:
-            print("📡 Сервисное сообщение (subscribed)")
-            return
+# Конвейер WebSocket → агрегатор → стратегии; незакрытые свечи склеиваются, закрытые не теряются
+pipeline = KlinePipeline(
+    trader.ingest_kline, trader.evaluate_strategies,
+    decoder=KlineDecoder(closed_only=os.getenv("CLOSED_CANDLES_ONLY", "1") == "1"),
+    bars=TradeBarAggregator(SYMBOLS, BAR_SPECS) if BAR_SPECS else None,
+    workers=int(os.getenv("STRATEGY_WORKERS", "2")),
+    tick_policy=os.getenv("TICK_QUEUE_POLICY", "coalesce"),
+    job_policy=os.getenv("JOB_QUEUE_POLICY", "coalesce"),
+    on_kline=paper_exchange.on_kline if paper_exchange else None,
+    on_depth=order_books.on_depth if order_books else None
+)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # 0 — не поднимать /metrics
 
-        # Проверяем тип события
-        if not (isinstance(msg, dict) and msg.get('e') == 'kline'):
-            print("📡 Пропущено несвечное сообщение")
-            return
 
-        kline = msg.get('k', {})
-        timestamp = int(kline.get('t'))
-        open_price = float(kline.get('o'))
-        high = float(kline.get('h'))
-        low = float(kline.get('l'))
-        close_price = float(kline.get('c'))
-        volume = float(kline.get('v'))
-        is_closed = kline.get('x')
+def pipeline_gauges():
+    queues = pipeline.metrics()['queues']
+    return [
+        ('bot_queue_depth', "Текущая глубина очереди конвейера",
+         {(('queue', name),): q['depth'] for name, q in queues.items()}),
+        ('bot_queue_high_watermark', "Максимальная глубина очереди конвейера",
+         {(('queue', name),): q['high_watermark'] for name, q in queues.items()}),
+        ('bot_queue_dropped', "Отброшено элементов очереди",
+         {(('queue', name),): q['dropped'] for name, q in queues.items()}),
+        ('bot_queue_coalesced', "Склеено элементов очереди",
+         {(('queue', name),): q['coalesced'] for name, q in queues.items()}),
+    ]
 
-        print(f"🕯️ Свеча: {SYMBOL} | Закрыта: {is_closed} | Цена: {close_price:.2f}")
 
-        # Только если свеча закрыта
-        if not is_closed:
-            return
+REGISTRY.register_collector(pipeline_gauges)
 
-        # Проверяем дубликаты
-        candle_time = pd.to_datetime(timestamp, unit='ms')
-        if candle_time in df_stream.index:
-            print("🔁 Эта свеча уже есть — пропускаем")
-            return
 
-        # Добавляем новую свечу
-        df_new = pd.DataFrame([{
-            'Open': open_price,
-            'High': high,
-            'Low': low,
-            'Close': close_price,
-            'Volume': volume
-        }], index=[candle_time])
-        df_combined = pd.concat([df_stream, df_new]).drop_duplicates()
-        df_combined.sort_index(inplace=True)
-        df_stream = df_combined.tail(1000).copy()
+def rate_limit_gauges():
+    limits = gateway.governor.metrics()
+    return [
+        ('bot_rate_limit_used', "Израсходовано лимита Binance REST",
+         {(('bucket', name),): b['used'] for name, b in limits['buckets'].items()}),
+        ('bot_rate_limit_waits', "Запросов, ждавших лимита",
+         {(('priority', name),): count for name, count in limits['waits'].items()}),
+        ('bot_rate_limit_bans', "Ответов 429/418 от Binance", {(): limits['bans']}),
+        ('bot_rest_coalesced', "GET-запросов, склеенных с уже летящим", {(): gateway.coalesced}),
+    ]
 
-        print(f"📊 Текущее количество свечей: {len(df_stream)}")
 
-        # Если есть активные ордера → запрещаем новые сделки
-        if has_active_orders(SYMBOL):
-            print("🚫 Нельзя открывать новую позицию: есть активные ордера")
-            return
+REGISTRY.register_collector(rate_limit_gauges)
 
-        # Вызываем стратегии
-        if len(df_stream) >= 26:
-            await execute_strategy(df_stream, send_telegram_message, place_order, SYMBOL)
-        if len(df_stream) >= 50:
-            await execute_grid_strategy(df_stream, send_telegram_message, place_order, SYMBOL)
 
-        # Периодическая проверка ордеров
-        if len(df_stream) % 5 == 0:
-            monitor_active_orders(SYMBOL)
-    except Exception as e:
-        print(f"❌ Ошибка обработки сообщения: {e}")
+def order_book_gauges():
+    if order_books is None:
+        return []
+    books = order_books.metrics()
+    return [
+        ('bot_order_book_levels', "Уровней в локальном стакане",
+         {(('symbol', symbol), ('side', side)): b[side] for symbol, b in books.items() for side in ('bids', 'asks')}),
+        ('bot_order_book_synced', "Стакан синхронизирован с потоком",
+         {(('symbol', symbol),): int(b['loaded']) for symbol, b in books.items()}),
+        ('bot_order_book_gaps', "Пропусков в потоке @depth", {(): order_books.gaps}),
+        ('bot_order_book_snapshots', "Загружено снимков стакана", {(): order_books.snapshots}),
+    ]
 
 
-# === Мониторинг активных ордеров ===
-def monitor_active_orders(symbol="BTCUSDT"):
-    global oco_set
-    try:
-        open_orders = client.futures_get_all_orders(symbol=symbol, limit=50)
-        open_orders = [o for o in open_orders if o['status'] == 'NEW']
-        if open_orders:
-            print(f"📊 Найдено {len(open_orders)} активных ордеров")
-            for order in open_orders:
-                print(f"🧾 ID: {order['orderId']} | Цена: {order['price']}")
-            oco_set = True
-        else:
-            print("✅ Нет активных ордеров")
-            oco_set = False
-    except BinanceAPIException as e:
-        print(f"❌ Ошибка проверки ордеров: {e}")
-        oco_set = False
+REGISTRY.register_collector(order_book_gauges)
+REGISTRY.register_collector(lambda: journal.metrics())
 
 
 # === Команды Telegram ===
+# Символ можно передать аргументом: /positions ETHUSDT
+def command_symbol(context):
+    if context.args:
+        return context.args[0].upper()
+    return SYMBOL
+
+
 async def get_positions(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    symbol = command_symbol(context)
+    # Сверенный кэш user data stream отвечает без запроса к бирже
+    if order_cache.synced:
+        amount = order_cache.positions.get(symbol)
+        if amount:
+            await update.message.reply_text(
+                f"📊 Позиция: {symbol} | Размер: {amount} | Цена входа: {order_cache.entry_price(symbol)}"
+            )
+        else:
+            await update.message.reply_text(f"✅ Нет открытой позиции по {symbol}")
+        return
     try:
-        positions = client.futures_position_information(symbol=SYMBOL)
+        positions = await gateway.position_information(symbol=symbol, priority=LOW)
         for pos in positions:
             if float(pos['positionAmt']) != 0:
                 await update.message.reply_text(
                     f"📊 Позиция: {pos['positionSide']} | Размер: {pos['positionAmt']} | Цена входа: {pos['entryPrice']}"
                 )
-    except BinanceAPIException as e:
+    except REQUEST_ERRORS as e:
         await update.message.reply_text(f"❌ Ошибка получения позиций: {e}")
 
 
 async def get_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        orders = client.futures_get_all_orders(symbol=SYMBOL, limit=50)
+        orders = await gateway.get_all_orders(symbol=command_symbol(context), limit=50)
         if orders:
-            for order in orders:
-                await update.message.reply_text(
-                    f"🧾 ID: {order['orderId']} | Сторона: {order['side']} | Цена: {order['price']} | Статус: {order['status']}"
-                )
+            # Одним сообщением: по сообщению на ордер упирается в лимиты Telegram
+            await update.message.reply_text("\n".join(
+                f"🧾 ID: {order['orderId']} | Сторона: {order['side']} | Цена: {order['price']} | Статус: {order['status']}"
+                for order in orders
+            ))
         else:
             await update.message.reply_text("✅ Нет активных ордеров")
-    except BinanceAPIException as e:
+    except REQUEST_ERRORS as e:
         await update.message.reply_text(f"❌ Ошибка получения ордеров: {e}")
 
 
 async def check_balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        balance = client.futures_account_balance()
+        balance = await gateway.account_balance(priority=LOW)
         for item in balance:
             if item['asset'] == 'USDT':
                 await update.message.reply_text(f"💼 Баланс USDT: {item['balance']} USDT")
-    except BinanceAPIException as e:
+    except REQUEST_ERRORS as e:
         await update.message.reply_text(f"❌ Ошибка получения баланса: {e}")
 
 
-def generate_grid_chart(df, grid_levels=None):
-    if len(df) < 50 or not grid_levels:
-        return None
-
-    df = df.tail(50).copy()
-    buffer = BytesIO()
-
-    mpf.plot(
-        df,
-        type='candle',
-        style='yahoo',
-        title=f"{SYMBOL} - Последние 50 свечей",
-        hlines=dict(hlines=grid_levels, colors='gray', linestyle='--'),
-        volume=False,
-        savefig=dict(fname=buffer, dpi=100, bbox_inches='tight'),
-        figratio=(10, 6),
-        figscale=1.5
-    )
-    buffer.seek(0)
-    return buffer
+# Статистика из агрегатов журнала сделок — без запросов к бирже и чтения файла
+async def get_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    stats = journal.stats
+    total = stats.total
+    lines = [
+        f"📒 Записей в журнале: {stats.records} | сигналов {total.signals} | ордеров {total.orders} | исполнений {total.fills}",
+        f"💰 Сделок: {total.trades} | Win rate: {total.win_rate:.1%} | PnL: {total.net:+.2f}$ "
+        f"(комиссии {total.fees:.2f}$) | Ср. удержание: {total.avg_hold_seconds / 60:.1f} мин",
+    ]
+    for name, s in sorted(stats.strategies.items()):
+        lines.append(f"   {name or '—'}: сделок {s.trades} | win rate {s.win_rate:.1%} | PnL {s.net:+.2f}$ | "
+                     f"удержание {s.avg_hold_seconds / 60:.1f} мин | сигналов {s.signals}")
+    if stats.other_fees:
+        lines.append("🪙 Комиссии не в котируемой валюте (не входят в PnL): "
+                     + ", ".join(f"{amount:.6f} {asset}" for asset, amount in stats.other_fees.items()))
+    now_ms = int(trader.clock.time() * 1000)
+    for symbol, trade in stats.open.items():
+        lines.append(f"📂 {symbol}: {'long' if trade.quantity > 0 else 'short'} {abs(trade.quantity)} "
+                     f"от {trade.entry_price:.2f}$ ({trade.strategy or '—'}, {(now_ms - trade.opened_ms) / 60000:.1f} мин)")
+    await update.message.reply_text("\n".join(lines))
+
+
+async def get_queues(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    metrics = pipeline.metrics()
+    lines = [
+        f"📥 {name}: {q['depth']}/{q['maxsize']} (макс. {q['high_watermark']}) | "
+        f"отброшено {q['dropped']} | склеено {q['coalesced']}"
+        for name, q in metrics['queues'].items()
+    ]
+    lines.append(f"⚠️ Ошибок разбора: {metrics['parse_errors']} | Пропущено: {metrics['skipped']} | "
+                 f"незакрытых тиков: {metrics['skipped_ticks']}")
+    limits = gateway.governor.metrics()
+    lines.append("🚦 Лимиты REST: " + " | ".join(
+        f"{name} {b['used']:.0f}/{b['limit']}" for name, b in limits['buckets'].items()
+    ))
+    lines.append(f"⏳ Ожидали лимита: {limits['waits']} | склеено GET: {gateway.coalesced} | банов: {limits['bans']}"
+                 + (f" | пауза ещё {limits['banned_for']:.0f} с" if limits['banned_for'] else ""))
+    if order_books is not None:
+        for symbol, book in order_books.books.items():
+            lines.append(f"📚 {symbol}: " + (f"bid {book.best_bid} / ask {book.best_ask} | спред {book.spread:.2f}"
+                                              if book.loaded and book.spread is not None else "стакан синхронизируется"))
+        lines.append(f"📚 Пропусков @depth: {order_books.gaps} | снимков: {order_books.snapshots}")
+    await update.message.reply_text("\n".join(lines))
 
 
 async def send_grid_chart(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    grid_levels = await execute_grid_strategy(df_stream, None, None, SYMBOL, dry_run=True)
-    chart_buffer = generate_grid_chart(df_stream, list(map(float, grid_levels)))
-    if chart_buffer:
-        await context.bot.send_photo(chat_id=update.effective_chat.id, photo=chart_buffer)
+    state = symbol_states.get(command_symbol(context))
+    if state is None or len(state.candles[INTERVAL]) < max(CHART_CANDLES, PARAMS['grid_size']):
+        await update.message.reply_text("❌ Не удалось сгенерировать график")
+        return
+    candles = state.candles[INTERVAL].copy()  # согласованная копия: в буфер может писать шард
+    indicators = state.indicators[INTERVAL]
+    # У супервизора индикаторы не считаются (latest пуст) — среднее берётся по свечам
+    avg_price = indicators.latest['sma'] if indicators.latest and indicators.sma_window == PARAMS['grid_size'] else None
+    grid_levels = calculate_grid_levels(candles, avg_price=avg_price, book=trader.book_for(state.symbol))['levels']
+    try:
+        chart = await chart_renderer.grid_chart(state.symbol, INTERVAL, candles, grid_levels)
+    except Exception as e:
+        print(f"❌ Ошибка построения графика: {e}")
+        chart = None
+    if chart:
+        await context.bot.send_photo(chat_id=update.effective_chat.id, photo=chart)
     else:
         await update.message.reply_text("❌ Не удалось сгенерировать график")
 
 
+# === Догрузка свечей после полного обрыва WebSocket ===
+# Страницы идут через асинхронный шлюз с приоритетом LOW — их вес учитывает общий ограничитель
+# запросов; свечи добавляются в event loop до того, как кадры восстановленного соединения
+# дойдут до стратегий. По пропущенным свечам сделок нет.
+async def backfill_outage(down_since_ms):
+    now = int(trader.clock.time() * 1000)
+    for state in symbol_states.values():
+        for interval in EXCHANGE_INTERVALS:
+            last_time = state.candles[interval].last_time
+            if last_time is None:
+                continue
+            start_ms = last_time + INTERVAL_MS[interval]
+            if start_ms + INTERVAL_MS[interval] > now:
+                continue  # ни одна свеча не закрылась за время обрыва
+            try:
+                await kline_store.fetch_async(gateway, state.symbol, interval, start_ms)
+            except REQUEST_ERRORS as e:
+                print(f"❌ Ошибка догрузки {state.symbol} {interval} после обрыва: {e}")
+                continue
+            appended = append_gap(state, interval, start_ms)
+            if appended:
+                print(f"🩹 {state.symbol} {interval}: догружено {appended} свечей за обрыв")
+
+
 # === Асинхронный запуск WebSocket ===
-async def run_websocket():
-    ws_manager = BinanceFuturesWebSocketManager(SYMBOL, INTERVAL, process_message)
-    await ws_manager.start()
+# ready — событие готовности истории: соединение открывается сразу, кадры копятся в очереди
+# конвейера и идут в стратегии только после загрузки свечей
+async def run_websocket(ready=None, on_connect=None):
+    # Догрузка после обрыва не должна пересечься с загрузкой истории при старте
+    async def resume(down_since_ms):
+        if ready is not None:
+            await ready.wait()
+        await backfill_outage(down_since_ms)
+
+    ws_manager = BinanceFuturesWebSocketManager(
+        SYMBOLS, EXCHANGE_INTERVALS, pipeline.feed, raw=True,
+        trade_symbols=SYMBOLS if BAR_SPECS else (),
+        depth_symbols=SYMBOLS if ORDER_BOOK else (),
+        # WS_CONNECTIONS=2 — горячий резерв: событие берётся с соединения, доставившего его первым
+        connections=int(os.getenv("WS_CONNECTIONS", "1")),
+        on_resume=resume,
+        on_connect=on_connect
+    )
+
+    async def consume():
+        if ready is not None:
+            await ready.wait()
+        await pipeline.run()
+
+    await asyncio.gather(consume(), ws_manager.start())
+
+
+# === Асинхронный запуск user data stream ===
+async def run_user_data_stream():
+    callbacks = dict(on_connect=trader.reconcile_order_state, on_disconnect=trader.on_user_stream_disconnect)
+    if paper_exchange is not None:
+        user_stream = PaperUserStream(paper_exchange, trader.process_user_event, **callbacks)
+    else:
+        user_stream = BinanceUserDataStream(gateway, trader.process_user_event, **callbacks)
+    await user_stream.start()
 
 
 # === Асинхронный запуск Telegram бота ===
-async def run_telegram_bot():
+async def run_telegram_bot(commands=None, on_ready=None):
+    telegram_ext = await asyncio.to_thread(importlib.import_module, 'telegram.ext')
+    Application, CommandHandler = telegram_ext.Application, telegram_ext.CommandHandler
     app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    for name, handler in (commands or {}).items():
+        app.add_handler(CommandHandler(name, handler))
     app.add_handler(CommandHandler("positions", get_positions))
     app.add_handler(CommandHandler("orders", get_orders))
     app.add_handler(CommandHandler("gridchart", send_grid_chart))
     app.add_handler(CommandHandler("balance", check_balance))
-    print("📡 Telegram бот запущен")
-    await app.run_polling()
+    app.add_handler(CommandHandler("queues", get_queues))
+    app.add_handler(CommandHandler("stats", get_stats))
+    # Опрос в уже работающем event loop: run_polling() запускает собственный цикл
+    async with app:
+        await app.start()
+        await app.updater.start_polling()
+        print("📡 Telegram бот запущен")
+        if on_ready:
+            on_ready()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await app.updater.stop()
+            await app.stop()
+
+
+# === Подготовка свечей и индикаторов к запуску WebSocket ===
+# Восстановление из снимка: с биржи догружается только пропуск, без снимка — история за сутки.
+# Символы и интервалы грузятся параллельно: REST синхронного клиента — в потоках
+def prepare_interval(state, interval, last_time, now_ms):
+    if last_time is not None and now_ms - last_time < 24 * 3600 * 1000:
+        count = load_gap(state, interval, last_time)
+        print(f"📊 {state.symbol} {interval}: догружено {count} пропущенных свечей | "
+              f"Текущее количество свечей: {len(state.candles[interval])}")
+        return
+    if last_time is not None:
+        state.reset(interval)   # снимок старше суток: история за 24 ч заменяет его, а не дописывается
+    historical_df = load_historical_data(state.symbol, interval, hours=24)
+    if not historical_df.empty:
+        count = state.seed(interval, historical_df)
+        print(f"📊 {state.symbol} {interval}: исторические данные добавлены | Текущее количество свечей: {count}")
+    else:
+        print(f"⚠️ {state.symbol} {interval}: нет исторических данных")
+
+
+async def prepare_market_data():
+    started = time.perf_counter()
+    restored = restore_snapshot()
+    now_ms = int(trader.clock.time() * 1000)
+    await asyncio.gather(*(
+        asyncio.to_thread(prepare_interval, state, interval, restored.get((state.symbol, interval)), now_ms)
+        for state in symbol_states.values() for interval in EXCHANGE_INTERVALS
+    ))
+    if BAR_SPECS:
+        print(f"🧱 {', '.join(symbol_states)} {', '.join(BAR_SPECS)}: свечи из aggTrade, история набирается с нуля")
+    print(f"⏱ Состояние готово за {time.perf_counter() - started:.2f} с")
+
+
+async def check_credentials():
+    try:
+        balance = await gateway.account_balance()
+    except REQUEST_ERRORS as e:
+        print("❌ Ошибка авторизации:", e)
+        return False
+    print("✅ Успешно подключено к тестовой сети")
+    print("💼 Баланс фьючерсного аккаунта:", balance[0])
+    return True
+
+
+# Время готовности шагов старта от запуска процесса
+class StartupClock:
+    def __init__(self, origin=BOOT_STARTED):
+        self.origin = origin
+        self.marks = {}
+
+    def mark(self, name):
+        self.marks.setdefault(name, time.perf_counter() - self.origin)
+
+    def report(self):
+        return "⏱ Старт: " + " | ".join(f"{name} {at:.2f} с" for name, at in sorted(self.marks.items(), key=lambda m: m[1]))
 
 
 # === Запуск бота ===
@@ -442,32 +902,47 @@ if __name__ == "__main__":
     print("🤖 Бот запущен...")
 
     # === Проверка API ключей ===
-    if not BINANCE_FUTURES_API_KEY or not BINANCE_FUTURES_SECRET_KEY:
+    if not PAPER_TRADING and (not BINANCE_FUTURES_API_KEY or not BINANCE_FUTURES_SECRET_KEY):
         print("❌ Не заданы API ключи")
         send_telegram_message("❌ Не заданы API ключи для Binance")
+        asyncio.run(send_telegram_message.flush())
         exit(1)
 
-    # Проверка подключения к Testnet Futures
-    try:
-        balance = client.futures_account_balance()
-        print("✅ Успешно подключено к тестовой сети")
-        print("💼 Баланс фьючерсного аккаунта:", balance[0])
-    except BinanceAPIException as e:
-        print("❌ Ошибка авторизации:", e)
-        exit(1)
-
-    # Загрузка исторических данных до запуска WebSocket
-    historical_df = load_historical_data(SYMBOL, INTERVAL, hours=24)
-    if not historical_df.empty:
-        df_stream = pd.concat([df_stream, historical_df]).drop_duplicates()
-        df_stream.sort_index(inplace=True)
-        print(f"📊 Исторические данные добавлены | Текущее количество свечей: {len(df_stream)}")
-    else:
-        print("⚠️ Нет исторических данных")
-
+    # Шаги старта идут параллельно: проверка ключей, история, WebSocket и Telegram.
+    # Стратегии включаются, когда готовы ключи и история; кадры, пришедшие раньше, ждут в очереди
     async def main():
-        bot_task = run_telegram_bot()
-        ws_task = run_websocket()
-        await asyncio.gather(bot_task, ws_task)
+        startup = StartupClock()
+        startup.mark('импорт')
+        send_telegram_message.start()
+        if os.getenv("CHART_WARM_UP") == "1":
+            chart_renderer.warm_up()
+        if METRICS_PORT:
+            await start_metrics_server(port=METRICS_PORT)
+
+        journal.load()
+        history_ready = asyncio.Event()
+        background = [
+            asyncio.ensure_future(run_websocket(ready=history_ready, on_connect=lambda: startup.mark('WebSocket'))),
+            asyncio.ensure_future(run_telegram_bot(on_ready=lambda: startup.mark('Telegram'))),
+        ]
 
-    asyncio.run(main())
\ No newline at end of file
+        async def credentials():
+            ok = await check_credentials()
+            startup.mark('ключи')
+            return ok
+
+        async def history():
+            await prepare_market_data()
+            startup.mark('история')
+
+        ok, _ = await asyncio.gather(credentials(), history())
+        if not ok:
+            for task in background:
+                task.cancel()
+            return 1
+        history_ready.set()
+        startup.mark('торговля')
+        print(startup.report())
+        await asyncio.gather(*background, run_user_data_stream(), snapshots.run(capture_state), journal.run())
+
+    exit(asyncio.run(main()) or 0)
@@ -0,0 +1,198 @@
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# === Кольцевой буфер свечей на NumPy ===
+# Каждое значение пишется дважды (в позицию i и i + capacity), поэтому последние
+# N свечей всегда лежат в памяти подряд и отдаются как срез без копирования.
+# pandas нужен только для DataFrame (extend, to_frame) и импортируется там же.
+
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+APPENDED = 'appended'
+DUPLICATE = 'duplicate'
+OUT_OF_ORDER = 'out_of_order'
+
+
+class CandleBuffer:
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self._times = np.zeros(2 * capacity, dtype=np.int64)  # время открытия, мс
+        self._data = np.zeros((len(COLUMNS), 2 * capacity), dtype=np.float64)
+        self._columns = {name: i for i, name in enumerate(COLUMNS)}
+        self._pos = 0
+        self._size = 0
+        self.count = 0  # сколько свечей добавлено за всё время
+        self._frame = None
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def empty(self):
+        return self._size == 0
+
+    @property
+    def last_time(self):
+        if self._size == 0:
+            return None
+        return int(self._times[self._pos + self.capacity - 1])
+
+    def append(self, timestamp, open_price, high, low, close_price, volume):
+        last_time = self.last_time
+        if last_time is not None:
+            if timestamp == last_time:
+                return DUPLICATE
+            if timestamp < last_time:
+                return OUT_OF_ORDER
+
+        for i in (self._pos, self._pos + self.capacity):
+            self._times[i] = timestamp
+            self._data[:, i] = (open_price, high, low, close_price, volume)
+
+        self._pos = (self._pos + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+        self.count += 1
+        self._frame = None
+        return APPENDED
+
+    # Кольцо начинается с нуля (история, не продолжающая записанные свечи)
+    def clear(self):
+        self._pos = self._size = self.count = 0
+        self._frame = None
+
+    # Загрузка истории (например, результата load_historical_data)
+    def extend(self, df):
+        import pandas as pd
+
+        df = df[~df.index.duplicated(keep='last')].sort_index()
+        times = df.index.as_unit('ms').asi8 if isinstance(df.index, pd.DatetimeIndex) else df.index.to_numpy()
+        values = df[COLUMNS].to_numpy(dtype=np.float64)
+        added = 0
+        for timestamp, row in zip(times, values):
+            if self.append(int(timestamp), *row) == APPENDED:
+                added += 1
+        return added
+
+    # === Представления без копирования ===
+    def _window(self):
+        end = self._pos + self.capacity
+        return slice(end - self._size, end)
+
+    @property
+    def times(self):
+        return self._times[self._window()]
+
+    def __getitem__(self, column):
+        return self._data[self._columns[column], self._window()]
+
+    # Независимая копия буфера (например, для отрисовки, пока в буфер пишут)
+    def copy(self):
+        other = CandleBuffer(self.capacity)
+        other._times[:] = self._times
+        other._data[:] = self._data
+        other._pos, other._size, other.count = self._pos, self._size, self.count
+        return other
+
+    def last(self, column='Close'):
+        if self._size == 0:
+            raise IndexError("буфер свечей пуст")
+        return float(self._data[self._columns[column], self._pos + self.capacity - 1])
+
+    # DataFrame строится лениво и только по запросу (график, расчёт через pandas)
+    def to_frame(self, tail=None):
+        if tail is not None and tail < self._size:
+            return self._build_frame(slice(self._pos + self.capacity - tail, self._pos + self.capacity))
+        if self._frame is None:
+            self._frame = self._build_frame(self._window())
+        return self._frame
+
+    def _build_frame(self, window):
+        import pandas as pd
+
+        index = pd.to_datetime(self._times[window], unit='ms')
+        data = {name: self._data[i, window] for name, i in self._columns.items()}
+        return pd.DataFrame(data, index=index, columns=COLUMNS)
+
+
+# === Кольцо свечей в разделяемой памяти (supervisor.py) ===
+# Та же раскладка, что у CandleBuffer, но массивы и счётчики лежат в SharedMemory: процесс-шард
+# пишет свечи, супервизор читает их без IPC. Запись обрамлена счётчиком seq (seqlock):
+# нечётный — идёт запись; copy() повторяет чтение, пока seq не совпадёт до и после.
+POS, SIZE, COUNT, SEQ = range(4)
+HEADER_FIELDS = 4
+
+
+def segment_name(prefix, symbol, interval):
+    return f"{prefix}_{symbol.lower()}_{interval}"
+
+
+def segment_size(capacity):
+    return 8 * (HEADER_FIELDS + 2 * capacity + len(COLUMNS) * 2 * capacity)
+
+
+class SharedCandleBuffer(CandleBuffer):
+    def __init__(self, shm, capacity, owner=False):
+        self.capacity = capacity
+        self.shm = shm
+        self.owner = owner   # владелец удаляет сегмент в unlink()
+        self._header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        self._times = np.ndarray((2 * capacity,), dtype=np.int64, buffer=shm.buf, offset=8 * HEADER_FIELDS)
+        self._data = np.ndarray((len(COLUMNS), 2 * capacity), dtype=np.float64, buffer=shm.buf,
+                                offset=8 * (HEADER_FIELDS + 2 * capacity))
+        self._columns = {name: i for i, name in enumerate(COLUMNS)}
+        self._frame = None
+
+    @classmethod
+    def create(cls, name, capacity=1000):
+        shm = shared_memory.SharedMemory(name=name, create=True, size=segment_size(capacity))
+        buffer = cls(shm, capacity, owner=True)
+        buffer._header[:] = 0
+        return buffer
+
+    @classmethod
+    def attach(cls, name, capacity=1000):
+        # Шарды запускаются через multiprocessing и делят resource_tracker с создателем,
+        # поэтому сегмент удаляется один раз — владельцем
+        return cls(shared_memory.SharedMemory(name=name), capacity)
+
+    _pos = property(lambda self: int(self._header[POS]), lambda self, value: self._header.__setitem__(POS, value))
+    _size = property(lambda self: int(self._header[SIZE]), lambda self, value: self._header.__setitem__(SIZE, value))
+    count = property(lambda self: int(self._header[COUNT]), lambda self, value: self._header.__setitem__(COUNT, value))
+
+    def append(self, timestamp, open_price, high, low, close_price, volume):
+        self._header[SEQ] += 1
+        try:
+            return super().append(timestamp, open_price, high, low, close_price, volume)
+        finally:
+            self._header[SEQ] += 1
+
+    # Новый писатель (перезапущенный шард) начинает кольцо с нуля
+    def clear(self):
+        self._header[SEQ] += 1
+        self._header[POS] = self._header[SIZE] = self._header[COUNT] = 0
+        self._header[SEQ] += 1
+        self._frame = None
+
+    def copy(self):
+        while True:
+            seq = int(self._header[SEQ])
+            if seq % 2 == 0:
+                other = CandleBuffer.copy(self)
+                if int(self._header[SEQ]) == seq:
+                    return other
+            time.sleep(0)
+
+    # Кадр строится по согласованной копии: в процессе-читателе буфер меняется без append()
+    def to_frame(self, tail=None):
+        return self.copy().to_frame(tail)
+
+    def close(self):
+        self._header = self._times = self._data = None
+        self.shm.close()
+
+    def unlink(self):
+        self.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+logger = logging.getLogger(__name__)
+
+# === Графики сетки в отдельном процессе ===
+# mplfinance/matplotlib импортируются только в процессе-рисовальщике, поэтому не
+# замедляют старт бота и не блокируют event loop. Готовый PNG кэшируется по времени
+# последней свечи и уровням сетки: пока не пришла новая свеча, повторный запрос бесплатен.
+
+CHART_CANDLES = 50
+
+
+def render_grid_chart(df, grid_levels, symbol, interval=None):
+    import matplotlib
+    matplotlib.use('Agg')
+    import mplfinance as mpf
+
+    buffer = BytesIO()
+    title = f"{symbol} {interval} - Последние {len(df)} свечей" if interval else f"{symbol} - Последние {len(df)} свечей"
+    mpf.plot(
+        df,
+        type='candle',
+        style='yahoo',
+        title=title,
+        hlines=dict(hlines=list(grid_levels), colors='gray', linestyle='--'),
+        volume=False,
+        savefig=dict(fname=buffer, dpi=100, bbox_inches='tight'),
+        figratio=(10, 6),
+        figscale=1.5
+    )
+    return buffer.getvalue()
+
+
+def _warm_up():
+    import matplotlib
+    matplotlib.use('Agg')
+    import mplfinance  # noqa: F401
+    return True
+
+
+class ChartRenderer:
+    def __init__(self, workers=1, cache_size=32):
+        self.workers = workers
+        self.cache_size = cache_size
+        self._cache = OrderedDict()   # ключ → PNG
+        self._pending = {}            # ключ → Future рисуемого графика
+        self._executor = None
+        self.hits = 0
+        self.renders = 0
+
+    def _pool(self):
+        if self._executor is None:
+            # fork, а не spawn: spawn заново выполнил бы в дочернем процессе весь модуль bot.py
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+        return self._executor
+
+    # Поднимает процесс и прогревает импорт matplotlib в фоне, не дожидаясь первого /gridchart
+    def warm_up(self):
+        future = self._pool().submit(_warm_up)
+        future.add_done_callback(lambda f: f.exception() and logger.error("❌ Прогрев графиков: %s", f.exception()))
+
+    async def grid_chart(self, symbol, interval, candles, grid_levels):
+        if len(candles) < CHART_CANDLES or not grid_levels:
+            return None
+        levels = tuple(round(float(level), 8) for level in grid_levels)
+        key = (symbol, interval, candles.last_time, levels)
+
+        png = self._cache.get(key)
+        if png is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return png
+        if key in self._pending:
+            return await asyncio.shield(self._pending[key])
+
+        frame = candles.to_frame(tail=CHART_CANDLES)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._pool(), render_grid_chart, frame, levels, symbol, interval)
+        self._pending[key] = future
+        try:
+            png = await asyncio.shield(future)
+        finally:
+            self._pending.pop(key, None)
+
+        self.renders += 1
+        self._cache[key] = png
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return png
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
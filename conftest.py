@@ -0,0 +1 @@
+# Корень репозитория в sys.path: тесты из tests/ импортируют модули бота напрямую
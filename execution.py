@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import time
+from urllib.parse import urlencode
+
+import aiohttp
+
+from metrics import REST_LATENCY, REST_REQUESTS
+from rate_limit import LOW, NORMAL, RateLimitGovernor, default_priority, order_count, request_weight
+
+logger = logging.getLogger(__name__)
+
+FUTURES_TESTNET_URL = "https://testnet.binancefuture.com"
+
+
+# Ответ биржи с ошибкой (HTTP >= 400). Свой тип, а не BinanceAPIException: пакет binance
+# при импорте тянет весь python-binance (~0.8 с), а шлюзу он не нужен
+class ExchangeAPIError(Exception):
+    def __init__(self, status_code, text, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            payload = {}
+        payload = payload if isinstance(payload, dict) else {}
+        self.code = int(payload.get('code', 0))
+        self.message = payload.get('msg', text)
+        super().__init__(f"APIError(code={self.code}): {self.message}")
+
+
+# Всё, чем может закончиться запрос к шлюзу: отказ биржи или сетевая ошибка
+REQUEST_ERRORS = (ExchangeAPIError, aiohttp.ClientError, asyncio.TimeoutError)
+
+
+# === Асинхронный шлюз исполнения ордеров (USDT-M Futures REST) ===
+# Одна aiohttp-сессия с пулом keep-alive соединений на весь процесс,
+# чтобы REST-запросы не блокировали event loop с WebSocket и Telegram.
+class AsyncFuturesGateway:
+    def __init__(self, api_key, api_secret, base_url=FUTURES_TESTNET_URL, recv_window=5000, timeout=10, governor=None):
+        self.api_key = api_key or ""
+        self.api_secret = (api_secret or "").encode()
+        self.base_url = base_url.rstrip('/')
+        self.recv_window = recv_window
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session = None
+        self.last_latency_ms = {}  # путь → задержка последнего запроса
+        self.governor = governor or RateLimitGovernor()
+        self._inflight = {}        # одинаковые GET-запросы в полёте → общая задача
+        self.coalesced = 0
+
+    async def _get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=20, keepalive_timeout=60, ttl_dns_cache=300)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={'X-MBX-APIKEY': self.api_key},
+            )
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    def _sign(self, params):
+        params = {k: v for k, v in params.items() if v is not None}
+        params['timestamp'] = int(time.time() * 1000)
+        params['recvWindow'] = self.recv_window
+        query = urlencode(params)
+        signature = hmac.new(self.api_secret, query.encode(), hashlib.sha256).hexdigest()
+        return f"{query}&signature={signature}"
+
+    # Одинаковые неважные GET-запросы, пришедшие пока первый ещё в полёте, получают его ответ
+    async def _request(self, method, path, params=None, signed=True, priority=None):
+        params = params or {}
+        priority = default_priority(method) if priority is None else priority
+        if method != 'GET' or priority < NORMAL:
+            return await self._send(method, path, params, signed, priority)
+        key = (path, tuple(sorted((k, v) for k, v in params.items() if v is not None)))
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+        task = asyncio.ensure_future(self._send(method, path, params, signed, priority))
+        self._inflight[key] = task
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if task.done():
+                self._inflight.pop(key, None)
+            else:
+                task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+    async def _send(self, method, path, params, signed, priority):
+        # Очередь к лимиту — до подписи, чтобы ожидание не съело recvWindow
+        await self.governor.acquire(request_weight(method, path, params), order_count(method, path, params), priority)
+        query = self._sign(params) if signed else urlencode(params)
+        url = f"{self.base_url}{path}?{query}" if query else f"{self.base_url}{path}"
+        session = await self._get_session()
+
+        started = time.perf_counter()
+        try:
+            async with session.request(method, url) as response:
+                text = await response.text()
+                self.governor.update(response.status, response.headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            REST_REQUESTS.labels(method, path, 'error').inc()
+            raise
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.last_latency_ms[path] = latency_ms
+        REST_LATENCY.labels(method, path).observe(latency_ms)
+        REST_REQUESTS.labels(method, path, str(response.status)).inc()
+        logger.debug("⏱ %s %s → %s за %.1f мс", method, path, response.status, latency_ms)
+        if response.status >= 400:
+            raise ExchangeAPIError(response.status, text, response.headers)
+        return await response.json(content_type=None), latency_ms
+
+    # === Ордеры ===
+    async def create_order(self, **params):
+        order, _ = await self._request('POST', '/fapi/v1/order', params)
+        return order
+
+    async def cancel_order(self, symbol, order_id):
+        order, _ = await self._request('DELETE', '/fapi/v1/order', {'symbol': symbol, 'orderId': order_id})
+        return order
+
+    # === Пакетные запросы (см. order_manager.py) ===
+    # Ответ — список той же длины: ордер или {"code", "msg"} для отклонённого
+    async def batch_orders(self, orders):
+        batch = [{k: str(v) for k, v in order.items()} for order in orders]
+        return await self._request('POST', '/fapi/v1/batchOrders', {'batchOrders': json.dumps(batch, separators=(',', ':'))})
+
+    async def cancel_orders(self, symbol, order_ids):
+        results, _ = await self._request('DELETE', '/fapi/v1/batchOrders', {
+            'symbol': symbol, 'orderIdList': json.dumps(list(order_ids), separators=(',', ':'))
+        })
+        return results
+
+    async def cancel_all_open_orders(self, symbol):
+        result, _ = await self._request('DELETE', '/fapi/v1/allOpenOrders', {'symbol': symbol})
+        return result
+
+    # priority=LOW — для команд Telegram: такие запросы уступают лимит ордерам и сверке
+    async def get_all_orders(self, symbol, limit=50, priority=LOW):
+        orders, _ = await self._request('GET', '/fapi/v1/allOrders', {'symbol': symbol, 'limit': limit}, priority=priority)
+        return orders
+
+    async def get_open_orders(self, symbol=None, priority=NORMAL):
+        orders, _ = await self._request('GET', '/fapi/v1/openOrders', {'symbol': symbol}, priority=priority)
+        return orders
+
+    # === Рыночные данные ===
+    async def depth(self, symbol, limit=1000, priority=NORMAL):
+        book, _ = await self._request('GET', '/fapi/v1/depth', {'symbol': symbol, 'limit': limit},
+                                      signed=False, priority=priority)
+        return book
+
+    # Страница свечей для догрузки после обрыва: вес (1–10) считает общий ограничитель запросов
+    async def klines(self, symbol, interval, start_ms=None, end_ms=None, limit=1000, priority=LOW):
+        params = {'symbol': symbol, 'interval': interval, 'limit': limit}
+        if start_ms is not None:
+            params['startTime'] = start_ms
+        if end_ms is not None:
+            params['endTime'] = end_ms
+        klines, _ = await self._request('GET', '/fapi/v1/klines', params, signed=False, priority=priority)
+        return klines
+
+    # === Аккаунт ===
+    async def position_information(self, symbol=None, priority=NORMAL):
+        positions, _ = await self._request('GET', '/fapi/v2/positionRisk', {'symbol': symbol}, priority=priority)
+        return positions
+
+    async def account_balance(self, priority=NORMAL):
+        balance, _ = await self._request('GET', '/fapi/v2/balance', priority=priority)
+        return balance
+
+    # === User data stream ===
+    async def new_listen_key(self):
+        data, _ = await self._request('POST', '/fapi/v1/listenKey', signed=False)
+        return data['listenKey']
+
+    async def keepalive_listen_key(self):
+        await self._request('PUT', '/fapi/v1/listenKey', signed=False)
+
+    async def close_listen_key(self):
+        await self._request('DELETE', '/fapi/v1/listenKey', signed=False)
+
+
+def format_latencies(latencies):
+    names = {'protection': 'TP+SL', 'entry': 'вход', 'take_profit': 'TP', 'stop_loss': 'SL'}
+    return " | ".join(f"{names.get(k, k)} {v:.0f} мс" for k, v in latencies.items())
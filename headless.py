@@ -0,0 +1,17 @@
+import os
+
+# === bot.py без сети и Telegram ===
+# Общий импорт для бенчмарка и прогона по истории: настройки bot.py читаются при импорте,
+# поэтому окружение задаётся до него. Модульный экземпляр бота не используется — вызывающий
+# собирает свой bot.Trader с бумажной биржей или заглушкой, часами и хранилищами в памяти
+#   bot = import_bot()
+#   trader = bot.Trader(PaperGateway(exchange), states, bot.strategy_registry, notify=print, clock=exchange)
+
+
+def import_bot():
+    # Ключи-заглушки: клиент истории bot.py создаётся лениво и без ping, в сеть никто не ходит
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:headless')
+    os.environ.setdefault('TELEGRAM_CHAT_ID', '0')
+    os.environ['METRICS_PORT'] = '0'
+    import bot
+    return bot
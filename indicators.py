@@ -0,0 +1,175 @@
+import math
+from collections import deque
+
+# === Потоковый расчёт индикаторов ===
+# Каждое обновление стоит O(1) и не зависит от длины истории.
+# Формулы совпадают с strategy.calculate_indicators (pandas rolling/ewm с adjust=False).
+
+RESYNC_EVERY = 1000  # как часто пересчитывать скользящие суммы, чтобы не копить ошибку округления
+
+
+class RollingMean:
+    def __init__(self, window):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self.total = 0.0
+        self._updates = 0
+
+    def update(self, value):
+        if len(self.values) == self.window:
+            self.total -= self.values[0]
+        self.values.append(value)
+        self.total += value
+
+        self._updates += 1
+        if self._updates % RESYNC_EVERY == 0:
+            self.total = math.fsum(self.values)
+        return self.value
+
+    @property
+    def value(self):
+        if len(self.values) < self.window:
+            return math.nan
+        return self.total / self.window
+
+
+class EMA:
+    def __init__(self, span):
+        self.alpha = 2.0 / (span + 1.0)
+        self.value = math.nan
+
+    def update(self, value):
+        if math.isnan(self.value):
+            self.value = value
+        else:
+            self.value = self.alpha * value + (1.0 - self.alpha) * self.value
+        return self.value
+
+
+class RSI:
+    def __init__(self, window):
+        self.avg_gain = RollingMean(window)
+        self.avg_loss = RollingMean(window)
+        self.last_close = None
+
+    def update(self, close):
+        delta = 0.0 if self.last_close is None else close - self.last_close
+        self.last_close = close
+        avg_gain = self.avg_gain.update(delta if delta > 0 else 0.0)
+        avg_loss = self.avg_loss.update(-delta if delta < 0 else 0.0)
+        return StreamingIndicators._rsi(avg_gain, avg_loss)
+
+
+# Гистограмма MACD: смена знака — пересечение MACD и сигнальной линии
+class MACDHistogram:
+    def __init__(self, fast, slow, signal):
+        self.ema_fast = EMA(fast)
+        self.ema_slow = EMA(slow)
+        self.ema_signal = EMA(signal)
+
+    def update(self, close):
+        macd_line = self.ema_fast.update(close) - self.ema_slow.update(close)
+        return macd_line - self.ema_signal.update(macd_line)
+
+
+# === Дополнительные индикаторы по имени: 'sma:200', 'ema:50', 'rsi:7', 'macd:12:26:9' ===
+FEATURES = {'sma': RollingMean, 'ema': EMA, 'rsi': RSI, 'macd': MACDHistogram}
+
+
+def parse_feature(spec):
+    kind, *args = spec.split(':')
+    if kind not in FEATURES or not args or not all(a.isdigit() for a in args):
+        raise ValueError(f"Неизвестный индикатор: {spec} (например sma:200, ema:50, rsi:7, macd:12:26:9)")
+    return kind, tuple(int(a) for a in args)
+
+
+def make_feature(spec):
+    kind, args = parse_feature(spec)
+    return FEATURES[kind](*args)
+
+
+class StreamingIndicators:
+    def __init__(self, window=14, fast=12, slow=26, signal=9, sma_window=50, features=()):
+        self.window = window
+        self.sma_window = sma_window
+        # Индикаторы, которые уже считает движок, не дублируются: имя → ключ в latest
+        self.aliases = {
+            f'rsi:{window}': 'rsi', f'sma:{sma_window}': 'sma', f'macd:{fast}:{slow}:{signal}': 'macd_hist',
+            f'ema:{fast}': 'ema12', f'ema:{slow}': 'ema26',
+        }
+        self.features = {}
+        for spec in features:
+            self.require(spec)
+        self.avg_gain = RollingMean(window)
+        self.avg_loss = RollingMean(window)
+        self.ema_fast = EMA(fast)
+        self.ema_slow = EMA(slow)
+        self.ema_signal = EMA(signal)
+        self.sma = RollingMean(sma_window)
+        self.last_close = None
+        self.count = 0
+        self.latest = None
+        self.prev = None
+
+    # Подключает индикатор по имени (до загрузки истории, иначе он прогреется только на новых свечах)
+    def require(self, spec):
+        if spec in self.aliases or spec in self.features:
+            return
+        self.features[spec] = make_feature(spec)
+
+    # Значение индикатора по имени на последней (prev=True — на предыдущей) свече
+    def value(self, spec, prev=False):
+        values = self.prev if prev else self.latest
+        return values[self.aliases.get(spec, spec)]
+
+    @classmethod
+    def from_frame(cls, df, **kwargs):
+        engine = cls(**kwargs)
+        engine.seed(df['Close'])
+        return engine
+
+    # Начальная загрузка из истории (например, результат load_historical_data)
+    def seed(self, closes):
+        for close in closes:
+            self.update(float(close))
+        return self.latest
+
+    def update(self, close):
+        # Первая разница — NaN, и в pandas она превращается в нулевые gain/loss
+        delta = 0.0 if self.last_close is None else close - self.last_close
+        self.last_close = close
+
+        avg_gain = self.avg_gain.update(delta if delta > 0 else 0.0)
+        avg_loss = self.avg_loss.update(-delta if delta < 0 else 0.0)
+        rsi = self._rsi(avg_gain, avg_loss)
+
+        ema_fast = self.ema_fast.update(close)
+        ema_slow = self.ema_slow.update(close)
+        macd_line = ema_fast - ema_slow
+        signal_line = self.ema_signal.update(macd_line)
+
+        self.count += 1
+        self.prev = self.latest
+        self.latest = {
+            'Close': close,
+            'rsi': rsi,
+            'ema12': ema_fast,
+            'ema26': ema_slow,
+            'macd_line': macd_line,
+            'signal_line': signal_line,
+            'macd_hist': macd_line - signal_line,
+            'sma': self.sma.update(close),
+        }
+        for spec, feature in self.features.items():
+            self.latest[spec] = feature.update(close)
+        return self.latest
+
+    @staticmethod
+    def _rsi(avg_gain, avg_loss):
+        if math.isnan(avg_gain) or math.isnan(avg_loss):
+            return math.nan
+        if avg_loss == 0:
+            # Поведение pandas: x / 0 → inf → RSI 100, 0 / 0 → NaN
+            return 100.0 if avg_gain > 0 else math.nan
+        rs = avg_gain / avg_loss
+        return 100 - (100 / (1 + rs))
@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+logger = logging.getLogger(__name__)
+
+# === Разбор кадров kline, aggTrade и depthUpdate из WebSocket ===
+# Бэкенд выбирается по JSON_DECODER (msgspec / orjson / json), по умолчанию — самый быстрый
+# из установленных. msgspec декодирует кадр сразу в типизированную структуру, минуя dict.
+
+BACKENDS = ('msgspec', 'orjson', 'json')
+# Binance шлёт компактный JSON, поэтому незакрытую свечу видно по подстроке без разбора
+OPEN_TICK_MARKER = '"x":false'
+OPEN_TICK_MARKER_BYTES = b'"x":false'
+
+
+class Kline:
+    __slots__ = ('symbol', 'interval', 'open_time', 'close_time', 'open', 'high', 'low', 'close', 'volume', 'closed')
+
+    def __init__(self, symbol, interval, open_time, close_time, open, high, low, close, volume, closed):
+        self.symbol = symbol
+        self.interval = interval
+        self.open_time = open_time
+        self.close_time = close_time
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.closed = closed
+
+    @classmethod
+    def from_event(cls, event):
+        k = event['k']
+        return cls(
+            event['s'], k['i'], int(k['t']), int(k['T']),
+            float(k['o']), float(k['h']), float(k['l']), float(k['c']), float(k['v']), bool(k['x'])
+        )
+
+    def __repr__(self):
+        state = 'closed' if self.closed else 'open'
+        return f"Kline({self.symbol} {self.interval} {self.open_time} c={self.close} {state})"
+
+
+class Trade:
+    __slots__ = ('symbol', 'price', 'quantity', 'time')
+
+    def __init__(self, symbol, price, quantity, time):
+        self.symbol = symbol
+        self.price = price
+        self.quantity = quantity
+        self.time = time
+
+    @classmethod
+    def from_event(cls, event):
+        return cls(event['s'], float(event['p']), float(event['q']), int(event['T']))
+
+    def __repr__(self):
+        return f"Trade({self.symbol} {self.quantity}@{self.price} {self.time})"
+
+
+# Обновление стакана из потока @depth: U/u — первый и последний updateId, pu — u предыдущего события
+class DepthUpdate:
+    __slots__ = ('symbol', 'first_id', 'final_id', 'prev_final_id', 'time', 'bids', 'asks')
+
+    def __init__(self, symbol, first_id, final_id, prev_final_id, time, bids, asks):
+        self.symbol = symbol
+        self.first_id = first_id
+        self.final_id = final_id
+        self.prev_final_id = prev_final_id
+        self.time = time
+        self.bids = bids    # [(цена, количество)], количество 0 — уровень удалён
+        self.asks = asks
+
+    @classmethod
+    def from_event(cls, event):
+        return cls(
+            event['s'], int(event['U']), int(event['u']), int(event.get('pu', -1)), int(event['E']),
+            [(float(p), float(q)) for p, q in event['b']], [(float(p), float(q)) for p, q in event['a']]
+        )
+
+    def __repr__(self):
+        return f"DepthUpdate({self.symbol} {self.first_id}..{self.final_id} b={len(self.bids)} a={len(self.asks)})"
+
+
+if msgspec is not None:
+    # Строковые цены Binance приводятся к float прямо при декодировании (strict=False)
+    class _KlineFields(msgspec.Struct):
+        t: int
+        T: int
+        i: str
+        o: float
+        h: float
+        l: float
+        c: float
+        v: float
+        x: bool
+
+    # Тип события различается по полю "e"
+    class _KlineEvent(msgspec.Struct, tag_field='e', tag='kline'):
+        s: str
+        k: _KlineFields
+
+    class _TradeEvent(msgspec.Struct, tag_field='e', tag='aggTrade'):
+        s: str
+        p: float
+        q: float
+        T: int
+
+    class _DepthEvent(msgspec.Struct, tag_field='e', tag='depthUpdate'):
+        s: str
+        E: int
+        U: int
+        u: int
+        b: list[tuple[float, float]]
+        a: list[tuple[float, float]]
+        pu: int = -1
+
+    class _Envelope(msgspec.Struct):
+        data: _KlineEvent | _TradeEvent | _DepthEvent
+
+
+def available_backends():
+    return [name for name, module in (('msgspec', msgspec), ('orjson', orjson), ('json', json)) if module is not None]
+
+
+class KlineDecoder:
+    def __init__(self, backend=None, closed_only=False):
+        backend = backend or os.getenv("JSON_DECODER") or available_backends()[0]
+        if backend not in available_backends():
+            raise ValueError(f"JSON-декодер {backend} недоступен, есть: {', '.join(available_backends())}")
+        self.backend = backend
+        self.closed_only = closed_only  # незакрытые тики отбрасываются до разбора JSON
+        self.skipped_ticks = 0
+        self.skipped = 0
+        self.loads = orjson.loads if backend == 'orjson' else json.loads
+        if backend == 'msgspec':
+            self._envelope = msgspec.json.Decoder(_Envelope, strict=False)
+            self._generic = msgspec.json.Decoder()
+            self.loads = self._generic.decode
+        logger.info("🧩 JSON-декодер: %s", backend)
+
+    # Кадр → Kline, Trade (aggTrade) или DepthUpdate (@depth); None для незакрытых тиков (при closed_only)
+    # и прочих сообщений. Битый JSON поднимает ValueError.
+    def decode(self, frame):
+        if self.closed_only:
+            marker = OPEN_TICK_MARKER_BYTES if isinstance(frame, bytes) else OPEN_TICK_MARKER
+            if marker in frame:
+                self.skipped_ticks += 1
+                return None
+        if self.backend == 'msgspec':
+            return self._decode_struct(frame)
+
+        msg = self.loads(frame)
+        # Комбинированный поток оборачивает событие в {"stream": ..., "data": ...}
+        msg = msg.get('data', msg)
+        event_type = msg.get('e')
+        if event_type == 'aggTrade':
+            return Trade.from_event(msg)
+        if event_type == 'depthUpdate':
+            return DepthUpdate.from_event(msg)
+        if event_type != 'kline':
+            self.skipped += 1
+            logger.debug("📡 Пропущено несвечное сообщение: %s", msg)
+            return None
+        kline = Kline.from_event(msg)
+        if self.closed_only and not kline.closed:
+            self.skipped_ticks += 1
+            return None
+        return kline
+
+    def _decode_struct(self, frame):
+        try:
+            event = self._envelope.decode(frame).data
+        except msgspec.ValidationError:
+            # Не свечное событие или поток без обёртки — разбираем как обычный JSON
+            try:
+                msg = self._generic.decode(frame)
+            except msgspec.DecodeError as e:
+                raise ValueError(str(e)) from e
+            msg = msg.get('data', msg) if isinstance(msg, dict) else msg
+            if isinstance(msg, dict) and msg.get('e') == 'kline':
+                return self._keep(Kline.from_event(msg))
+            if isinstance(msg, dict) and msg.get('e') == 'aggTrade':
+                return Trade.from_event(msg)
+            if isinstance(msg, dict) and msg.get('e') == 'depthUpdate':
+                return DepthUpdate.from_event(msg)
+            self.skipped += 1
+            logger.debug("📡 Пропущено несвечное сообщение: %s", msg)
+            return None
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e
+        if type(event) is _TradeEvent:
+            return Trade(event.s, event.p, event.q, event.T)
+        if type(event) is _DepthEvent:
+            return DepthUpdate(event.s, event.U, event.u, event.pu, event.E, event.b, event.a)
+        k = event.k
+        return self._keep(Kline(event.s, k.i, k.t, k.T, k.o, k.h, k.l, k.c, k.v, k.x))
+
+    def _keep(self, kline):
+        if self.closed_only and not kline.closed:
+            self.skipped_ticks += 1
+            return None
+        return kline
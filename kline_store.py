@@ -0,0 +1,234 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+import numpy as np
+
+from execution import ExchangeAPIError
+from rate_limit import LOW
+
+logger = logging.getLogger(__name__)
+
+# === Локальное хранилище свечей ===
+# Раскладка: {root}/{SYMBOL}/{interval}/{YYYY-MM-DD}.npy, в файле массив (6, n) float64:
+# время открытия (мс) и OHLCV по строкам — каждая колонка лежит в памяти подряд
+# и читается через memory-map без копирования. pandas импортируется только в load():
+# хранилище входит в bot.py, импорт которого должен быть быстрым.
+
+FIELDS = ['time', 'Open', 'High', 'Low', 'Close', 'Volume']
+COLUMNS = FIELDS[1:]
+DAY_MS = 86_400_000
+INTERVAL_MS = {
+    '1m': 60_000, '3m': 180_000, '5m': 300_000, '15m': 900_000, '30m': 1_800_000,
+    '1h': 3_600_000, '2h': 7_200_000, '4h': 14_400_000, '6h': 21_600_000,
+    '8h': 28_800_000, '12h': 43_200_000, '1d': 86_400_000,
+}
+PAGE_LIMIT = 1000      # максимум свечей за один запрос get_klines
+WEIGHT_LIMIT = 1200    # бюджет веса запросов в минуту, после которого делаем паузу
+DEFAULT_ROOT = os.getenv("KLINE_STORE", "data/klines")
+
+
+class KlineStore:
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+
+    def _dir(self, symbol, interval):
+        return os.path.join(self.root, symbol.upper(), interval)
+
+    def _days(self, symbol, interval):
+        path = self._dir(symbol, interval)
+        if not os.path.isdir(path):
+            return []
+        return sorted(f[:-4] for f in os.listdir(path) if f.endswith('.npy'))
+
+    def _read_day(self, symbol, interval, day):
+        return np.load(os.path.join(self._dir(symbol, interval), f"{day}.npy"), mmap_mode='r')
+
+    # === Чтение ===
+    def load_arrays(self, symbol, interval, start_ms=None, end_ms=None):
+        parts = []
+        for day in self._days(symbol, interval):
+            day_start = int(np.datetime64(day, 'ms').astype(np.int64))
+            if start_ms is not None and day_start + DAY_MS <= start_ms:
+                continue
+            if end_ms is not None and day_start > end_ms:
+                break
+            data = self._read_day(symbol, interval, day)
+            times = data[0]
+            lo = 0 if start_ms is None else np.searchsorted(times, start_ms, side='left')
+            hi = len(times) if end_ms is None else np.searchsorted(times, end_ms, side='right')
+            parts.append(data[:, lo:hi])
+        if not parts:
+            return np.empty((len(FIELDS), 0))
+        return parts[0] if len(parts) == 1 else np.concatenate(parts, axis=1)
+
+    def load(self, symbol, interval, start_ms=None, end_ms=None):
+        import pandas as pd
+
+        data = self.load_arrays(symbol, interval, start_ms, end_ms)
+        index = pd.to_datetime(data[0].astype(np.int64), unit='ms')
+        return pd.DataFrame({name: data[i + 1] for i, name in enumerate(COLUMNS)}, index=index, columns=COLUMNS)
+
+    def time_range(self, symbol, interval):
+        days = self._days(symbol, interval)
+        if not days:
+            return None, None
+        first = self._read_day(symbol, interval, days[0])
+        last = self._read_day(symbol, interval, days[-1])
+        return int(first[0, 0]), int(last[0, -1])
+
+    # === Запись ===
+    def write(self, symbol, interval, rows):
+        rows = np.asarray(rows, dtype=np.float64)
+        if rows.shape[1] == 0:
+            return 0
+        path = self._dir(symbol, interval)
+        os.makedirs(path, exist_ok=True)
+
+        day_keys = (rows[0] // DAY_MS).astype(np.int64)
+        for key in np.unique(day_keys):
+            chunk = rows[:, day_keys == key]
+            day = str(np.datetime64(int(key), 'D'))
+            file = os.path.join(path, f"{day}.npy")
+            if os.path.exists(file):
+                chunk = np.concatenate([np.load(file), chunk], axis=1)
+            # Сортировка и удаление дублей по времени (новая запись побеждает)
+            _, last_idx = np.unique(chunk[0][::-1], return_index=True)
+            chunk = chunk[:, chunk.shape[1] - 1 - last_idx]
+            tmp = file + '.tmp'
+            with open(tmp, 'wb') as f:
+                np.save(f, chunk)
+            os.replace(tmp, file)
+        return rows.shape[1]
+
+    # === Догрузка недостающего диапазона с биржи ===
+    def sync(self, client, symbol, interval, start_ms, end_ms=None, pause=0.1):
+        step = INTERVAL_MS[interval]
+        now_ms = int(time.time() * 1000)
+        end_ms = end_ms or now_ms
+        first, last = self.time_range(symbol, interval)
+
+        ranges = []
+        if first is None:
+            ranges.append((start_ms, end_ms))
+        else:
+            if first - start_ms >= step:
+                ranges.append((start_ms, first - 1))
+            # Хранилище может кончаться задолго до окна — пропуск до start_ms не догружается
+            tail_start = max(last + step, start_ms)
+            if tail_start < end_ms:
+                ranges.append((tail_start, end_ms))
+
+        fetched = 0
+        for range_start, range_end in ranges:
+            fetched += self._fetch_range(client, symbol, interval, range_start, range_end, now_ms, pause)
+        if fetched:
+            logger.info("💾 %s %s: догружено %d свечей", symbol, interval, fetched)
+        return fetched
+
+    # Догрузка ровно указанного диапазона (например, пропуска после перезапуска)
+    def fetch(self, client, symbol, interval, start_ms, end_ms=None, pause=0.1):
+        now_ms = int(time.time() * 1000)
+        return self._fetch_range(client, symbol, interval, start_ms, end_ms or now_ms, now_ms, pause)
+
+    def _fetch_range(self, client, symbol, interval, start_ms, end_ms, now_ms, pause):
+        from binance.exceptions import BinanceAPIException   # синхронный путь — только с клиентом python-binance
+
+        fetched = 0
+        cursor = start_ms
+        backoff = 1.0
+        while cursor <= end_ms:
+            try:
+                klines = client.get_klines(
+                    symbol=symbol, interval=interval, startTime=cursor, endTime=end_ms, limit=PAGE_LIMIT
+                )
+            except BinanceAPIException as e:
+                if e.status_code in (418, 429):
+                    retry_after = _retry_after(e.response) or backoff
+                    logger.warning("⏳ Лимит запросов Binance, пауза %.1f с", retry_after)
+                    time.sleep(retry_after)
+                    backoff = min(backoff * 2, 60)
+                    continue
+                raise
+            backoff = 1.0
+            if not klines:
+                break
+
+            fetched += self._write_page(symbol, interval, klines, now_ms)
+            cursor = int(klines[-1][0]) + 1
+            if len(klines) < PAGE_LIMIT:
+                break
+            self._respect_weight(client, pause)
+        return fetched
+
+    def _write_page(self, symbol, interval, klines, now_ms):
+        rows = np.array([k[:6] for k in klines], dtype=np.float64).T
+        closed = np.array([k[6] for k in klines], dtype=np.int64) < now_ms  # только закрытые свечи
+        return self.write(symbol, interval, rows[:, closed])
+
+    # Догрузка из работающего бота: страницы идут через асинхронный шлюз (execution.py),
+    # его ограничитель учитывает вес каждой страницы и ждёт конца бана после 429/418
+    async def fetch_async(self, gateway, symbol, interval, start_ms, end_ms=None):
+        now_ms = int(time.time() * 1000)
+        end_ms = end_ms or now_ms
+        fetched = 0
+        cursor = start_ms
+        while cursor <= end_ms:
+            try:
+                klines = await gateway.klines(symbol, interval, cursor, end_ms, PAGE_LIMIT, priority=LOW)
+            except ExchangeAPIError as e:
+                if e.status_code in (418, 429):
+                    continue   # следующий запрос дождётся конца бана в ограничителе
+                raise
+            if not klines:
+                break
+            fetched += await asyncio.to_thread(self._write_page, symbol, interval, klines, now_ms)
+            cursor = int(klines[-1][0]) + 1
+            if len(klines) < PAGE_LIMIT:
+                break
+        return fetched
+
+    @staticmethod
+    def _respect_weight(client, pause):
+        response = getattr(client, 'response', None)
+        used = _header_int(response, 'x-mbx-used-weight-1m') or _header_int(response, 'x-mbx-used-weight')
+        if used and used >= WEIGHT_LIMIT:
+            wait = 60 - time.time() % 60 + 1
+            logger.warning("⏳ Использовано %d веса за минуту, пауза %.0f с", used, wait)
+            time.sleep(wait)
+        else:
+            time.sleep(pause)
+
+
+def _header_int(response, name):
+    headers = getattr(response, 'headers', None) or {}
+    value = headers.get(name)
+    return int(value) if value else None
+
+
+def _retry_after(response):
+    return _header_int(response, 'retry-after')
+
+
+if __name__ == "__main__":
+    import pandas as pd
+    from binance.client import Client as BinanceClient
+
+    parser = argparse.ArgumentParser(description="Догрузка свечей в локальное хранилище")
+    parser.add_argument('symbol')
+    parser.add_argument('interval')
+    parser.add_argument('--days', type=float, default=30)
+    parser.add_argument('--root', default=DEFAULT_ROOT)
+    parser.add_argument('--mainnet', action='store_true', help="брать историю с основной сети")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    store = KlineStore(args.root)
+    start = int((time.time() - args.days * 86400) * 1000)
+    started = time.perf_counter()
+    count = store.sync(BinanceClient(testnet=not args.mainnet), args.symbol.upper(), args.interval, start)
+    first, last = store.time_range(args.symbol, args.interval)
+    print(f"✅ Догружено {count} свечей за {time.perf_counter() - started:.1f} с | "
+          f"в хранилище: {pd.to_datetime(first, unit='ms')} — {pd.to_datetime(last, unit='ms')}")
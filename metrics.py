@@ -0,0 +1,188 @@
+import bisect
+import contextvars
+import logging
+import math
+import time
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# === Метрики в формате Prometheus ===
+# Горячий путь только увеличивает счётчики и кладёт значения в корзины гистограмм;
+# текст для /metrics собирается лишь при запросе, так что без сборщика метрики почти бесплатны.
+
+LATENCY_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+QUANTILES = (0.5, 0.99)
+RECENT_SAMPLES = 1024  # окно последних наблюдений для p50/p99
+
+
+def now_ms():
+    return time.time_ns() / 1_000_000
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class _Histogram:
+    __slots__ = ('bounds', 'counts', 'sum', 'count', 'recent', '_pos')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = []
+        self._pos = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+        if len(self.recent) < RECENT_SAMPLES:
+            self.recent.append(value)
+        else:
+            self.recent[self._pos] = value
+            self._pos = (self._pos + 1) % RECENT_SAMPLES
+
+    def quantile(self, q):
+        if not self.recent:
+            return math.nan
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# === Семейство метрик с метками: child = family.labels('POST', '/fapi/v1/order') ===
+class _Family:
+    def __init__(self, kind, name, help_text, labelnames, factory):
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._children = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._factory()
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            if self.kind == 'counter':
+                lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {child.value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(child.bounds + (math.inf,), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, values)} {child.sum!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, values)} {child.count}")
+        if self.kind == 'histogram' and self._children:
+            name = f"{self.name}_recent"
+            lines += [f"# HELP {name} Квантили по последним {RECENT_SAMPLES} наблюдениям", f"# TYPE {name} gauge"]
+            for values, child in sorted(self._children.items()):
+                for q in QUANTILES:
+                    quantile = f'quantile="{q}"'
+                    lines.append(f"{name}{_format_labels(self.labelnames, values, quantile)} {child.quantile(q)!r}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._families = []
+        self._collectors = []
+
+    def counter(self, name, help_text, labelnames=()):
+        family = _Family('counter', name, help_text, labelnames, _Counter)
+        self._families.append(family)
+        return family
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS_MS):
+        bounds = tuple(float(b) for b in buckets)
+        family = _Family('histogram', name, help_text, labelnames, lambda: _Histogram(bounds))
+        self._families.append(family)
+        return family
+
+    # Сборщик вызывается при каждом запросе /metrics и возвращает [(name, help, {labels: value})]
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for family in self._families:
+            lines += family.render()
+        for collector in self._collectors:
+            try:
+                gauges = collector()
+            except Exception as e:
+                logger.error("❌ Ошибка сборщика метрик: %s", e)
+                continue
+            for name, help_text, samples in gauges:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+                for labels, value in samples.items():
+                    label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                    lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_LATENCY = REGISTRY.histogram(
+    'bot_stage_latency_ms', "Задержка стадий от закрытия свечи до подтверждения ордера, мс", ('stage',)
+)
+REST_LATENCY = REGISTRY.histogram(
+    'bot_rest_latency_ms', "Время REST-запроса к бирже, мс", ('method', 'endpoint')
+)
+REST_REQUESTS = REGISTRY.counter(
+    'bot_rest_requests_total', "Число REST-запросов к бирже", ('method', 'endpoint', 'status')
+)
+WS_MESSAGES = REGISTRY.counter('bot_ws_messages_total', "Получено сообщений WebSocket", ('stream',))
+WS_RECONNECTS = REGISTRY.counter('bot_ws_reconnects_total', "Переподключения WebSocket", ('stream',))
+WS_DUPLICATES = REGISTRY.counter('bot_ws_duplicates_total', "Отброшено дубликатов с резервных соединений", ('stream',))
+WS_FIRST = REGISTRY.counter('bot_ws_first_total', "Кадров, первыми пришедших по соединению", ('connection',))
+
+# Метки времени свечи, решение по которой сейчас принимается (наследуется вложенными корутинами)
+kline_trace = contextvars.ContextVar('kline_trace', default=None)
+
+
+def observe_stage(stage, value_ms):
+    STAGE_LATENCY.labels(stage).observe(value_ms)
+
+
+# === HTTP-эндпоинт /metrics ===
+async def start_metrics_server(host='127.0.0.1', port=9108, registry=REGISTRY):
+    async def handle(request):
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info("📈 Метрики доступны на http://%s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,177 @@
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+from aiohttp import web
+
+from rate_limit import WEIGHT_LIMIT_1M, request_weight
+
+# === Локальный мок-сервер Binance Futures REST ===
+# Нужен, чтобы проверять AsyncFuturesGateway без сети:
+#   python mock_exchange.py --port 8765 --latency 50
+#   BINANCE_FUTURES_REST_URL=http://127.0.0.1:8765 python bot.py
+
+
+class MockExchange:
+    def __init__(self, latency_ms=0.0, price=30000.0, weight_limit=WEIGHT_LIMIT_1M):
+        self.latency = latency_ms / 1000
+        self.price = price
+        self.weight_limit = weight_limit
+        self.used_weight = 0
+        self._weight_minute = None
+        self.orders = {}
+        self.position_amt = 0.0
+        self.entry_price = 0.0
+        self._ids = itertools.count(1)
+
+    async def _delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    @staticmethod
+    def _params(request):
+        return dict(request.query)
+
+    def _new_order(self, params):
+        order_type = params.get('type', 'MARKET')
+        order = {
+            'orderId': next(self._ids),
+            'symbol': params.get('symbol'),
+            'side': params.get('side'),
+            'type': order_type,
+            'price': params.get('price', '0'),
+            'stopPrice': params.get('stopPrice', '0'),
+            'origQty': params.get('quantity', '0'),
+            'closePosition': params.get('closePosition') == 'true',
+            'status': 'NEW',
+            'updateTime': int(time.time() * 1000),
+        }
+        if order_type == 'MARKET':
+            qty = float(order['origQty'])
+            self.position_amt += qty if order['side'] == 'BUY' else -qty
+            self.entry_price = self.price if self.position_amt else 0.0
+            order['status'] = 'FILLED'
+            order['avgPrice'] = str(self.price)
+        self.orders[order['orderId']] = order
+        return order
+
+    async def create_order(self, request):
+        await self._delay()
+        params = self._params(request)
+        if 'symbol' not in params or 'side' not in params:
+            return web.json_response({'code': -1102, 'msg': 'Mandatory parameter was not sent'}, status=400)
+        return web.json_response(self._new_order(params))
+
+    async def cancel_order(self, request):
+        await self._delay()
+        result = self._cancel(int(self._params(request).get('orderId', 0)))
+        return web.json_response(result, status=400 if 'code' in result else 200)
+
+    # Ноги пакета независимы: отклонённая получает {"code", "msg"} на своём месте
+    async def batch_orders(self, request):
+        await self._delay()
+        results = []
+        for params in json.loads(self._params(request).get('batchOrders', '[]')):
+            if 'symbol' not in params or 'side' not in params:
+                results.append({'code': -1102, 'msg': 'Mandatory parameter was not sent'})
+            else:
+                results.append(self._new_order(params))
+        return web.json_response(results)
+
+    def _cancel(self, order_id):
+        order = self.orders.get(order_id)
+        if order is None or order['status'] != 'NEW':
+            return {'code': -2011, 'msg': 'Unknown order sent.'}
+        order['status'] = 'CANCELED'
+        return order
+
+    async def batch_cancel(self, request):
+        await self._delay()
+        order_ids = json.loads(self._params(request).get('orderIdList', '[]'))
+        return web.json_response([self._cancel(int(order_id)) for order_id in order_ids])
+
+    async def cancel_all(self, request):
+        await self._delay()
+        symbol = self._params(request).get('symbol')
+        for order in self.orders.values():
+            if order['symbol'] == symbol and order['status'] == 'NEW':
+                order['status'] = 'CANCELED'
+        return web.json_response({'code': 200, 'msg': 'The operation of cancel all open order is done.'})
+
+    async def all_orders(self, request):
+        await self._delay()
+        params = self._params(request)
+        limit = int(params.get('limit', 500))
+        orders = [o for o in self.orders.values() if o['symbol'] == params.get('symbol')]
+        return web.json_response(orders[-limit:])
+
+    async def open_orders(self, request):
+        await self._delay()
+        symbol = self._params(request).get('symbol')
+        return web.json_response([
+            o for o in self.orders.values()
+            if o['status'] == 'NEW' and symbol in (None, o['symbol'])
+        ])
+
+    async def position_risk(self, request):
+        await self._delay()
+        symbol = self._params(request).get('symbol', 'BTCUSDT')
+        return web.json_response([{
+            'symbol': symbol,
+            'positionSide': 'BOTH',
+            'positionAmt': str(self.position_amt),
+            'entryPrice': str(self.entry_price),
+        }])
+
+    async def balance(self, request):
+        await self._delay()
+        return web.json_response([{'asset': 'USDT', 'balance': '10000.0', 'availableBalance': '10000.0'}])
+
+    async def listen_key(self, request):
+        await self._delay()
+        return web.json_response({'listenKey': 'mock-listen-key'})
+
+    # Вес запросов за текущую минуту, как у Binance: заголовок X-MBX-USED-WEIGHT-1M и 429 при превышении
+    @web.middleware
+    async def _weight(self, request, handler):
+        minute = int(time.time() // 60)
+        if minute != self._weight_minute:
+            self._weight_minute, self.used_weight = minute, 0
+        self.used_weight += request_weight(request.method, request.path, request.query)
+        headers = {'X-MBX-USED-WEIGHT-1M': str(self.used_weight)}
+        if self.used_weight > self.weight_limit:
+            headers['Retry-After'] = str(60 - int(time.time()) % 60)
+            return web.json_response({'code': -1003, 'msg': 'Too many requests'}, status=429, headers=headers)
+        response = await handler(request)
+        response.headers.update(headers)
+        return response
+
+    def app(self):
+        app = web.Application(middlewares=[self._weight])
+        app.router.add_post('/fapi/v1/order', self.create_order)
+        app.router.add_delete('/fapi/v1/order', self.cancel_order)
+        app.router.add_post('/fapi/v1/batchOrders', self.batch_orders)
+        app.router.add_delete('/fapi/v1/batchOrders', self.batch_cancel)
+        app.router.add_delete('/fapi/v1/allOpenOrders', self.cancel_all)
+        app.router.add_get('/fapi/v1/allOrders', self.all_orders)
+        app.router.add_get('/fapi/v1/openOrders', self.open_orders)
+        app.router.add_get('/fapi/v2/positionRisk', self.position_risk)
+        app.router.add_get('/fapi/v2/balance', self.balance)
+        app.router.add_post('/fapi/v1/listenKey', self.listen_key)
+        app.router.add_put('/fapi/v1/listenKey', self.listen_key)
+        app.router.add_delete('/fapi/v1/listenKey', self.listen_key)
+        return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Мок-сервер Binance Futures REST")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help="искусственная задержка ответа, мс")
+    parser.add_argument('--price', type=float, default=30000.0)
+    parser.add_argument('--weight-limit', type=int, default=WEIGHT_LIMIT_1M, help="лимит веса запросов в минуту")
+    args = parser.parse_args()
+
+    web.run_app(MockExchange(args.latency, args.price, args.weight_limit).app(), host=args.host, port=args.port)
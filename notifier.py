@@ -1,18 +1,150 @@
-from telegram import Bot
 import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
-def create_notifier(bot_token, chat_id):
-    bot = Bot(token=bot_token)
+TELEGRAM_MAX_LENGTH = 4096
 
-    async def send_message(msg):
+
+# === Фоновая отправка сообщений в Telegram ===
+# Вызов notifier(msg) только кладёт текст в очередь и сразу возвращает управление.
+# Фоновая задача склеивает пачку сообщений в одно, соблюдает лимит Telegram
+# (не чаще одного сообщения в min_interval секунд на чат) и повторяет отправку при RetryAfter.
+# python-telegram-bot (вместе с httpx) импортируется при первой отправке, а не при старте бота.
+# Сообщения до запуска event loop ждут в очереди: отправка начнётся после start() —
+# без вложенных event loop и синхронной отправки.
+class TelegramNotifier:
+    def __init__(self, bot_token, chat_id, max_queue=100, batch_window=0.5, min_interval=1.0, max_retries=5):
+        self.bot_token = bot_token
+        self._bot = None
+        self.chat_id = chat_id
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.batch_window = batch_window
+        self.min_interval = min_interval
+        self.max_retries = max_retries
+        self.dropped = 0
+        self._task = None
+        self._loop = None
+
+    @property
+    def bot(self):
+        if self._bot is None:
+            from telegram import Bot
+            self._bot = Bot(token=self.bot_token)
+        return self._bot
+
+    def __call__(self, msg):
+        if self._task is not None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            if loop is not self._loop:
+                # Вызов из потока (история грузится в asyncio.to_thread) — очередь живёт в event loop бота
+                self._loop.call_soon_threadsafe(self, msg)
+                return
+        if self._task is None:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                pass   # event loop ещё не запущен — сообщение дождётся start()
+            else:
+                self.start()
+
+        if self.queue.full():
+            # Очередь переполнена — выбрасываем самое старое сообщение, а не блокируем торговлю
+            self.queue.get_nowait()
+            self.dropped += 1
+            logger.warning("⚠️ [Telegram] Очередь переполнена, сообщений отброшено: %d", self.dropped)
+        self.queue.put_nowait(msg)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._task = self._loop.create_task(self._run())
+        return self._task
+
+    # Отправить накопленное и остановиться: для выхода до основного цикла бота
+    async def flush(self, timeout=5):
+        self.start()
+        await self.stop(timeout)
+
+    async def stop(self, timeout=5):
+        if self._task is None:
+            return
         try:
-            await bot.send_message(chat_id=chat_id, text=msg)
-            logger.info(f"📩 Сообщение отправлено в Telegram: {msg[:50]}...")
-        except Exception as e:
-            logger.error(f"[Telegram] Ошибка отправки сообщения: {e}", exc_info=True)
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ [Telegram] Не все сообщения отправлены до остановки")
+        self._task.cancel()
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        last_sent = 0.0
+        while True:
+            batch = [await self.queue.get()]
+
+            # Собираем всё, что пришло за batch_window, в одно сообщение
+            deadline = loop.time() + self.batch_window
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            for text in _pack(batch):
+                wait = self.min_interval - (loop.time() - last_sent)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                await self._send(text)
+                last_sent = loop.time()
+
+            for _ in batch:
+                self.queue.task_done()
+
+    async def _send(self, msg):
+        from telegram.error import RetryAfter, TimedOut, NetworkError
+        bot = self.bot
+        delay = 1.0
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                await bot.send_message(chat_id=self.chat_id, text=msg)
+                logger.info(f"📩 Сообщение отправлено в Telegram: {msg[:50]}...")
+                return True
+            except RetryAfter as e:
+                retry_after = getattr(e.retry_after, 'total_seconds', lambda: e.retry_after)()
+                logger.warning(f"[Telegram] Лимит сообщений, повтор через {retry_after} с")
+                await asyncio.sleep(float(retry_after))
+            except (TimedOut, NetworkError) as e:
+                logger.warning(f"[Telegram] Сетевая ошибка (попытка {attempt}): {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+            except Exception as e:
+                logger.error(f"[Telegram] Ошибка отправки сообщения: {e}", exc_info=True)
+                return False
+        logger.error("[Telegram] Сообщение не отправлено после %d попыток", self.max_retries)
+        return False
+
+
+# Склеивает сообщения пачки, не превышая лимит длины одного сообщения Telegram
+def _pack(messages, limit=TELEGRAM_MAX_LENGTH):
+    packed = []
+    current = ""
+    for msg in messages:
+        msg = msg[:limit]
+        if current and len(current) + 2 + len(msg) > limit:
+            packed.append(current)
+            current = msg
+        else:
+            current = f"{current}\n\n{msg}" if current else msg
+    if current:
+        packed.append(current)
+    return packed
+
 
-    # Для совместимости с синхронным кодом
-    return lambda msg: asyncio.run(send_message(msg))
\ No newline at end of file
+def create_notifier(bot_token, chat_id, **kwargs):
+    return TelegramNotifier(bot_token, chat_id, **kwargs)
@@ -0,0 +1,153 @@
+import argparse
+import itertools
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from backtest import load_klines, simulate, summarize, merge_signals, interval_ms
+from strategy import (
+    DEFAULT_PARAMS, calculate_indicators, rsi_macd_signals_from, grid_signal_array, rolling_mean_array
+)
+
+# === Перебор параметров стратегий на всех ядрах ===
+# Цены один раз пишутся в .npy и открываются воркерами через memory-map,
+# поэтому в задачу уходит только словарь параметров, а не массивы.
+#   python optimizer.py klines.csv --rsi-buy 20,25,30 --rsi-sell 70,75,80 --grid-size 30,50,100
+
+METRICS = {
+    'pnl': lambda s: s['pnl'],
+    'profit_factor': lambda s: s['profit_factor'],
+    'win_rate': lambda s: s['win_rate'],
+    'calmar': lambda s: s['pnl'] / s['max_drawdown'] if s['max_drawdown'] else s['pnl'],
+}
+
+_worker = {}
+
+
+def _init_worker(path, interval, backtest_kwargs):
+    # (times, High, Low, Close) без копирования; asarray убирает накладные расходы подкласса memmap
+    data = np.asarray(np.load(path, mmap_mode='r'))
+    _worker['times'] = data[0].astype(np.int64)
+    _worker['high'], _worker['low'], _worker['close'] = data[1], data[2], data[3]
+    _worker['bar_ms'] = interval_ms(interval, _worker['times'])
+    _worker['kwargs'] = backtest_kwargs
+    _indicators.cache_clear()
+    _grid_average.cache_clear()
+
+
+# Индикаторы зависят только от окон — пороги перебираются поверх закэшированных массивов
+@lru_cache(maxsize=8)
+def _indicators(window, fast, slow, signal):
+    df = calculate_indicators(pd.DataFrame({'Close': _worker['close']}), window, fast, slow, signal)
+    return df['rsi'].to_numpy(), df['macd_line'].to_numpy(), df['signal_line'].to_numpy()
+
+
+@lru_cache(maxsize=8)
+def _grid_average(grid_size):
+    return rolling_mean_array(np.asarray(_worker['close']), grid_size)
+
+
+def evaluate(params):
+    rsi, macd, signal = _indicators(params['rsi_window'], params['macd_fast'], params['macd_slow'], params['macd_signal'])
+    signals = merge_signals(
+        rsi_macd_signals_from(rsi, macd, signal, params),
+        grid_signal_array(_worker['close'], params, avg_price=_grid_average(params['grid_size']))
+    )
+    trades = simulate(
+        _worker['times'], _worker['high'], _worker['low'], _worker['close'], signals,
+        _worker['bar_ms'], **_worker['kwargs']
+    )
+    pnl = np.array([t[6] for t in trades], dtype=np.float64)
+    fees = np.array([t[7] for t in trades], dtype=np.float64)
+    return params, summarize(pnl, fees)
+
+
+def parameter_grid(space):
+    keys = list(DEFAULT_PARAMS)
+    combos = []
+    for values in itertools.product(*(space.get(k, [DEFAULT_PARAMS[k]]) for k in keys)):
+        params = dict(zip(keys, values))
+        if params['macd_fast'] >= params['macd_slow'] or params['rsi_buy'] >= params['rsi_sell']:
+            continue
+        combos.append(params)
+    # Соседние задачи с одинаковыми окнами попадают в один воркер и используют кэш индикаторов
+    combos.sort(key=lambda p: (p['rsi_window'], p['macd_fast'], p['macd_slow'], p['macd_signal'], p['grid_size']))
+    return combos
+
+
+def optimize(df, space, interval='3m', workers=None, metric='pnl', min_trades=10, **backtest_kwargs):
+    combos = parameter_grid(space)
+    workers = workers or os.cpu_count()
+
+    times = df.index.as_unit('ms').asi8 if isinstance(df.index, pd.DatetimeIndex) else df.index.to_numpy()
+    packed = np.vstack([times.astype(np.float64), df['High'], df['Low'], df['Close']])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'klines.npy')
+        np.save(path, packed)
+        del packed
+
+        chunksize = max(1, len(combos) // (workers * 8))
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(path, interval, backtest_kwargs)) as pool:
+            results = list(pool.map(evaluate, combos, chunksize=chunksize))
+
+    score = METRICS[metric]
+    ranked = sorted(
+        (r for r in results if r[1]['trades'] >= min_trades),
+        key=lambda r: score(r[1]),
+        reverse=True
+    )
+    return [{'params': p, 'stats': s, 'score': score(s)} for p, s in ranked]
+
+
+def _parse_values(text):
+    values = [float(v) for v in text.split(',')]
+    return [int(v) if v.is_integer() else v for v in values]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перебор параметров стратегий RSI+MACD и сетки")
+    parser.add_argument('path', help="CSV (формат Binance), Parquet или каталог kline_store со свечами")
+    parser.add_argument('--interval', default='3m')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--metric', choices=sorted(METRICS), default='pnl')
+    parser.add_argument('--min-trades', type=int, default=10)
+    parser.add_argument('--fee', type=float, default=0.0004)
+    parser.add_argument('--top', type=int, default=20, help="сколько лучших результатов сохранить")
+    parser.add_argument('--out', default='strategy_params.json', help="файл с параметрами для бота")
+    for key, default in DEFAULT_PARAMS.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=_parse_values, default=None,
+                            help=f"значения через запятую (по умолчанию {default})")
+    args = parser.parse_args()
+
+    space = {key: getattr(args, key) for key in DEFAULT_PARAMS if getattr(args, key) is not None}
+    df = load_klines(args.path)
+    print(f"✅ Загружено {len(df)} свечей | Комбинаций: {len(parameter_grid(space))}")
+
+    started = time.perf_counter()
+    ranked = optimize(df, space, args.interval, args.workers, args.metric, args.min_trades, fee=args.fee)
+    print(f"⏱ Перебор выполнен за {time.perf_counter() - started:.1f} с")
+
+    if not ranked:
+        print("❌ Ни одна комбинация не набрала минимальное число сделок")
+        raise SystemExit(1)
+
+    for place, result in enumerate(ranked[:5], 1):
+        stats = result['stats']
+        print(f"{place}. {args.metric}={result['score']:.4f} | сделок {stats['trades']} | PnL {stats['pnl']:.2f}$ | {result['params']}")
+
+    with open(args.out, 'w') as f:
+        json.dump({
+            'best': ranked[0]['params'],
+            'metric': args.metric,
+            'data': os.path.abspath(args.path),
+            'interval': args.interval,
+            'results': ranked[:args.top],
+        }, f, indent=2)
+    print(f"💾 Лучшие параметры сохранены в {args.out}")
@@ -0,0 +1,240 @@
+import asyncio
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+
+from execution import REQUEST_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# === Локальный стакан L2: REST-снимок + поток @depth@100ms ===
+# Порядок синхронизации по документации Binance Futures:
+#   1. события потока копятся в буфер;
+#   2. GET /fapi/v1/depth → lastUpdateId;
+#   3. события с u < lastUpdateId отбрасываются, первое применяемое — с U <= lastUpdateId <= u;
+#   4. дальше у каждого события pu должен совпадать с u предыдущего, иначе — пропуск и новый снимок.
+# Уровни хранятся в отсортированных массивах array('d'): вставка/удаление — bisect + сдвиг,
+# стоимость исполнения и поиск крупной заявки — проход по нескольким соседним уровням.
+
+BUY = 'buy'
+SELL = 'sell'
+
+
+class BookSide:
+    __slots__ = ('prices', 'quantities')
+
+    def __init__(self):
+        self.prices = array('d')       # по возрастанию цены
+        self.quantities = array('d')
+
+    def __len__(self):
+        return len(self.prices)
+
+    def load(self, levels):
+        levels = sorted((float(p), float(q)) for p, q in levels if float(q) > 0)
+        self.prices = array('d', [p for p, _ in levels])
+        self.quantities = array('d', [q for _, q in levels])
+
+    def set(self, price, quantity):
+        prices = self.prices
+        i = bisect_left(prices, price)
+        if i < len(prices) and prices[i] == price:
+            if quantity:
+                self.quantities[i] = quantity
+            else:
+                del prices[i]
+                del self.quantities[i]
+        elif quantity:
+            prices.insert(i, price)
+            self.quantities.insert(i, quantity)
+
+    # Индексы уровней в окне [low, high]
+    def window(self, low, high):
+        return bisect_left(self.prices, low), bisect_right(self.prices, high)
+
+
+class OrderBook:
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.bids = BookSide()   # лучшая цена — последняя
+        self.asks = BookSide()   # лучшая цена — первая
+        self.last_update_id = 0
+        self.updated_ms = 0
+        self.loaded = False      # снимок загружен и поток применяется без пропусков
+        self._first = True       # первое событие после снимка проверяется по U <= lastUpdateId <= u
+
+    def load_snapshot(self, snapshot):
+        self.bids.load(snapshot['bids'])
+        self.asks.load(snapshot['asks'])
+        self.last_update_id = int(snapshot['lastUpdateId'])
+        self.updated_ms = int(snapshot.get('E') or snapshot.get('T') or 0)
+        self.loaded = True
+        self._first = True
+
+    def reset(self):
+        self.loaded = False
+
+    # False — пропуск в последовательности, стакан нужно загрузить заново
+    def apply(self, update):
+        if update.final_id < self.last_update_id:
+            return True   # событие старше снимка
+        if self._first:
+            if not update.first_id <= self.last_update_id <= update.final_id:
+                return False
+            self._first = False
+        elif update.prev_final_id != self.last_update_id:
+            return False
+        for price, quantity in update.bids:
+            self.bids.set(price, quantity)
+        for price, quantity in update.asks:
+            self.asks.set(price, quantity)
+        self.last_update_id = update.final_id
+        self.updated_ms = update.time
+        return True
+
+    # === Запросы ===
+    @property
+    def best_bid(self):
+        return self.bids.prices[-1] if self.bids.prices else None
+
+    @property
+    def best_ask(self):
+        return self.asks.prices[0] if self.asks.prices else None
+
+    @property
+    def mid(self):
+        if not self.bids.prices or not self.asks.prices:
+            return None
+        return (self.bids.prices[-1] + self.asks.prices[0]) / 2
+
+    @property
+    def spread(self):
+        if not self.bids.prices or not self.asks.prices:
+            return None
+        return self.asks.prices[0] - self.bids.prices[-1]
+
+    # Рыночный ордер side на quantity: средняя цена, стоимость, сколько исполнится, худшая цена
+    # и проскальзывание средней цены от середины стакана (доля, положительное — против нас)
+    def cost_to_fill(self, side, quantity):
+        book_side = self.asks if side == BUY else self.bids
+        prices, quantities = book_side.prices, book_side.quantities
+        indexes = range(len(prices)) if side == BUY else range(len(prices) - 1, -1, -1)
+        remaining, cost, worst = quantity, 0.0, None
+        for i in indexes:
+            take = min(remaining, quantities[i])
+            cost += take * prices[i]
+            remaining -= take
+            worst = prices[i]
+            if remaining <= 0:
+                break
+        filled = quantity - max(remaining, 0.0)
+        if not filled:
+            return {'avg_price': None, 'cost': 0.0, 'filled': 0.0, 'worst_price': None, 'slippage': None}
+        avg_price = cost / filled
+        mid = self.mid or avg_price
+        slippage = avg_price / mid - 1 if side == BUY else 1 - avg_price / mid
+        return {'avg_price': avg_price, 'cost': cost, 'filled': filled, 'worst_price': worst, 'slippage': slippage}
+
+    # Самый крупный уровень (обе стороны) в пределах price ± width: (цена, количество) или None
+    def largest_level(self, price, width):
+        best = None
+        for book_side in (self.bids, self.asks):
+            lo, hi = book_side.window(price - width, price + width)
+            if lo < hi:
+                quantities, prices = book_side.quantities, book_side.prices
+                # При равном объёме — ближайший к price уровень
+                i = max(range(lo, hi), key=lambda j: (quantities[j], -abs(prices[j] - price)))
+                if best is None or quantities[i] > best[1]:
+                    best = (book_side.prices[i], quantities[i])
+        return best
+
+    # Уровень сетки переносится на ближайшую «стену» ликвидности, если она есть рядом
+    def snap(self, price, width):
+        level = self.largest_level(price, width)
+        return price if level is None else level[0]
+
+    # Объём заявок на стороне в пределах fraction от лучшей цены
+    def depth_within(self, side, fraction):
+        if side == BUY:
+            best = self.best_ask
+            if best is None:
+                return 0.0
+            lo, hi = self.asks.window(best, best * (1 + fraction))
+            return sum(self.asks.quantities[lo:hi])
+        best = self.best_bid
+        if best is None:
+            return 0.0
+        lo, hi = self.bids.window(best * (1 - fraction), best)
+        return sum(self.bids.quantities[lo:hi])
+
+
+# === Стаканы по символам: буфер, снимок, пересинхронизация ===
+class OrderBookManager:
+    def __init__(self, gateway, symbols, limit=1000, max_buffer=5000, retry_delay=1.0):
+        self.gateway = gateway
+        self.limit = limit
+        self.max_buffer = max_buffer
+        self.retry_delay = retry_delay
+        self.books = {symbol: OrderBook(symbol) for symbol in symbols}
+        self._buffers = {symbol: [] for symbol in symbols}
+        self._resyncs = {}
+        self.gaps = 0
+        self.snapshots = 0
+
+    # Стакан символа, только если он синхронизирован
+    def get(self, symbol):
+        book = self.books.get(symbol)
+        return book if book is not None and book.loaded else None
+
+    def on_depth(self, update):
+        book = self.books.get(update.symbol)
+        if book is None:
+            return
+        if book.loaded:
+            if book.apply(update):
+                return
+            self.gaps += 1
+            logger.warning("⚠️ Стакан %s: пропуск событий (pu=%d, ожидали %d) — загружаем заново",
+                           update.symbol, update.prev_final_id, book.last_update_id)
+            book.reset()
+        buffer = self._buffers[update.symbol]
+        buffer.append(update)
+        if len(buffer) > self.max_buffer:
+            del buffer[:-self.max_buffer]
+        self._schedule(update.symbol)
+
+    def _schedule(self, symbol):
+        task = self._resyncs.get(symbol)
+        if task is None or task.done():
+            self._resyncs[symbol] = asyncio.create_task(self._resync(symbol), name=f'order-book-{symbol}')
+
+    async def _resync(self, symbol):
+        book = self.books[symbol]
+        buffer = self._buffers[symbol]
+        while not book.loaded:
+            try:
+                snapshot = await self.gateway.depth(symbol, self.limit)
+            except REQUEST_ERRORS as e:
+                logger.error("❌ Снимок стакана %s: %s", symbol, e)
+                await asyncio.sleep(self.retry_delay)
+                continue
+            self.snapshots += 1
+            book.load_snapshot(snapshot)
+            # Снимок и буфер применяются без await — новые события не вклиниваются
+            pending, buffer[:] = list(buffer), []
+            if all(book.apply(update) for update in pending):
+                logger.info("📚 Стакан %s загружен: %d bid / %d ask", symbol, len(book.bids), len(book.asks))
+                return
+            book.reset()
+            # Снимок старше буфера — события пригодятся следующему снимку, старые он отбросит сам
+            buffer[:0] = pending
+            del buffer[:-self.max_buffer]
+            logger.warning("⚠️ Стакан %s: снимок не стыкуется с потоком, повтор", symbol)
+            await asyncio.sleep(self.retry_delay)
+
+    def metrics(self):
+        return {
+            symbol: {'loaded': book.loaded, 'bids': len(book.bids), 'asks': len(book.asks),
+                     'last_update_id': book.last_update_id}
+            for symbol, book in self.books.items()
+        }
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+
+from execution import REQUEST_ERRORS, ExchangeAPIError
+from metrics import kline_trace, now_ms, observe_stage
+
+logger = logging.getLogger(__name__)
+
+# === Управление ордерами пакетами ===
+# Вход по рынку — POST /fapi/v1/order, после его подтверждения защитные TP/SL — одним
+# POST /fapi/v1/batchOrders: ноги пакета биржа исполняет не по порядку, и reduceOnly,
+# отправленный вместе со входом, отклоняется (-2022) — позиции ещё нет.
+# Отмена — одним DELETE /fapi/v1/allOpenOrders или DELETE /fapi/v1/batchOrders.
+# Ответ пакета — список той же длины, где на месте отклонённого ордера стоит {"code", "msg"},
+# поэтому частичные отказы разбираются по каждой ноге отдельно.
+
+BATCH_CANCEL_MAX = 10   # orderId в одной пакетной отмене
+UNKNOWN_ORDER = -2011   # ордер уже исполнен или отменён
+
+
+class BracketError(Exception):
+    def __init__(self, message, entry=None, errors=None):
+        super().__init__(message)
+        self.entry = entry          # ордер входа, если он прошёл
+        self.errors = errors or {}  # нога → ответ или исключение
+
+
+def _rejected(result):
+    return 'code' in result and 'orderId' not in result
+
+
+class OrderManager:
+    def __init__(self, gateway):
+        self.gateway = gateway
+
+    # Возвращает ордер входа, защитные ордера и задержку запросов в миллисекундах.
+    # Если вход отклонён — поднимает BracketError без других запросов; если не встала защита
+    # и повтор не помог — закрывает позицию по рынку и тоже поднимает BracketError.
+    async def place_bracket(self, symbol, side, quantity, take_profit, stop_loss):
+        exit_side = 'SELL' if side == 'BUY' else 'BUY'
+        started = time.perf_counter()
+        try:
+            entry = await self.gateway.create_order(symbol=symbol, side=side, type='MARKET', quantity=quantity)
+        except ExchangeAPIError as e:
+            raise BracketError(f"вход {symbol} отклонён: {e.message}", errors={'entry': e}) from e
+        latencies = {'entry': (time.perf_counter() - started) * 1000}
+        trace = kline_trace.get()
+        if trace is not None:
+            # Полный путь: закрытие свечи на бирже → подтверждение входа
+            acked = now_ms()
+            observe_stage('close_to_entry_ack', acked - trace['close_ms'])
+            observe_stage('receive_to_entry_ack', acked - trace['recv_ms'])
+
+        legs = {
+            # batchOrders не принимает closePosition, поэтому защита — reduceOnly на объём входа;
+            # оставшуюся ногу после срабатывания другой отменяет cancel_siblings
+            'take_profit': {'symbol': symbol, 'side': exit_side, 'type': 'TAKE_PROFIT_MARKET',
+                            'stopPrice': take_profit, 'quantity': quantity, 'reduceOnly': 'true'},
+            'stop_loss': {'symbol': symbol, 'side': exit_side, 'type': 'STOP_MARKET',
+                          'stopPrice': stop_loss, 'quantity': quantity, 'reduceOnly': 'true'},
+        }
+        started = time.perf_counter()
+        try:
+            results, latency = await self.gateway.batch_orders(list(legs.values()))
+        except REQUEST_ERRORS as e:
+            # Вход уже исполнен: пакет целиком не прошёл — каждая нога идёт тем же путём, что и
+            # отклонённая в пакете (отдельный повтор, затем закрытие позиции)
+            results, latency = [{'code': None, 'msg': str(e)}] * len(legs), (time.perf_counter() - started) * 1000
+        latencies['protection'] = latency
+        results = dict(zip(legs, results))
+
+        brackets, errors = [], {}
+        for name, result in results.items():
+            if _rejected(result):
+                logger.warning("⚠️ %s %s отклонён (%s), повторяем отдельно", symbol, name, result.get('msg'))
+                try:
+                    result = await self.gateway.create_order(**legs[name])
+                except REQUEST_ERRORS as e:
+                    errors[name] = e
+                    continue
+            brackets.append(result)
+
+        if errors:
+            # Позиция без защиты хуже, чем отсутствие позиции
+            logger.error("❌ Защита %s не выставлена (%s) — закрываем позицию", symbol, ", ".join(errors))
+            try:
+                await self.gateway.create_order(symbol=symbol, side=exit_side, type='MARKET',
+                                                quantity=quantity, reduceOnly='true')
+            except REQUEST_ERRORS as e:
+                errors['flatten'] = e
+                raise BracketError(f"‼️ позиция {symbol} открыта без защиты: {e}", entry=entry, errors=errors) from e
+            if brackets:
+                await self.cancel_orders(symbol, brackets)
+            raise BracketError(f"защита {symbol} не выставлена, позиция закрыта", entry=entry, errors=errors)
+
+        return entry, brackets, latencies
+
+    # Сработал TP или SL — вторая reduceOnly-нога больше ничего не защищает и блокировала бы
+    # новые входы (has_active_orders). remaining — защитные ордера символа, ещё открытые в кэше.
+    async def cancel_siblings(self, symbol, remaining):
+        if not remaining:
+            return [], []
+        logger.info("🧹 %s: защита сработала, отменяем %d оставшихся ног", symbol, len(remaining))
+        return await self.cancel_orders(symbol, remaining)
+
+    # Отменяет orders (в формате кэша ордеров). cancel_all=True — одним запросом все открытые
+    # ордера символа; вызывающий решает, что среди них нет чужих. Возвращает (отменённые, отказы):
+    # отменённые — ордера со статусом CANCELED для кэша, отказы — пары (ордер, ответ биржи).
+    async def cancel_orders(self, symbol, orders, cancel_all=False):
+        if not orders:
+            return [], []
+        if cancel_all:
+            await self.gateway.cancel_all_open_orders(symbol)
+            return [dict(order, status='CANCELED') for order in orders], []
+
+        chunks = [orders[i:i + BATCH_CANCEL_MAX] for i in range(0, len(orders), BATCH_CANCEL_MAX)]
+        responses = await asyncio.gather(*(
+            self.gateway.cancel_orders(symbol, [order['orderId'] for order in chunk]) for chunk in chunks
+        ))
+        canceled, failed = [], []
+        for chunk, results in zip(chunks, responses):
+            for order, result in zip(chunk, results):
+                if not _rejected(result):
+                    canceled.append(result)
+                elif result.get('code') == UNKNOWN_ORDER:
+                    # Ордера на бирже уже нет — из кэша его тоже убираем
+                    canceled.append(dict(order, status='CANCELED'))
+                else:
+                    failed.append((order, result))
+        return canceled, failed
@@ -0,0 +1,96 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROTECTIVE_TYPES = ('TAKE_PROFIT_MARKET', 'STOP_MARKET')
+OPEN_STATUSES = ('NEW', 'PARTIALLY_FILLED')
+
+
+# === Локальное состояние наших ордеров и позиций ===
+# Обновляется событиями user-data stream (ORDER_TRADE_UPDATE / ACCOUNT_UPDATE),
+# REST используется только для сверки после (пере)подключения.
+class OrderStateCache:
+    def __init__(self):
+        self.orders = {}        # orderId → ордер (только открытые)
+        self.positions = {}     # symbol → размер позиции (знак = сторона)
+        self.entry_prices = {}  # symbol → цена входа
+        self.synced = False
+
+    # === Сверка по REST ===
+    def reconcile(self, orders, positions):
+        self.orders = {}
+        for order in orders:
+            self.apply_order(order)
+        for pos in positions:
+            self._set_position(pos['symbol'], float(pos['positionAmt']), float(pos['entryPrice']))
+        self.synced = True
+        logger.info("🔄 Состояние сверено: %d открытых ордеров", len(self.orders))
+
+    # Ордер в формате REST (ответ futures_create_order / openOrders)
+    def apply_order(self, order):
+        order_id = order['orderId']
+        if order['status'] in OPEN_STATUSES:
+            self.orders[order_id] = {
+                'orderId': order_id,
+                'symbol': order['symbol'],
+                'side': order['side'],
+                'type': order['type'],
+                'status': order['status'],
+                'price': order.get('price', '0'),
+                'stopPrice': order.get('stopPrice', '0'),
+            }
+        else:
+            self.orders.pop(order_id, None)
+
+    # === События user-data stream ===
+    # Возвращает список символов, состояние которых изменилось
+    def apply_event(self, event):
+        event_type = event.get('e')
+        if event_type == 'ORDER_TRADE_UPDATE':
+            o = event['o']
+            self.apply_order({
+                'orderId': o['i'],
+                'symbol': o['s'],
+                'side': o['S'],
+                'type': o['o'],
+                'status': o['X'],
+                'price': o.get('p', '0'),
+                'stopPrice': o.get('sp', '0'),
+            })
+            return [o['s']]
+        if event_type == 'ACCOUNT_UPDATE':
+            symbols = []
+            for pos in event.get('a', {}).get('P', []):
+                self._set_position(pos['s'], float(pos['pa']), float(pos['ep']))
+                symbols.append(pos['s'])
+            return symbols
+        return []
+
+    def _set_position(self, symbol, amount, entry_price):
+        if amount:
+            self.positions[symbol] = amount
+            self.entry_prices[symbol] = entry_price
+        else:
+            self.positions.pop(symbol, None)
+            self.entry_prices.pop(symbol, None)
+
+    # === Запросы без сетевых вызовов ===
+    def open_orders(self, symbol, types=None):
+        return [
+            o for o in self.orders.values()
+            if o['symbol'] == symbol and (types is None or o['type'] in types)
+        ]
+
+    def has_active_orders(self, symbol):
+        return any(o['symbol'] == symbol and o['type'] in PROTECTIVE_TYPES for o in self.orders.values())
+
+    def position_side(self, symbol):
+        amount = self.positions.get(symbol, 0.0)
+        if amount > 0:
+            return 'long'
+        if amount < 0:
+            return 'short'
+        return None
+
+    def entry_price(self, symbol):
+        return self.entry_prices.get(symbol, 0.0)
@@ -0,0 +1,495 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import logging
+import time
+
+from execution import ExchangeAPIError
+from kline_codec import Kline
+from rate_limit import LOW, RateLimitGovernor
+
+logger = logging.getLogger(__name__)
+
+# === Бумажная торговля: симулятор USDT-M Futures в процессе ===
+# Ордеры исполняются по потоку свечей (живому или из записи): MARKET — по последней цене
+# с проскальзыванием, TAKE_PROFIT_MARKET / STOP_MARKET — когда high/low свечи достигли стопа.
+# Если в одной свече задеты и TP, и SL, первым считается SL (худший случай).
+# Режим позиции — односторонний (BOTH), комиссия тейкера списывается с баланса.
+#   PaperGateway    — вместо AsyncFuturesGateway (bot.py, PAPER_TRADING=1)
+#   PaperClient     — вместо BinanceClient: futures_* и get_klines
+#   PaperUserStream — вместо BinanceUserDataStream: события ORDER_TRADE_UPDATE / ACCOUNT_UPDATE
+#   python paper_exchange.py --symbol BTCUSDT --interval 1m --days 1 — прогон бота по истории
+
+TAKER_FEE = 0.0004        # 0.04%
+SLIPPAGE = 0.0001         # 0.01% против нас на рыночном исполнении
+CONDITIONAL_TYPES = ('TAKE_PROFIT_MARKET', 'STOP_MARKET')
+
+
+def _reject(code, msg, status=400):
+    return ExchangeAPIError(status, json.dumps({'code': code, 'msg': msg}))
+
+
+def _flag(value):
+    return value is True or str(value).lower() == 'true'
+
+
+class PaperExchange:
+    def __init__(self, balance=10_000.0, fee_rate=TAKER_FEE, slippage=SLIPPAGE, asset='USDT'):
+        self.asset = asset
+        self.wallet = float(balance)
+        self.fee_rate = fee_rate
+        self.slippage = slippage
+        self.orders = {}            # orderId → ордер в формате REST
+        self.positions = {}         # symbol → [размер со знаком, цена входа]
+        self.prices = {}            # symbol → последняя цена
+        self.klines = {}            # (symbol, interval) → закрытые свечи в формате get_klines
+        self.listeners = []         # получатели событий user data stream
+        self.now_ms = 0             # часы биржи идут по времени свечей
+        self.fees_paid = 0.0
+        self.realized_pnl = 0.0
+        self.trades = 0
+        self._ids = itertools.count(1)
+
+    # Часы для bot.Trader(clock=...): при прогоне по истории время идёт по свечам
+    def time(self):
+        return self.now_ms / 1000
+
+    # === Поток цен ===
+    def on_kline(self, kline):
+        self.now_ms = max(self.now_ms, kline.close_time if kline.closed else kline.open_time)
+        self._trigger(kline.symbol, kline.open, kline.high, kline.low)
+        self.prices[kline.symbol] = kline.close
+        if kline.closed:
+            self.klines.setdefault((kline.symbol, kline.interval), []).append([
+                kline.open_time, str(kline.open), str(kline.high), str(kline.low), str(kline.close),
+                str(kline.volume), kline.close_time,
+            ])
+
+    def on_price(self, symbol, price, time_ms=None):
+        if time_ms is not None:
+            self.now_ms = max(self.now_ms, time_ms)
+        self._trigger(symbol, price, price, price)
+        self.prices[symbol] = price
+
+    def _trigger(self, symbol, open_price, high, low):
+        pending = [o for o in self.orders.values()
+                   if o['symbol'] == symbol and o['status'] == 'NEW' and o['type'] in CONDITIONAL_TYPES]
+        if not pending:
+            return
+        # Стоп-лоссы раньше тейк-профитов: в пределах свечи порядок high/low неизвестен
+        pending.sort(key=lambda o: o['type'] != 'STOP_MARKET')
+        for order in pending:
+            if order['status'] != 'NEW':
+                continue   # уже исполнен или снят предыдущим ордером этой свечи
+            stop = float(order['stopPrice'])
+            # Цена идёт вверх к стопу: BUY STOP (шорт) и SELL TP (лонг); вниз — наоборот
+            rising = (order['side'] == 'BUY') == (order['type'] == 'STOP_MARKET')
+            if rising and high >= stop:
+                self._execute(order, max(stop, open_price))
+            elif not rising and low <= stop:
+                self._execute(order, min(stop, open_price))
+
+    # === Ордеры ===
+    def create_order(self, symbol=None, side=None, type=None, quantity=None, stopPrice=None,
+                     reduceOnly=None, closePosition=None, **params):
+        if not symbol or side not in ('BUY', 'SELL') or not type:
+            raise _reject(-1102, "Mandatory parameter was not sent, was empty/null, or malformed.")
+        if type not in ('MARKET',) + CONDITIONAL_TYPES:
+            raise _reject(-1116, f"Invalid orderType: {type}")
+        close_position = _flag(closePosition)
+        if not close_position and not quantity:
+            raise _reject(-1102, "Mandatory parameter 'quantity' was not sent.")
+        if type in CONDITIONAL_TYPES and not stopPrice:
+            raise _reject(-1102, "Mandatory parameter 'stopPrice' was not sent.")
+        if symbol not in self.prices:
+            raise _reject(-1121, "Invalid symbol.")
+
+        order = {
+            'orderId': next(self._ids),
+            'symbol': symbol,
+            'side': side,
+            'type': type,
+            'price': '0',
+            'stopPrice': str(stopPrice or '0'),
+            'origQty': str(quantity or '0'),
+            'executedQty': '0',
+            'avgPrice': '0',
+            'reduceOnly': _flag(reduceOnly) or close_position,
+            'closePosition': close_position,
+            'status': 'NEW',
+            'updateTime': self.now_ms,
+        }
+        if type in CONDITIONAL_TYPES:
+            stop = float(order['stopPrice'])
+            price = self.prices[symbol]
+            rising = (side == 'BUY') == (type == 'STOP_MARKET')
+            if (rising and price >= stop) or (not rising and price <= stop):
+                raise _reject(-2021, "Order would immediately trigger.")
+            self.orders[order['orderId']] = order
+            self._emit_order(order)
+            return dict(order)
+
+        if order['reduceOnly'] and not self._reducible(order):
+            raise _reject(-2022, "ReduceOnly Order is rejected.")
+        self.orders[order['orderId']] = order
+        self._execute(order, self.prices[symbol])
+        return dict(order)
+
+    # Объём, на который ордер может уменьшить позицию; 0 — уменьшать нечего
+    def _reducible(self, order):
+        amount = self.positions.get(order['symbol'], (0.0, 0.0))[0]
+        if (order['side'] == 'SELL' and amount <= 0) or (order['side'] == 'BUY' and amount >= 0):
+            return 0.0
+        if order['closePosition']:
+            return abs(amount)
+        return min(abs(amount), float(order['origQty']))
+
+    def _execute(self, order, price):
+        quantity = self._reducible(order) if order['reduceOnly'] else float(order['origQty'])
+        if quantity <= 0:
+            order['status'] = 'EXPIRED'
+            order['updateTime'] = self.now_ms
+            self._emit_order(order)
+            return
+        price *= 1 + self.slippage if order['side'] == 'BUY' else 1 - self.slippage
+        fee = quantity * price * self.fee_rate
+        realized = self._fill(order['symbol'], quantity if order['side'] == 'BUY' else -quantity, price)
+        self.wallet += realized - fee
+        self.fees_paid += fee
+        self.realized_pnl += realized
+        self.trades += 1
+
+        order.update(status='FILLED', executedQty=f"{quantity:.8f}".rstrip('0').rstrip('.'),
+                     avgPrice=f"{price:.8f}", updateTime=self.now_ms)
+        self._emit_order(order, last_price=price, last_qty=quantity, fee=fee, realized=realized)
+        self._emit_account(order['symbol'])
+        if order['symbol'] not in self.positions:
+            self._expire_close_position(order['symbol'])
+
+    # Возвращает реализованный PnL
+    def _fill(self, symbol, signed_qty, price):
+        amount, entry = self.positions.get(symbol, (0.0, 0.0))
+        realized = 0.0
+        if amount == 0 or (amount > 0) == (signed_qty > 0):
+            new_amount = amount + signed_qty
+            entry = (abs(amount) * entry + abs(signed_qty) * price) / abs(new_amount)
+        else:
+            closing = min(abs(signed_qty), abs(amount))
+            realized = closing * (price - entry) * (1 if amount > 0 else -1)
+            new_amount = amount + signed_qty
+            if (new_amount > 0) != (amount > 0) and abs(new_amount) > 1e-12:
+                entry = price   # разворот: остаток открыт по цене сделки
+        if abs(new_amount) < 1e-12:
+            self.positions.pop(symbol, None)
+        else:
+            self.positions[symbol] = (new_amount, entry)
+        return realized
+
+    # Позиция закрыта — биржа сама снимает только ордера closePosition. reduceOnly-ноги остаются
+    # открытыми, как на Binance: их отменяет бот (cancel_siblings), сработавшая без позиции — EXPIRED
+    def _expire_close_position(self, symbol):
+        for order in self.orders.values():
+            if order['symbol'] == symbol and order['status'] == 'NEW' and order['closePosition']:
+                order['status'] = 'EXPIRED'
+                order['updateTime'] = self.now_ms
+                self._emit_order(order)
+
+    def cancel_order(self, symbol, order_id):
+        order = self.orders.get(int(order_id))
+        if order is None or order['symbol'] != symbol or order['status'] != 'NEW':
+            raise _reject(-2011, "Unknown order sent.")
+        order['status'] = 'CANCELED'
+        order['updateTime'] = self.now_ms
+        self._emit_order(order)
+        return dict(order)
+
+    def cancel_all_open_orders(self, symbol):
+        for order in list(self.orders.values()):
+            if order['symbol'] == symbol and order['status'] == 'NEW':
+                self.cancel_order(symbol, order['orderId'])
+        return {'code': 200, 'msg': 'The operation of cancel all open order is done.'}
+
+    # === Запросы ===
+    def all_orders(self, symbol, limit=500):
+        return [dict(o) for o in self.orders.values() if o['symbol'] == symbol][-int(limit):]
+
+    def open_orders(self, symbol=None):
+        return [dict(o) for o in self.orders.values() if o['status'] == 'NEW' and symbol in (None, o['symbol'])]
+
+    def position_information(self, symbol=None):
+        symbols = [symbol] if symbol else sorted(set(self.prices) | set(self.positions))
+        result = []
+        for s in symbols:
+            amount, entry = self.positions.get(s, (0.0, 0.0))
+            price = self.prices.get(s, entry)
+            result.append({
+                'symbol': s, 'positionSide': 'BOTH', 'positionAmt': str(amount), 'entryPrice': str(entry),
+                'markPrice': str(price), 'unRealizedProfit': str(amount * (price - entry)),
+            })
+        return result
+
+    def unrealized_pnl(self):
+        return sum(amount * (self.prices.get(s, entry) - entry) for s, (amount, entry) in self.positions.items())
+
+    def account_balance(self):
+        return [{'asset': self.asset, 'balance': str(self.wallet),
+                 'availableBalance': str(self.wallet + min(0.0, self.unrealized_pnl())),
+                 'crossUnPnl': str(self.unrealized_pnl())}]
+
+    def get_klines(self, symbol, interval, startTime=None, endTime=None, limit=500):
+        rows = self.klines.get((symbol, interval), [])
+        rows = [r for r in rows if (startTime is None or r[0] >= startTime) and (endTime is None or r[0] <= endTime)]
+        return rows[:limit]
+
+    # === События user data stream ===
+    def _emit(self, event):
+        for listener in self.listeners:
+            listener(event)
+
+    def _emit_order(self, order, last_price=0.0, last_qty=0.0, fee=0.0, realized=0.0):
+        if not self.listeners:
+            return
+        self._emit({'e': 'ORDER_TRADE_UPDATE', 'E': self.now_ms, 'T': self.now_ms, 'o': {
+            's': order['symbol'], 'i': order['orderId'], 'S': order['side'], 'o': order['type'],
+            'X': order['status'], 'x': 'TRADE' if order['status'] == 'FILLED' else order['status'],
+            'p': order['price'], 'sp': order['stopPrice'], 'q': order['origQty'], 'z': order['executedQty'],
+            'ap': order['avgPrice'], 'L': str(last_price), 'l': str(last_qty), 'n': str(fee), 'N': self.asset,
+            'R': order['reduceOnly'], 'cp': order['closePosition'], 'rp': str(realized), 'T': self.now_ms,
+        }})
+
+    def _emit_account(self, symbol):
+        if not self.listeners:
+            return
+        amount, entry = self.positions.get(symbol, (0.0, 0.0))
+        self._emit({'e': 'ACCOUNT_UPDATE', 'E': self.now_ms, 'T': self.now_ms, 'a': {
+            'm': 'ORDER',
+            'B': [{'a': self.asset, 'wb': str(self.wallet), 'cw': str(self.wallet)}],
+            'P': [{'s': symbol, 'pa': str(amount), 'ep': str(entry), 'ps': 'BOTH'}],
+        }})
+
+    def summary(self):
+        return {
+            'balance': float(self.wallet),
+            'realized_pnl': float(self.realized_pnl),
+            'unrealized_pnl': float(self.unrealized_pnl()),
+            'fees': float(self.fees_paid),
+            'fills': self.trades,
+            'positions': {s: amount for s, (amount, _) in self.positions.items()},
+        }
+
+
+# === Замена AsyncFuturesGateway ===
+class PaperGateway:
+    def __init__(self, exchange, market_data=None):
+        self.exchange = exchange
+        self.market_data = market_data        # настоящий шлюз для свечей (догрузка после обрыва)
+        self.governor = RateLimitGovernor()   # для /metrics и /queues: у симулятора лимитов нет
+        self.coalesced = 0
+        self.last_latency_ms = {}
+
+    async def create_order(self, **params):
+        return self.exchange.create_order(**params)
+
+    async def cancel_order(self, symbol, order_id):
+        return self.exchange.cancel_order(symbol, order_id)
+
+    async def batch_orders(self, orders):
+        results = []
+        for params in orders:
+            try:
+                results.append(self.exchange.create_order(**params))
+            except ExchangeAPIError as e:
+                results.append({'code': e.code, 'msg': e.message})
+        return results, 0.0
+
+    async def cancel_orders(self, symbol, order_ids):
+        results = []
+        for order_id in order_ids:
+            try:
+                results.append(self.exchange.cancel_order(symbol, order_id))
+            except ExchangeAPIError as e:
+                results.append({'code': e.code, 'msg': e.message})
+        return results
+
+    async def cancel_all_open_orders(self, symbol):
+        return self.exchange.cancel_all_open_orders(symbol)
+
+    async def klines(self, symbol, interval, start_ms=None, end_ms=None, limit=1000, priority=LOW):
+        if self.market_data is not None:
+            return await self.market_data.klines(symbol, interval, start_ms, end_ms, limit, priority=priority)
+        return self.exchange.get_klines(symbol, interval, startTime=start_ms, endTime=end_ms, limit=limit)
+
+    async def get_all_orders(self, symbol, limit=50, priority=None):
+        return self.exchange.all_orders(symbol, limit)
+
+    async def get_open_orders(self, symbol=None, priority=None):
+        return self.exchange.open_orders(symbol)
+
+    async def position_information(self, symbol=None, priority=None):
+        return self.exchange.position_information(symbol)
+
+    async def account_balance(self, priority=None):
+        return self.exchange.account_balance()
+
+    async def new_listen_key(self):
+        return 'paper'
+
+    async def keepalive_listen_key(self):
+        pass
+
+    async def close_listen_key(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+# === Замена BinanceClient (то подмножество, которым пользуются bot.py и kline_store.py) ===
+# История свечей берётся у market_data (настоящий клиент — публичные данные без ключей),
+# а без него — из свечей, прошедших через симулятор.
+class PaperClient:
+    def __init__(self, exchange, market_data=None):
+        self.exchange = exchange
+        self.market_data = market_data
+        self.response = None
+
+    def futures_create_order(self, **params):
+        return self.exchange.create_order(**params)
+
+    def futures_cancel_order(self, symbol, orderId, **params):
+        return self.exchange.cancel_order(symbol, orderId)
+
+    def futures_get_all_orders(self, symbol, limit=500, **params):
+        return self.exchange.all_orders(symbol, limit)
+
+    def futures_get_open_orders(self, symbol=None, **params):
+        return self.exchange.open_orders(symbol)
+
+    def futures_position_information(self, symbol=None, **params):
+        return self.exchange.position_information(symbol)
+
+    def futures_account_balance(self, **params):
+        return self.exchange.account_balance()
+
+    def get_klines(self, **params):
+        if self.market_data is not None:
+            klines = self.market_data.get_klines(**params)
+            self.response = getattr(self.market_data, 'response', None)
+            return klines
+        return self.exchange.get_klines(**params)
+
+    futures_klines = get_klines
+
+
+# === Замена BinanceUserDataStream: события симулятора через очередь, как из WebSocket ===
+class PaperUserStream:
+    def __init__(self, exchange, callback, on_connect=None, on_disconnect=None):
+        self.exchange = exchange
+        self.callback = callback
+        self.on_connect = on_connect
+        self.on_disconnect = on_disconnect
+        self.connected = False
+        self._events = asyncio.Queue()
+
+    async def start(self):
+        self.exchange.listeners.append(self._events.put_nowait)
+        self.connected = True
+        logger.info("🔌 Бумажный user data stream подключён")
+        try:
+            if self.on_connect:
+                await self.on_connect()
+            while True:
+                await self.callback(await self._events.get())
+        finally:
+            self.exchange.listeners.remove(self._events.put_nowait)
+            self.connected = False
+            if self.on_disconnect:
+                self.on_disconnect()
+
+
+# === Прогон бота по истории из kline_store ===
+# Свечи подаются по порядку: сначала симулятор (срабатывание TP/SL), затем бот (индикаторы и стратегии).
+# Часами бота служит биржа (время свечей), чтобы паузы между сделками считались по истории.
+def replay(symbol, interval, start_ms, end_ms=None, balance=10_000.0, warmup=200, fee_rate=TAKER_FEE,
+           slippage=SLIPPAGE, store=None, quiet=True):
+    from headless import import_bot
+    from kline_store import KlineStore, INTERVAL_MS
+    from snapshot import SnapshotStore
+    from symbol_state import build_symbol_states
+    from trade_journal import TradeJournal
+
+    store = store or KlineStore()
+    bot = import_bot()
+    frame = store.load(symbol, interval, start_ms=start_ms - warmup * INTERVAL_MS[interval], end_ms=end_ms)
+    if frame.empty:
+        raise ValueError(f"Нет свечей {symbol} {interval} в {store.root} — сначала python kline_store.py")
+    times = frame.index.as_unit('ms').asi8
+    split = int((times < start_ms).sum())
+
+    exchange = PaperExchange(balance, fee_rate, slippage)
+    events = []
+    exchange.listeners.append(events.append)
+    states = build_symbol_states([symbol], [interval], capacity=max(warmup, 1000),
+                                 features=bot.strategy_registry.requirements())
+    states[symbol].seed(interval, frame.iloc[:split])
+    # Свой экземпляр бота: ордеры — бумажной бирже, часы — её время свечей,
+    # журнал сделок и снимки только в памяти
+    trader = bot.Trader(PaperGateway(exchange), states, bot.strategy_registry, notify=lambda message: None,
+                        clock=exchange, journal=TradeJournal(root=None), snapshots=SnapshotStore(root=None))
+    trader.order_cache.synced = True
+
+    step = INTERVAL_MS[interval]
+    rows = frame.iloc[split:][['Open', 'High', 'Low', 'Close', 'Volume']].to_numpy().tolist()
+
+    async def run():
+        for open_time, (o, h, l, c, v) in zip(times[split:], rows):
+            kline = Kline(symbol, interval, int(open_time), int(open_time) + step - 1, o, h, l, c, v, True)
+            exchange.on_kline(kline)
+            if trader.ingest_kline(kline):
+                await trader.evaluate_strategies(symbol, interval)
+            while events:
+                await trader.process_user_event(events.pop(0))
+
+    started = time.perf_counter()
+    output = io.StringIO() if quiet else None
+    with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+        asyncio.run(run())
+    elapsed = time.perf_counter() - started
+    bot.chart_renderer.close()
+    return dict(exchange.summary(), candles=len(rows), seconds=elapsed, symbol=symbol, interval=interval)
+
+
+if __name__ == "__main__":
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Прогон бота на бумажной бирже по свечам из kline_store")
+    parser.add_argument('--symbol', default='BTCUSDT')
+    parser.add_argument('--interval', default='1m')
+    parser.add_argument('--days', type=float, default=1.0, help="сколько последних дней истории прогнать")
+    parser.add_argument('--end', help="конец периода, например 2024-05-01 (по умолчанию — последняя свеча)")
+    parser.add_argument('--balance', type=float, default=10_000.0)
+    parser.add_argument('--fee', type=float, default=TAKER_FEE)
+    parser.add_argument('--slippage', type=float, default=SLIPPAGE)
+    parser.add_argument('--verbose', action='store_true', help="показывать вывод бота")
+    args = parser.parse_args()
+
+    from kline_store import KlineStore
+    kline_store = KlineStore()
+    if args.end:
+        end_ms = int(pd.Timestamp(args.end, tz='UTC').value // 1_000_000)
+    else:
+        last = kline_store.load(args.symbol, args.interval).index
+        if last.empty:
+            raise SystemExit(f"❌ Нет свечей {args.symbol} {args.interval} в {kline_store.root}")
+        end_ms = int(last[-1].value // 1_000_000)
+    start_ms = end_ms - int(args.days * 86_400_000)
+
+    result = replay(args.symbol, args.interval, start_ms, end_ms, args.balance, fee_rate=args.fee,
+                    slippage=args.slippage, store=kline_store, quiet=not args.verbose)
+    print(f"📄 {result['symbol']} {result['interval']}: {result['candles']} свечей за {result['seconds']:.2f} с")
+    print(f"💼 Баланс {result['balance']:.2f} | PnL {result['realized_pnl']:+.2f} | "
+          f"нереализованный {result['unrealized_pnl']:+.2f} | комиссии {result['fees']:.2f} | "
+          f"исполнений {result['fills']}")
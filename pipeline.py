@@ -0,0 +1,275 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from kline_codec import DepthUpdate, KlineDecoder, Trade
+from metrics import kline_trace, now_ms, observe_stage
+
+logger = logging.getLogger(__name__)
+
+# === Политики переполнения очередей ===
+BLOCK = 'block'              # ждать свободного места (обратное давление на предыдущую стадию)
+DROP_NEWEST = 'drop_newest'  # отбросить новый элемент
+DROP_OLDEST = 'drop_oldest'  # вытеснить самый старый элемент, который можно терять
+COALESCE = 'coalesce'        # элемент с тем же ключом заменяет ещё не обработанный
+POLICIES = (BLOCK, DROP_NEWEST, DROP_OLDEST, COALESCE)
+
+_REMOVED = object()
+
+
+# === Ограниченная очередь между стадиями конвейера ===
+# put_nowait() применяет политику переполнения и подходит для промежуточных тиков,
+# put() никогда не теряет элемент и ждёт места — для закрытых свечей.
+class StageQueue:
+    def __init__(self, name, maxsize=1000, policy=BLOCK):
+        if policy not in POLICIES:
+            raise ValueError(f"Неизвестная политика очереди: {policy}")
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self._entries = deque()     # [key, item]; удалённые помечаются _REMOVED
+        self._droppable = deque()   # записи, которые можно вытеснить при DROP_OLDEST
+        self._pending = {}          # key → запись, ожидающая обработки (для COALESCE)
+        self._size = 0
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+
+        self.put_count = 0
+        self.get_count = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.high_watermark = 0
+
+    def __len__(self):
+        return self._size
+
+    def full(self):
+        return self._size >= self.maxsize
+
+    def put_nowait(self, item, key=None):
+        self.put_count += 1
+        if self.policy == COALESCE and key is not None:
+            entry = self._pending.get(key)
+            if entry is not None:
+                entry[1] = item
+                self.coalesced += 1
+                return True
+        if self.full():
+            if self.policy == DROP_OLDEST and self._evict_oldest():
+                pass
+            elif self.policy == BLOCK:
+                raise asyncio.QueueFull
+            else:
+                self.dropped += 1
+                return False
+        self._push(item, key, droppable=True)
+        return True
+
+    async def put(self, item, key=None):
+        self.put_count += 1
+        while self.full():
+            self._not_full.clear()
+            await self._not_full.wait()
+        self._push(item, key, droppable=False)
+
+    async def get(self):
+        while True:
+            while not self._entries:
+                self._not_empty.clear()
+                await self._not_empty.wait()
+            entry = self._entries.popleft()
+            if entry[1] is _REMOVED:
+                continue
+            return self._take(entry)
+
+    def metrics(self):
+        return {
+            'depth': self._size,
+            'maxsize': self.maxsize,
+            'high_watermark': self.high_watermark,
+            'put': self.put_count,
+            'get': self.get_count,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+        }
+
+    def _push(self, item, key, droppable):
+        entry = [key, item]
+        self._entries.append(entry)
+        if droppable and self.policy == DROP_OLDEST:
+            self._droppable.append(entry)
+        if key is not None and self.policy == COALESCE:
+            self._pending[key] = entry
+        self._size += 1
+        self.high_watermark = max(self.high_watermark, self._size)
+        self._not_empty.set()
+
+    def _take(self, entry):
+        key, item = entry
+        if key is not None and self._pending.get(key) is entry:
+            del self._pending[key]
+        entry[1] = _REMOVED
+        while self._droppable and self._droppable[0][1] is _REMOVED:
+            self._droppable.popleft()
+        self._size -= 1
+        self.get_count += 1
+        self._not_full.set()
+        return item
+
+    def _evict_oldest(self):
+        while self._droppable:
+            entry = self._droppable.popleft()
+            if entry[1] is not _REMOVED:
+                self._take(entry)
+                self.get_count -= 1
+                self.dropped += 1
+                return True
+        return False
+
+
+# === Конвейер свечей: чтение → разбор/фильтр (+ бары из aggTrade) → агрегатор свечей → воркеры стратегий ===
+# Чтение сокета больше не ждёт стратегий и REST-запросов: между стадиями стоят
+# ограниченные очереди. Незакрытые свечи (основной трафик) либо отбрасываются декодером
+# до разбора (closed_only), либо склеиваются по потоку; закрытые не теряются никогда. Воркер выбирается по символу, поэтому решения
+# по одному символу принимаются строго последовательно.
+class KlinePipeline:
+    def __init__(self, on_candle, on_closed, workers=2, raw_size=10_000, kline_size=1000, job_size=100,
+                 raw_policy=BLOCK, tick_policy=COALESCE, job_policy=COALESCE, decoder=None, bars=None,
+                 on_kline=None, on_depth=None):
+        self.on_candle = on_candle    # sync: добавить закрытую Kline в состояние, True если свеча новая
+        self.on_closed = on_closed    # async: оценить стратегии по (symbol, interval)
+        self.on_kline = on_kline      # sync: каждая Kline, включая тики (бумажная биржа), до on_candle
+        self.on_depth = on_depth      # sync: DepthUpdate прямо из разбора, минуя очереди свечей (order_book.py)
+        self.decoder = decoder or KlineDecoder()
+        self.bars = bars              # TradeBarAggregator: свои таймфреймы из aggTrade
+        self.raw = StageQueue('raw', raw_size, raw_policy)
+        self.klines = StageQueue('klines', kline_size, tick_policy)
+        self.jobs = [StageQueue(f'jobs-{i}', job_size, job_policy) for i in range(max(1, workers))]
+        self.forming = {}             # (symbol, interval) → последний тик незакрытой свечи
+        self.traces = {}              # (symbol, interval) → метки времени последней закрытой свечи
+        self.parse_errors = 0
+        self.callback_errors = 0      # исключения on_depth / bars / on_kline: кадр пропущен, стадия живёт
+        self._tasks = []
+
+    # Точка входа для WebSocket: только кладёт сырой кадр в очередь вместе со временем получения
+    async def feed(self, message):
+        if self.raw.policy == BLOCK:
+            await self.raw.put((now_ms(), message))
+        else:
+            self.raw.put_nowait((now_ms(), message))
+
+    async def run(self):
+        self._tasks = [
+            asyncio.create_task(self._parse_loop(), name='pipeline-parse'),
+            asyncio.create_task(self._aggregate_loop(), name='pipeline-aggregate'),
+        ]
+        self._tasks += [
+            asyncio.create_task(self._worker_loop(queue), name=f'pipeline-{queue.name}') for queue in self.jobs
+        ]
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            for task in self._tasks:
+                task.cancel()
+
+    def queues(self):
+        return [self.raw, self.klines, *self.jobs]
+
+    def metrics(self):
+        return {
+            'queues': {queue.name: queue.metrics() for queue in self.queues()},
+            'parse_errors': self.parse_errors,
+            'callback_errors': self.callback_errors,
+            'skipped': self.decoder.skipped,
+            'skipped_ticks': self.decoder.skipped_ticks,
+        }
+
+    # Ошибка обработчика одного кадра (стакан, бары, бумажная биржа) логируется, как и ошибка
+    # on_candle: упавшая стадия остановила бы конвейер по всем символам. None — кадр пропущен
+    def _guarded(self, callback, item):
+        try:
+            return callback(item)
+        except Exception as e:
+            self.callback_errors += 1
+            logger.error("❌ Ошибка обработки %s %s: %s", type(item).__name__,
+                         getattr(item, 'symbol', ''), e, exc_info=True)
+            return None
+
+    async def _parse_loop(self):
+        while True:
+            recv_ms, message = await self.raw.get()
+            try:
+                kline = self.decoder.decode(message)
+            except (ValueError, KeyError, TypeError) as e:
+                # Не JSON или событие без нужных полей — один кадр, а не весь разбор
+                self.parse_errors += 1
+                logger.error("❌ Ошибка парсинга JSON: %s", e)
+                continue
+            if kline is None:
+                continue
+            if type(kline) is DepthUpdate:
+                if self.on_depth is not None:
+                    self._guarded(self.on_depth, kline)
+                continue
+            if type(kline) is Trade:
+                # Сделка сразу собирается в бары; закрытые идут дальше как обычные свечи
+                if self.bars is not None:
+                    for bar in self._guarded(self.bars.update, kline) or ():
+                        await self.klines.put((bar, recv_ms))
+                continue
+
+            if kline.closed or self.klines.policy == BLOCK:
+                await self.klines.put((kline, recv_ms))
+            else:
+                self.klines.put_nowait((kline, recv_ms), key=(kline.symbol, kline.interval))
+
+    async def _aggregate_loop(self):
+        while True:
+            kline, recv_ms = await self.klines.get()
+            key = (kline.symbol, kline.interval)
+            if self.on_kline is not None:
+                self._guarded(self.on_kline, kline)
+            if not kline.closed:
+                self.forming[key] = kline
+                continue
+
+            forming = self.forming.get(key)
+            if forming is not None and forming.open_time <= kline.open_time:
+                del self.forming[key]
+
+            started = now_ms()
+            observe_stage('close_to_receive', recv_ms - kline.close_time)
+            observe_stage('receive_to_aggregate', started - recv_ms)
+            try:
+                if not self.on_candle(kline):
+                    continue
+            except Exception as e:
+                logger.error("❌ Ошибка добавления свечи %s %s: %s", kline.symbol, kline.interval, e, exc_info=True)
+                continue
+            aggregated = now_ms()
+            observe_stage('indicators', aggregated - started)
+            self.traces[key] = {'close_ms': kline.close_time, 'recv_ms': recv_ms, 'queued_ms': aggregated}
+
+            queue = self.jobs[hash(kline.symbol) % len(self.jobs)]
+            if queue.policy == BLOCK:
+                await queue.put(key)
+            else:
+                queue.put_nowait(key, key=key)
+
+    async def _worker_loop(self, queue):
+        while True:
+            symbol, interval = await queue.get()
+            trace = self.traces.get((symbol, interval))
+            token = kline_trace.set(trace)
+            started = time.perf_counter()
+            if trace is not None:
+                observe_stage('strategy_queue', now_ms() - trace['queued_ms'])
+            try:
+                await self.on_closed(symbol, interval)
+            except Exception as e:
+                logger.error("❌ Ошибка стратегии %s %s: %s", symbol, interval, e, exc_info=True)
+            finally:
+                kline_trace.reset(token)
+            observe_stage('strategies', (time.perf_counter() - started) * 1000)
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# === Клиентский ограничитель запросов к Binance Futures REST ===
+# Все запросы шлюза проходят через общий набор «вёдер токенов»: вес запросов за минуту
+# и число ордеров за 10 секунд и за минуту. Показания сервера из заголовков
+# X-MBX-USED-WEIGHT-1M / X-MBX-ORDER-COUNT-* поджимают локальный счёт, 429/418 с Retry-After
+# останавливают все запросы до конца бана. Ордерам и отменам доступен весь лимит,
+# сверке — часть, информационным запросам (команды Telegram) — меньшая часть: при нехватке
+# они ждут пополнения, а не падают.
+
+HIGH = 0     # ордера, отмены, listenKey
+NORMAL = 1   # сверка состояния
+LOW = 2      # информационные запросы
+PRIORITY_NAMES = {HIGH: 'high', NORMAL: 'normal', LOW: 'low'}
+
+# Какую долю ведра может занять запрос каждого приоритета
+SHARE = {HIGH: 1.0, NORMAL: 0.8, LOW: 0.5}
+
+# Лимиты USDT-M Futures по умолчанию (GET /fapi/v1/exchangeInfo → rateLimits)
+WEIGHT_LIMIT_1M = 2400
+ORDER_LIMIT_10S = 300
+ORDER_LIMIT_1M = 1200
+
+# (метод, путь) → вес запроса по документации Binance
+ENDPOINT_WEIGHTS = {
+    ('POST', '/fapi/v1/order'): 0,          # ордер расходует только лимит ордеров
+    ('DELETE', '/fapi/v1/order'): 1,
+    ('POST', '/fapi/v1/batchOrders'): 5,
+    ('DELETE', '/fapi/v1/batchOrders'): 1,
+    ('DELETE', '/fapi/v1/allOpenOrders'): 1,
+    ('GET', '/fapi/v1/allOrders'): 5,
+    ('GET', '/fapi/v2/positionRisk'): 5,
+    ('GET', '/fapi/v2/balance'): 5,
+    ('POST', '/fapi/v1/listenKey'): 1,
+    ('PUT', '/fapi/v1/listenKey'): 1,
+    ('DELETE', '/fapi/v1/listenKey'): 1,
+}
+ORDER_ENDPOINTS = {('POST', '/fapi/v1/order'), ('POST', '/fapi/v1/batchOrders')}
+
+
+def request_weight(method, path, params=None):
+    params = params or {}
+    if path == '/fapi/v1/openOrders':
+        # Без символа запрос идёт сразу по всем символам и стоит в 40 раз дороже
+        return 1 if params.get('symbol') else 40
+    if path == '/fapi/v1/depth':
+        limit = int(params.get('limit', 500))
+        return 2 if limit <= 50 else 5 if limit <= 100 else 10 if limit <= 500 else 20
+    if path == '/fapi/v1/klines':
+        limit = int(params.get('limit', 500))
+        return 1 if limit < 100 else 2 if limit < 500 else 5 if limit <= 1000 else 10
+    return ENDPOINT_WEIGHTS.get((method, path), 1)
+
+
+def order_count(method, path, params=None):
+    if (method, path) not in ORDER_ENDPOINTS:
+        return 0
+    if path == '/fapi/v1/batchOrders':
+        batch = (params or {}).get('batchOrders') or ()
+        return max(1, len(json.loads(batch) if isinstance(batch, str) else batch))
+    return 1
+
+
+# Всё, что меняет состояние (ордера, отмены, listenKey), — важнее чтения
+def default_priority(method):
+    return NORMAL if method == 'GET' else HIGH
+
+
+class TokenBucket:
+    __slots__ = ('name', 'capacity', 'rate', 'tokens', 'updated')
+
+    def __init__(self, name, capacity, period):
+        self.name = name
+        self.capacity = capacity
+        self.rate = capacity / period   # токенов в секунду
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Через сколько секунд можно взять amount, не опускаясь ниже резерва более важных запросов
+    def wait_time(self, amount, share, now):
+        self._refill(now)
+        reserve = self.capacity * (1 - share)
+        missing = amount + reserve - self.tokens
+        return 0.0 if missing <= 0 else missing / self.rate
+
+    def take(self, amount):
+        self.tokens -= amount
+
+    # Сервер видит больше, чем мы насчитали (другие процессы, рестарт) — верим серверу
+    def sync(self, used, now):
+        self._refill(now)
+        self.tokens = min(self.tokens, self.capacity - used)
+
+    @property
+    def used(self):
+        return self.capacity - self.tokens
+
+
+class RateLimitGovernor:
+    def __init__(self, weight_limit=WEIGHT_LIMIT_1M, order_limit_10s=ORDER_LIMIT_10S, order_limit_1m=ORDER_LIMIT_1M):
+        self.weight = TokenBucket('weight_1m', weight_limit, 60)
+        self.orders_10s = TokenBucket('orders_10s', order_limit_10s, 10)
+        self.orders_1m = TokenBucket('orders_1m', order_limit_1m, 60)
+        self.banned_until = 0.0
+        self.waits = {name: 0 for name in PRIORITY_NAMES.values()}
+        self.waited_seconds = 0.0
+        self.bans = 0
+
+    async def acquire(self, weight=1, orders=0, priority=NORMAL):
+        share = SHARE[priority]
+        waited = False
+        while True:
+            now = time.monotonic()
+            delay = self.banned_until - now
+            if delay <= 0:
+                delay = self.weight.wait_time(weight, share, now)
+                if orders:
+                    delay = max(delay,
+                                self.orders_10s.wait_time(orders, share, now),
+                                self.orders_1m.wait_time(orders, share, now))
+            if delay <= 0:
+                break
+            if not waited:
+                waited = True
+                self.waits[PRIORITY_NAMES[priority]] += 1
+                logger.debug("⏳ Лимит запросов: ждём %.2f с (приоритет %s)", delay, PRIORITY_NAMES[priority])
+            self.waited_seconds += delay
+            await asyncio.sleep(delay)
+        self.weight.take(weight)
+        if orders:
+            self.orders_10s.take(orders)
+            self.orders_1m.take(orders)
+
+    # Заголовки ответа: X-MBX-USED-WEIGHT-1M, X-MBX-ORDER-COUNT-10S, X-MBX-ORDER-COUNT-1M, Retry-After
+    def update(self, status, headers):
+        now = time.monotonic()
+        for header, bucket in (('X-MBX-USED-WEIGHT-1M', self.weight),
+                               ('X-MBX-ORDER-COUNT-10S', self.orders_10s),
+                               ('X-MBX-ORDER-COUNT-1M', self.orders_1m)):
+            value = headers.get(header)
+            if value is not None:
+                bucket.sync(int(value), now)
+        if status in (418, 429):
+            retry_after = float(headers.get('Retry-After') or 60)
+            self.banned_until = max(self.banned_until, now + retry_after)
+            self.bans += 1
+            logger.error("🚫 Binance ограничил запросы (%s), пауза %.0f с", status, retry_after)
+
+    def metrics(self):
+        return {
+            'buckets': {b.name: {'used': round(b.used, 1), 'limit': b.capacity}
+                        for b in (self.weight, self.orders_10s, self.orders_1m)},
+            'banned_for': max(0.0, self.banned_until - time.monotonic()),
+            'waits': dict(self.waits),
+            'waited_seconds': self.waited_seconds,
+            'bans': self.bans,
+        }
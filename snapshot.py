@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import os
+import pickle
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# === Снимок состояния для быстрого тёплого перезапуска ===
+# Свечи пишутся в журнал только на дозапись: {root}/{SYMBOL}/{interval}.wal — записи по 48 байт
+# (время открытия + OHLCV). Позиции, ордера и состояние индикаторов периодически сохраняются
+# в state.pkl атомарной заменой файла. Горячий путь только кладёт запись в список,
+# запись на диск идёт из фоновой задачи в отдельном потоке.
+
+RECORD = np.dtype([
+    ('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'), ('volume', '<f8')
+])
+STATE_VERSION = 1
+DEFAULT_ROOT = os.getenv("SNAPSHOT_DIR", "data/snapshot")
+
+
+# root=None — ничего не пишется и не восстанавливается (прогон paper_exchange.replay, бенчмарк)
+class SnapshotStore:
+    def __init__(self, root=DEFAULT_ROOT, flush_interval=1.0, state_interval=10.0, keep=1000, fsync=True,
+                 state_name='state.pkl'):
+        self.root = root
+        self.state_name = state_name  # у шардов supervisor.py — свой файл, журналы свечей общие
+        self.flush_interval = flush_interval
+        self.state_interval = state_interval
+        self.keep = keep              # сколько свечей оставлять при сжатии журнала
+        self.fsync = fsync
+        self._pending = {}            # (symbol, interval) → [записи]
+        self._wal_records = {}        # (symbol, interval) → записей в файле
+        self.flushes = 0
+
+    def _wal_path(self, symbol, interval):
+        return os.path.join(self.root, symbol.upper(), f"{interval}.wal")
+
+    @property
+    def state_path(self):
+        return os.path.join(self.root, self.state_name)
+
+    # === Горячий путь ===
+    def record_candle(self, symbol, interval, timestamp, open_price, high, low, close_price, volume):
+        if not self.root:
+            return
+        self._pending.setdefault((symbol, interval), []).append(
+            (timestamp, open_price, high, low, close_price, volume)
+        )
+
+    # === Фоновая запись ===
+    async def run(self, capture_state):
+        if not self.root:
+            return
+        loop = asyncio.get_running_loop()
+        next_state = loop.time() + self.state_interval
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                pending, self._pending = self._pending, {}
+                if pending:
+                    await asyncio.to_thread(self._write_candles, pending)
+                if loop.time() >= next_state:
+                    # Сериализация — в event loop, чтобы состояние не менялось во время pickle
+                    payload = pickle.dumps(self._wrap_state(capture_state()), protocol=pickle.HIGHEST_PROTOCOL)
+                    await asyncio.to_thread(self._write_state, payload)
+                    next_state = loop.time() + self.state_interval
+        finally:
+            # Остановка бота: дописываем всё, что успели накопить
+            self.flush(capture_state)
+
+    def flush(self, capture_state=None):
+        if not self.root:
+            return
+        pending, self._pending = self._pending, {}
+        if pending:
+            self._write_candles(pending)
+        if capture_state is not None:
+            self._write_state(pickle.dumps(self._wrap_state(capture_state()), protocol=pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def _wrap_state(state):
+        return {'version': STATE_VERSION, 'saved_at': time.time(), 'state': state}
+
+    def _write_candles(self, pending):
+        for (symbol, interval), rows in pending.items():
+            path = self._wal_path(symbol, interval)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            records = np.array(rows, dtype=RECORD)
+            key = (symbol, interval)
+            count = self._wal_records.get(key)
+            if count is None:
+                count = self._truncate_torn(path)
+            with open(path, 'ab') as f:
+                f.write(records.tobytes())
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            count += len(records)
+            self._wal_records[key] = count
+            if count > 4 * self.keep:
+                self._compact(path, key)
+        self.flushes += 1
+
+    # Хвост от записи, оборванной при сбое, отрезается до первой дозаписи
+    @staticmethod
+    def _truncate_torn(path):
+        if not os.path.exists(path):
+            return 0
+        size = os.path.getsize(path)
+        count = size // RECORD.itemsize
+        if size % RECORD.itemsize:
+            os.truncate(path, count * RECORD.itemsize)
+            logger.warning("⚠️ Журнал %s: отрезана неполная запись", path)
+        return count
+
+    def _compact(self, path, key):
+        records = self._read_wal(path, self.keep)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(records.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._wal_records[key] = len(records)
+        logger.debug("🗜 Журнал %s сжат до %d свечей", path, len(records))
+
+    def _write_state(self, payload):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, self.state_path)
+
+    # === Восстановление ===
+    @staticmethod
+    def _read_wal(path, limit=None):
+        count = os.path.getsize(path) // RECORD.itemsize
+        if count == 0:
+            return np.empty(0, dtype=RECORD)
+        # Оборванная при сбое последняя запись просто не читается; копируется только нужный хвост
+        records = np.memmap(path, dtype=RECORD, mode='r', shape=(count,))
+        return np.array(records if limit is None else records[-limit:])
+
+    def load_candles(self, symbol, interval, limit=None):
+        if not self.root:
+            return np.empty(0, dtype=RECORD)
+        path = self._wal_path(symbol, interval)
+        if not os.path.exists(path):
+            return np.empty(0, dtype=RECORD)
+        return self._read_wal(path, limit)
+
+    def load_state(self):
+        if not self.root:
+            return None
+        try:
+            with open(self.state_path, 'rb') as f:
+                snapshot = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error("❌ Снимок состояния повреждён, начинаем с нуля: %s", e)
+            return None
+        if snapshot.get('version') != STATE_VERSION:
+            logger.warning("⚠️ Снимок другой версии (%s) — пропускаем", snapshot.get('version'))
+            return None
+        return snapshot
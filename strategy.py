@@ -1,12 +1,64 @@
 import asyncio
+import json
 import logging
+import numpy as np
+from candle_store import CandleBuffer
 
 logger = logging.getLogger(__name__)
 
 TRADE_QUANTITY = 0.002
 
-def calculate_indicators(df, window=14):
-    df = df.copy()
+# === Параметры управления позицией ===
+STOP_LOSS_PERCENT = 0.003  # 0.3%
+TAKE_PROFIT_PERCENT = 0.005  # 0.5%
+POSITION_COOLDOWN = 60  # секунд между закрытием позиции и новой сделкой
+
+# === Параметры стратегий (можно переопределить файлом из optimizer.py) ===
+DEFAULT_PARAMS = {
+    'rsi_window': 14,
+    'rsi_buy': 30,           # RSI ниже — зона покупки
+    'rsi_sell': 70,          # RSI выше — зона продажи
+    'macd_fast': 12,
+    'macd_slow': 26,
+    'macd_signal': 9,
+    'grid_size': 50,         # окно средней для сетки
+    'num_levels': 5,         # уровней сетки с каждой стороны
+    'grid_step': 0.01,       # шаг сетки, доля от средней
+    'grid_threshold': 0.001, # близость цены к уровню, доля от цены
+}
+PARAMS = dict(DEFAULT_PARAMS)
+
+
+def load_params(path):
+    with open(path) as f:
+        data = json.load(f)
+    # Файл оптимизатора хранит лучший набор в ключе "best"
+    params = data.get('best', data)
+    unknown = set(params) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise ValueError(f"Неизвестные параметры стратегии: {', '.join(sorted(unknown))}")
+    PARAMS.update(params)
+    logger.info("⚙️ Параметры стратегии загружены из %s: %s", path, params)
+    return PARAMS
+
+
+def indicator_settings(params=None):
+    params = params or PARAMS
+    return {
+        'window': params['rsi_window'],
+        'fast': params['macd_fast'],
+        'slow': params['macd_slow'],
+        'signal': params['macd_signal'],
+        'sma_window': params['grid_size'],
+    }
+
+
+def calculate_indicators(df, window=None, fast=None, slow=None, signal=None):
+    window = window or PARAMS['rsi_window']
+    fast = fast or PARAMS['macd_fast']
+    slow = slow or PARAMS['macd_slow']
+    signal = signal or PARAMS['macd_signal']
+    df = df.to_frame().copy() if isinstance(df, CandleBuffer) else df.copy()
 
     # RSI
     delta = df['Close'].diff()
@@ -20,43 +72,55 @@ def calculate_indicators(df, window=14):
     df['rsi'] = 100 - (100 / (1 + rs))
 
     # MACD
-    df['ema12'] = df['Close'].ewm(span=12, adjust=False).mean()
-    df['ema26'] = df['Close'].ewm(span=26, adjust=False).mean()
+    df['ema12'] = df['Close'].ewm(span=fast, adjust=False).mean()
+    df['ema26'] = df['Close'].ewm(span=slow, adjust=False).mean()
     df['macd_line'] = df['ema12'] - df['ema26']
-    df['signal_line'] = df['macd_line'].ewm(span=9, adjust=False).mean()
+    df['signal_line'] = df['macd_line'].ewm(span=signal, adjust=False).mean()
     df['macd_hist'] = df['macd_line'] - df['signal_line']
 
     return df
 
 
-async def execute_strategy(df, send_telegram_message, place_order_func, symbol="BTCUSDT"):
-    df = calculate_indicators(df)
+async def execute_strategy(df, send_telegram_message, place_order_func, symbol="BTCUSDT", indicators=None):
+    min_candles = PARAMS['macd_slow']
+    # Если передан потоковый движок — берём готовые значения, без пересчёта всей истории
+    if indicators is not None:
+        if indicators.count < min_candles or indicators.prev is None:
+            logger.warning("⚠️ Недостаточно данных для анализа")
+            return
+        latest = indicators.latest
+        prev = indicators.prev
+    else:
+        df = calculate_indicators(df)
 
-    if len(df) < 26:
-        logger.warning("⚠️ Недостаточно данных для анализа")
-        return
+        if len(df) < min_candles:
+            logger.warning("⚠️ Недостаточно данных для анализа")
+            return
 
-    latest = df.iloc[-1]
-    prev = df.iloc[-2]
+        latest = df.iloc[-1]
+        prev = df.iloc[-2]
 
     print(f"📉 RSI: {latest['rsi']:.2f}")
     print(f"📉 MACD: {latest['macd_line']:.2f} | Signal: {latest['signal_line']:.2f}")
 
     # Покупка по сигналу RSI+MACD
-    if latest['rsi'] < 30 and latest['macd_line'] > latest['signal_line'] and prev['macd_line'] <= prev['signal_line']:
+    if latest['rsi'] < PARAMS['rsi_buy'] and latest['macd_line'] > latest['signal_line'] and prev['macd_line'] <= prev['signal_line']:
         message = f"🟢 [RSI+MACD] Покупка {symbol}\nЦена: {latest['Close']:.2f}$\nRSI: {latest['rsi']:.2f}"
         send_telegram_message(message)
-        place_order_func(symbol, 'buy', TRADE_QUANTITY)
+        await place_order_func(symbol, 'buy', TRADE_QUANTITY)
 
     # Продажа по сигналу RSI+MACD
-    elif latest['rsi'] > 70 and latest['macd_line'] < latest['signal_line'] and prev['macd_line'] >= prev['signal_line']:
+    elif latest['rsi'] > PARAMS['rsi_sell'] and latest['macd_line'] < latest['signal_line'] and prev['macd_line'] >= prev['signal_line']:
         message = f"🔴 [RSI+MACD] Продажа {symbol}\nЦена: {latest['Close']:.2f}$\nRSI: {latest['rsi']:.2f}"
         send_telegram_message(message)
-        place_order_func(symbol, 'sell', TRADE_QUANTITY)
+        await place_order_func(symbol, 'sell', TRADE_QUANTITY)
 
 
-async def execute_grid_strategy(df, send_telegram_message, place_order_func, symbol="BTCUSDT", dry_run=False):
-    grid_info = calculate_grid_levels(df)
+async def execute_grid_strategy(df, send_telegram_message, place_order_func, symbol="BTCUSDT", dry_run=False, indicators=None):
+    avg_price = None
+    if indicators is not None and indicators.sma_window == PARAMS['grid_size']:
+        avg_price = indicators.latest['sma']
+    grid_info = calculate_grid_levels(df, avg_price=avg_price)
     print(f"📊 Уровни сетки: {grid_info['levels']}")
 
     if not dry_run:
@@ -65,13 +129,21 @@ async def execute_grid_strategy(df, send_telegram_message, place_order_func, sym
     return grid_info['levels']
 
 
-def calculate_grid_levels(df, grid_size=50, num_levels=5):
-    latest_price = df['Close'].iloc[-1]
-    avg_price = df['Close'].rolling(window=grid_size).mean().iloc[-1]
+# book — локальный OrderBook (order_book.py): уровни притягиваются к крупным заявкам в пределах полшага
+def calculate_grid_levels(df, grid_size=None, num_levels=None, avg_price=None, book=None):
+    grid_size = grid_size or PARAMS['grid_size']
+    num_levels = num_levels or PARAMS['num_levels']
+    closes = np.asarray(df['Close'])
+    latest_price = closes[-1]
+    if avg_price is None:
+        avg_price = closes[-grid_size:].mean() if len(closes) >= grid_size else np.nan
 
-    step = avg_price * 0.01  # шаг 0.1%
+    step = avg_price * PARAMS['grid_step']  # шаг 1% по умолчанию
     lower_levels = [round(avg_price - step * i, 2) for i in range(num_levels, 0, -1)]
     upper_levels = [round(avg_price + step * i, 2) for i in range(1, num_levels + 1)]
+    if book is not None:
+        lower_levels = [round(book.snap(level, step / 2), 2) for level in lower_levels]
+        upper_levels = [round(book.snap(level, step / 2), 2) for level in upper_levels]
     return {
         'avg_price': avg_price,
         'latest_price': latest_price,
@@ -80,17 +152,78 @@ def calculate_grid_levels(df, grid_size=50, num_levels=5):
 
 
 async def detect_grid_signal(df, grid_info, send_telegram_message, place_order_func, symbol="BTCUSDT"):
-    latest_price = df['Close'].iloc[-1]
+    latest_price = grid_info['latest_price']
     levels = grid_info['levels']
-    threshold = latest_price * 0.001  # 1%
+    threshold = latest_price * PARAMS['grid_threshold']  # 0.1% по умолчанию
 
     for level in levels:
         if abs(latest_price - level) < threshold:
             if latest_price < level:
                 message = f"🟢 [GRID] Цена ниже уровня {level} | BUY"
-                place_order_func(symbol, 'buy', TRADE_QUANTITY)
+                await place_order_func(symbol, 'buy', TRADE_QUANTITY)
             else:
                 message = f"🔴 [GRID] Цена выше уровня {level} | SELL"
-                place_order_func(symbol, 'sell', TRADE_QUANTITY)
+                await place_order_func(symbol, 'sell', TRADE_QUANTITY)
             send_telegram_message(message)
-            break
\ No newline at end of file
+            break
+
+# === Векторные версии сигналов для бэктеста ===
+# Та же логика, что в execute_strategy / detect_grid_signal, но сразу по всей истории.
+# Результат: массив int8, где 1 — покупка, -1 — продажа, 0 — нет сигнала.
+def rsi_macd_signal_array(df, params=None):
+    params = params or PARAMS
+    df = calculate_indicators(
+        df, params['rsi_window'], params['macd_fast'], params['macd_slow'], params['macd_signal']
+    )
+    return rsi_macd_signals_from(
+        df['rsi'].to_numpy(), df['macd_line'].to_numpy(), df['signal_line'].to_numpy(), params
+    )
+
+
+def rsi_macd_signals_from(rsi, macd, signal, params=None):
+    params = params or PARAMS
+    prev_macd = np.roll(macd, 1)
+    prev_signal = np.roll(signal, 1)
+
+    buy = (rsi < params['rsi_buy']) & (macd > signal) & (prev_macd <= prev_signal)
+    sell = (rsi > params['rsi_sell']) & (macd < signal) & (prev_macd >= prev_signal)
+
+    signals = np.zeros(len(rsi), dtype=np.int8)
+    signals[sell] = -1
+    signals[buy] = 1
+    signals[:params['macd_slow'] - 1] = 0  # execute_strategy запускается только при macd_slow+ свечах
+    return signals
+
+
+def rolling_mean_array(closes, window):
+    avg_price = np.full(len(closes), np.nan)
+    if len(closes) >= window:
+        avg_price[window - 1:] = np.lib.stride_tricks.sliding_window_view(closes, window).mean(axis=1)
+    return avg_price
+
+
+def grid_signal_array(closes, params=None, avg_price=None, chunk=262144):
+    params = params or PARAMS
+    closes = np.asarray(closes, dtype=np.float64)
+    signals = np.zeros(len(closes), dtype=np.int8)
+    if len(closes) < params['grid_size']:
+        return signals
+    if avg_price is None:
+        avg_price = rolling_mean_array(closes, params['grid_size'])
+
+    # Уровни по возрастанию, как sorted(lower_levels + upper_levels)
+    num_levels = params['num_levels']
+    offsets = np.concatenate([np.arange(-num_levels, 0), np.arange(1, num_levels + 1)])
+
+    # Кусками, чтобы матрица уровней не разрасталась на миллионах свечей
+    for start in range(0, len(closes), chunk):
+        part = slice(start, start + chunk)
+        close, avg = closes[part], avg_price[part]
+        levels = np.round(avg[:, None] + (avg * params['grid_step'])[:, None] * offsets, 2)
+
+        near = np.abs(close[:, None] - levels) < (close * params['grid_threshold'])[:, None]
+        hit = near.any(axis=1)
+        level = levels[np.arange(len(close)), near.argmax(axis=1)]
+        signals[part][hit] = 1
+        signals[part][hit & (close >= level)] = -1
+    return signals
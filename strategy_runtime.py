@@ -0,0 +1,200 @@
+import logging
+import math
+import time
+
+from metrics import observe_stage
+from strategy import PARAMS, TRADE_QUANTITY
+
+logger = logging.getLogger(__name__)
+
+# === Несколько стратегий на символ ===
+# Стратегия объявляет нужные индикаторы (requires) и по закрытой свече возвращает намерение
+# (Intent), а не ставит ордер сама. Индикаторы всех стратегий считаются один раз на свечу
+# в общем StreamingIndicators символа/интервала, намерения сводятся в одно решение arbitrate().
+
+BUY = 'buy'
+SELL = 'sell'
+
+
+class Intent:
+    __slots__ = ('strategy', 'side', 'weight', 'message')
+
+    def __init__(self, strategy, side, weight=1.0, message=""):
+        self.strategy = strategy
+        self.side = side
+        self.weight = weight
+        self.message = message
+
+    def __repr__(self):
+        return f"Intent({self.strategy} {self.side} x{self.weight})"
+
+
+class Decision:
+    __slots__ = ('side', 'quantity', 'net', 'intents')
+
+    def __init__(self, side, quantity, net, intents):
+        self.side = side            # None — сигналы взаимно погасились
+        self.quantity = quantity
+        self.net = net
+        self.intents = intents
+
+
+# Данные свечи для стратегий: индикаторы читаются из общего движка, без пересчёта
+class StrategyContext:
+    __slots__ = ('symbol', 'interval', 'candles', 'indicators', 'book')
+
+    def __init__(self, symbol, interval, candles, indicators, book=None):
+        self.symbol = symbol
+        self.interval = interval
+        self.candles = candles
+        self.indicators = indicators
+        self.book = book            # синхронизированный OrderBook символа или None
+
+    @property
+    def close(self):
+        return self.indicators.latest['Close']
+
+    def value(self, spec):
+        return self.indicators.value(spec)
+
+    def prev(self, spec):
+        return self.indicators.value(spec, prev=True)
+
+
+class Strategy:
+    name = 'base'
+    requires = ()       # индикаторы по имени: 'rsi:14', 'macd:12:26:9', 'sma:50' …
+    weight = 1.0        # голос в arbitrate()
+
+    @property
+    def min_candles(self):
+        return 2
+
+    def evaluate(self, ctx):
+        raise NotImplementedError
+
+    def intent(self, side, message=""):
+        return Intent(self.name, side, self.weight, message)
+
+
+# === Встроенные стратегии (логика strategy.execute_strategy / detect_grid_signal) ===
+class RsiMacdStrategy(Strategy):
+    name = 'rsi_macd'
+
+    def __init__(self, params=None):
+        self.params = params or PARAMS
+        p = self.params
+        self.rsi = f"rsi:{p['rsi_window']}"
+        self.macd = f"macd:{p['macd_fast']}:{p['macd_slow']}:{p['macd_signal']}"
+        self.requires = (self.rsi, self.macd)
+
+    @property
+    def min_candles(self):
+        return self.params['macd_slow']
+
+    def evaluate(self, ctx):
+        rsi = ctx.value(self.rsi)
+        hist, prev_hist = ctx.value(self.macd), ctx.prev(self.macd)
+        # MACD пересекает сигнальную линию снизу вверх / сверху вниз
+        if rsi < self.params['rsi_buy'] and hist > 0 >= prev_hist:
+            return self.intent(BUY, f"🟢 [RSI+MACD] Покупка {ctx.symbol}\nЦена: {ctx.close:.2f}$\nRSI: {rsi:.2f}")
+        if rsi > self.params['rsi_sell'] and hist < 0 <= prev_hist:
+            return self.intent(SELL, f"🔴 [RSI+MACD] Продажа {ctx.symbol}\nЦена: {ctx.close:.2f}$\nRSI: {rsi:.2f}")
+        return None
+
+
+class GridStrategy(Strategy):
+    name = 'grid'
+
+    def __init__(self, params=None):
+        self.params = params or PARAMS
+        self.sma = f"sma:{self.params['grid_size']}"
+        self.requires = (self.sma,)
+
+    @property
+    def min_candles(self):
+        return self.params['grid_size']
+
+    def evaluate(self, ctx):
+        p = self.params
+        avg_price, price = ctx.value(self.sma), ctx.close
+        if math.isnan(avg_price):
+            return None
+        step = avg_price * p['grid_step']
+        threshold = price * p['grid_threshold']
+        # Уровни по возрастанию, как в strategy.calculate_grid_levels: первый близкий уровень решает
+        for i in list(range(-p['num_levels'], 0)) + list(range(1, p['num_levels'] + 1)):
+            level = avg_price + step * i
+            if ctx.book is not None:
+                # Уровень переносится на крупную заявку в пределах полшага — как в calculate_grid_levels
+                level = ctx.book.snap(level, step / 2)
+            level = round(level, 2)
+            if abs(price - level) < threshold:
+                if price < level:
+                    return self.intent(BUY, f"🟢 [GRID] Цена ниже уровня {level} | BUY")
+                return self.intent(SELL, f"🔴 [GRID] Цена выше уровня {level} | SELL")
+        return None
+
+
+STRATEGY_CLASSES = {cls.name: cls for cls in (RsiMacdStrategy, GridStrategy)}
+
+
+# === Сведение намерений в одно решение ===
+# Голоса складываются со знаком (buy +, sell −); противоположные сигналы гасят друг друга,
+# и если |сумма| не больше min_net — сделки нет.
+def arbitrate(intents, min_net=0.0, quantity=TRADE_QUANTITY):
+    if not intents:
+        return None
+    net = sum(i.weight if i.side == BUY else -i.weight for i in intents)
+    if abs(net) <= min_net:
+        return Decision(None, 0.0, net, intents)
+    side = BUY if net > 0 else SELL
+    return Decision(side, quantity, net, [i for i in intents if i.side == side])
+
+
+class StrategyRegistry:
+    def __init__(self, strategies=(), min_net=0.0):
+        self.strategies = []
+        self.min_net = min_net
+        for strategy in strategies:
+            self.register(strategy)
+
+    def register(self, strategy):
+        if any(s.name == strategy.name for s in self.strategies):
+            raise ValueError(f"Стратегия {strategy.name} уже зарегистрирована")
+        self.strategies.append(strategy)
+        return strategy
+
+    # Объединение индикаторов всех стратегий — передаётся в StreamingIndicators(features=...)
+    def requirements(self):
+        specs = []
+        for strategy in self.strategies:
+            specs += [spec for spec in strategy.requires if spec not in specs]
+        return tuple(specs)
+
+    def evaluate(self, ctx):
+        intents = []
+        count = ctx.indicators.count
+        for strategy in self.strategies:
+            if count < strategy.min_candles or ctx.indicators.prev is None:
+                continue
+            started = time.perf_counter()
+            try:
+                intent = strategy.evaluate(ctx)
+            except Exception as e:
+                logger.error("❌ Стратегия %s упала на %s %s: %s", strategy.name, ctx.symbol, ctx.interval, e)
+                intent = None
+            observe_stage(strategy.name, (time.perf_counter() - started) * 1000)
+            if intent is not None:
+                intents.append(intent)
+        return intents
+
+    def decide(self, ctx):
+        return arbitrate(self.evaluate(ctx), self.min_net)
+
+
+def build_registry(names, min_net=0.0):
+    unknown = [name for name in names if name not in STRATEGY_CLASSES]
+    if unknown:
+        raise ValueError(f"Неизвестные стратегии: {', '.join(unknown)} (есть: {', '.join(STRATEGY_CLASSES)})")
+    return StrategyRegistry([STRATEGY_CLASSES[name]() for name in names], min_net)
@@ -0,0 +1,403 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+import shutil
+import struct
+import tempfile
+import time
+
+from candle_store import SharedCandleBuffer, segment_name
+from websocket_handler import Backoff
+
+logger = logging.getLogger(__name__)
+
+# === Супервизор: символы по процессам-шардам ===
+#   python supervisor.py --workers 4
+# Шард — обычный bot.py со своим SYMBOLS: WebSocket, конвейер, индикаторы и стратегии своих символов
+# в своём процессе, так что тяжёлая свеча одного символа не задерживает остальные.
+# Супервизор держит всё, что должно быть одно на аккаунт: ордера и позиции (OrderStateCache,
+# user data stream, ограничитель REST), Telegram и снимок позиций. Шарды обращаются к нему
+# через RemoteDesk по unix-сокету; свечи лежат в кольцах разделяемой памяти
+# (SharedCandleBuffer), которые супервизор создаёт, шард пишет, а /gridchart читает без IPC.
+
+FRAME = struct.Struct('!I')   # длина кадра pickle
+
+
+# === IPC: кадры pickle по unix-сокету ===
+# ('call', id, метод, args) → ('result', id, ok, значение); ('notify', метод, args) — без ответа
+class Channel:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def send_nowait(self, message):
+        payload = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+        self.writer.write(FRAME.pack(len(payload)) + payload)
+
+    async def send(self, message):
+        self.send_nowait(message)
+        await self.writer.drain()
+
+    async def recv(self):
+        size, = FRAME.unpack(await self.reader.readexactly(FRAME.size))
+        return pickle.loads(await self.reader.readexactly(size))
+
+    def close(self):
+        self.writer.close()
+
+
+class RemoteError(Exception):
+    pass
+
+
+class RpcClient:
+    def __init__(self, channel):
+        self.channel = channel
+        self._pending = {}
+        self._next_id = 0
+
+    async def call(self, method, *args):
+        self._next_id += 1
+        call_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[call_id] = future
+        try:
+            await self.channel.send(('call', call_id, method, args))
+            return await future
+        finally:
+            self._pending.pop(call_id, None)
+
+    def notify(self, method, *args):
+        self.channel.send_nowait(('notify', method, args))
+
+    # Читает ответы супервизора; разрыв соединения завершает шард
+    async def run(self):
+        try:
+            while True:
+                _, call_id, ok, value = await self.channel.recv()
+                future = self._pending.get(call_id)
+                if future is None or future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(RemoteError(value))
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("супервизор недоступен"))
+            raise ConnectionError("соединение с супервизором потеряно") from e
+
+
+# === Шард: стадия стратегий обращается к ордерам супервизора ===
+class RemoteDesk:
+    def __init__(self, rpc, trader):
+        self.rpc = rpc
+        self.trader = trader
+
+    async def has_active_orders(self, symbol):
+        return await self.rpc.call('has_active_orders', symbol)
+
+    # Цена и оценка исполнения по стакану считаются здесь: свечи и стакан символа живут в шарде
+    async def place_order(self, symbol, side, quantity, strategy=''):
+        book = self.trader.book_for(symbol)
+        fill = book.cost_to_fill(side, quantity) if book is not None else None
+        return await self.rpc.call('place_order', symbol, side, quantity,
+                                   self.trader.symbol_states[symbol].last_price, fill, strategy)
+
+    async def monitor_active_orders(self, symbol):
+        await self.rpc.call('monitor_active_orders', symbol)
+
+    def notify(self, message):
+        self.rpc.notify('notify', message)
+
+    # Журнал сделок ведёт супервизор: туда же приходят исполнения из user data stream
+    def record_signal(self, symbol, strategy, side, price):
+        self.rpc.notify('signal', int(self.trader.clock.time() * 1000), symbol, strategy, side, price)
+
+    # Бумажная биржа живёт в супервизоре и получает свечи шардов
+    def on_kline(self, kline):
+        self.rpc.notify('kline', kline)
+
+
+def run_shard(index, symbols, ipc_path, shm_prefix, metrics_port):
+    # Настройки bot.py читаются при импорте, поэтому окружение шарда задаётся до него
+    os.environ['SYMBOLS'] = ",".join(symbols)
+    os.environ['CANDLE_SHM'] = shm_prefix
+    os.environ['SNAPSHOT_STATE'] = f"shard-{index}.pkl"
+    os.environ['METRICS_PORT'] = str(metrics_port)
+    import bot
+    try:
+        asyncio.run(_shard_main(bot, index, ipc_path))
+    except ConnectionError as e:
+        logger.error("❌ Шард %d остановлен: %s", index, e)
+
+
+async def _shard_main(bot, index, ipc_path):
+    reader, writer = await asyncio.open_unix_connection(ipc_path)
+    rpc = RpcClient(Channel(reader, writer))
+    desk = RemoteDesk(rpc, bot.trader)
+    bot.trader.desk = desk
+    bot.trader.notify = desk.notify
+    if bot.paper_exchange is not None:
+        bot.pipeline.on_kline = desk.on_kline
+
+    # Кольца могли остаться от предыдущего запуска шарда — история набирается заново
+    for state in bot.symbol_states.values():
+        for candles in state.candles.values():
+            candles.clear()
+    await bot.prepare_market_data()
+
+    rpc_task = asyncio.ensure_future(rpc.run())
+    await rpc.call('hello', index, list(bot.symbol_states))
+    tasks = [rpc_task, bot.run_websocket(), bot.snapshots.run(bot.capture_state)]
+    if bot.METRICS_PORT:
+        tasks.append(bot.start_metrics_server(port=bot.METRICS_PORT))
+    await asyncio.gather(*tasks)
+
+
+# Символы по шардам по кругу: BTC, ETH, SOL, XRP на 2 шарда → [BTC, SOL], [ETH, XRP]
+def shard_symbols(symbols, workers):
+    workers = max(1, min(workers, len(symbols)))
+    return [symbols[i::workers] for i in range(workers)]
+
+
+class Shard:
+    def __init__(self, index, symbols):
+        self.index = index
+        self.symbols = symbols
+        self.process = None
+        self.ready = False
+        self.restarts = 0
+        self.started = 0.0
+        self.restart_at = None   # время перезапуска упавшего шарда (time.monotonic)
+
+
+# === Супервизор ===
+class Supervisor:
+    def __init__(self, bot, workers, context=None):
+        self.bot = bot
+        self.context = context or multiprocessing.get_context('spawn')
+        self.shards = [Shard(i, symbols) for i, symbols in enumerate(shard_symbols(list(bot.SYMBOLS), workers))]
+        self.shm_prefix = f"btcbot{os.getpid()}"
+        self.ipc_dir = tempfile.mkdtemp(prefix='btcbot-')
+        self.ipc_path = os.path.join(self.ipc_dir, 'supervisor.sock')
+        self.buffers = []
+        self.calls = 0
+        self._dispatches = set()   # вызовы шардов в работе: ссылки держим, пока задача не завершится
+        self.handlers = {
+            'hello': self._hello,
+            'has_active_orders': self.bot.trader.has_active_orders,
+            'place_order': self._place_order,
+            'monitor_active_orders': self.bot.trader.monitor_active_orders,
+        }
+        self.notifications = {
+            'notify': lambda message: self.bot.send_telegram_message(message),
+            'kline': lambda kline: self.bot.paper_exchange.on_kline(kline),
+            'signal': lambda *args: self.bot.journal.record_signal(*args),
+        }
+
+    # Кольца создаются до запуска шардов и подменяют буферы свечей супервизора
+    def create_buffers(self):
+        for state in self.bot.symbol_states.values():
+            for interval in state.intervals:
+                name = segment_name(self.shm_prefix, state.symbol, interval)
+                buffer = SharedCandleBuffer.create(name, self.bot.CANDLE_CAPACITY)
+                state.candles[interval] = buffer
+                self.buffers.append(buffer)
+
+    def close(self):
+        for shard in self.shards:
+            if shard.process is not None and shard.process.is_alive():
+                shard.process.terminate()
+                shard.process.join(5)
+        for buffer in self.buffers:
+            buffer.unlink()
+        shutil.rmtree(self.ipc_dir, ignore_errors=True)
+
+    def start_shard(self, shard):
+        base = self.bot.METRICS_PORT
+        shard.ready = False
+        shard.started = time.monotonic()
+        shard.process = self.context.Process(
+            target=run_shard, name=f"shard-{shard.index}",
+            args=(shard.index, shard.symbols, self.ipc_path, self.shm_prefix, base + 1 + shard.index if base else 0)
+        )
+        shard.process.start()
+        print(f"🧩 Шард {shard.index} (pid {shard.process.pid}): {', '.join(shard.symbols)}")
+
+    # Упавший шард перезапускается с нарастающей паузой; позиции его символов не трогаются.
+    # Пауза не блокирует цикл: у шарда запоминается restart_at, остальные шарды проверяются дальше
+    async def watch(self):
+        backoffs = {shard.index: Backoff(base=1.0, cap=60.0) for shard in self.shards}
+        while True:
+            await asyncio.sleep(1)
+            self._check_shards(backoffs, time.monotonic())
+
+    def _check_shards(self, backoffs, now):
+        for shard in self.shards:
+            if shard.restart_at is not None:
+                if now >= shard.restart_at:
+                    shard.restart_at = None
+                    self.start_shard(shard)
+                continue
+            if shard.process.is_alive():
+                if shard.ready and now - shard.started > 60:
+                    backoffs[shard.index].reset()
+                continue
+            shard.restarts += 1
+            delay = backoffs[shard.index].next_delay()
+            shard.restart_at = now + delay
+            message = (f"⚠️ Шард {shard.index} ({', '.join(shard.symbols)}) завершился с кодом "
+                       f"{shard.process.exitcode}, перезапуск через {delay:.0f} с")
+            print(message)
+            self.bot.send_telegram_message(message)
+
+    async def serve(self):
+        server = await asyncio.start_unix_server(self._connection, path=self.ipc_path)
+        os.chmod(self.ipc_path, 0o600)
+        async with server:
+            await server.serve_forever()
+
+    async def _connection(self, reader, writer):
+        channel = Channel(reader, writer)
+        try:
+            while True:
+                message = await channel.recv()
+                if message[0] == 'notify':
+                    _, method, args = message
+                    try:
+                        self.notifications[method](*args)
+                    except Exception as e:
+                        logger.error("❌ Уведомление %s от шарда: %s", method, e)
+                    continue
+                # Вызовы выполняются параллельно: ордер одного символа не ждёт проверки другого
+                task = asyncio.create_task(self._dispatch(channel, *message[1:]))
+                self._dispatches.add(task)
+                task.add_done_callback(self._dispatches.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            channel.close()
+
+    async def _dispatch(self, channel, call_id, method, args):
+        self.calls += 1
+        try:
+            reply = ('result', call_id, True, await self.handlers[method](*args))
+        except Exception as e:
+            logger.error("❌ Вызов %s от шарда: %s", method, e, exc_info=True)
+            reply = ('result', call_id, False, f"{type(e).__name__}: {e}")
+        try:
+            await channel.send(reply)
+        except ConnectionError:
+            pass
+
+    async def _hello(self, index, symbols):
+        shard = self.shards[index]
+        shard.ready = True
+        print(f"✅ Шард {index} готов: {', '.join(symbols)}")
+        return True
+
+    async def _place_order(self, symbol, side, quantity, last_price, fill, strategy=''):
+        self.bot.symbol_states[symbol].last_price = last_price
+        return await self.bot.trader.place_order(symbol, side, quantity, fill=fill, strategy=strategy)
+
+    # === Снимок позиций: свечи и индикаторы сохраняют шарды ===
+    def capture_state(self):
+        bot = self.bot
+        return {
+            'symbols': {symbol: {name: getattr(state, name) for name in state.POSITION_FIELDS}
+                        for symbol, state in bot.symbol_states.items()},
+            'orders': dict(bot.order_cache.orders),
+            'positions': dict(bot.order_cache.positions),
+            'entry_prices': dict(bot.order_cache.entry_prices),
+        }
+
+    def restore_state(self):
+        bot = self.bot
+        snapshot = bot.snapshots.load_state()
+        if not snapshot:
+            return
+        saved = snapshot['state']
+        for symbol, state in bot.symbol_states.items():
+            if symbol in saved.get('symbols', {}):
+                state.apply_capture(saved['symbols'][symbol])
+        bot.order_cache.orders = saved.get('orders', {})
+        bot.order_cache.positions = saved.get('positions', {})
+        bot.order_cache.entry_prices = saved.get('entry_prices', {})
+        print("♻️ Снимок позиций восстановлен")
+
+    def metrics(self):
+        return [
+            ('bot_shard_up', "Процесс-шард жив и подключён",
+             {(('shard', str(s.index)),): int(s.ready and s.process is not None and s.process.is_alive())
+              for s in self.shards}),
+            ('bot_shard_restarts', "Перезапусков шарда", {(('shard', str(s.index)),): s.restarts for s in self.shards}),
+            ('bot_supervisor_calls', "Вызовов от шардов по IPC", {(): self.calls}),
+        ]
+
+    async def get_shards(self, update, context):
+        lines = []
+        for shard in self.shards:
+            alive = shard.process is not None and shard.process.is_alive()
+            status = "✅" if alive and shard.ready else "⏳" if alive else "❌"
+            lines.append(f"{status} Шард {shard.index} (pid {shard.process.pid if shard.process else '—'}, "
+                         f"перезапусков {shard.restarts}): {', '.join(shard.symbols)}")
+            for symbol in shard.symbols:
+                candles = self.bot.symbol_states[symbol].candles[self.bot.INTERVAL]
+                lines.append(f"   {symbol} {self.bot.INTERVAL}: {len(candles)} свечей"
+                             + (f", последняя {candles.copy().last('Close'):.2f}$" if len(candles) else ""))
+        lines.append(f"📨 Вызовов по IPC: {self.calls}")
+        await update.message.reply_text("\n".join(lines))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бот по шардам: символы распределяются по процессам")
+    parser.add_argument('--workers', type=int,
+                        default=int(os.getenv("SUPERVISOR_WORKERS", str(max(1, (os.cpu_count() or 2) - 1)))))
+    args = parser.parse_args()
+
+    import bot
+    from metrics import REGISTRY, start_metrics_server
+
+    print(f"🤖 Супервизор запущен: {len(bot.SYMBOLS)} символов на {min(args.workers, len(bot.SYMBOLS))} шардов")
+    if not bot.PAPER_TRADING and (not bot.BINANCE_FUTURES_API_KEY or not bot.BINANCE_FUTURES_SECRET_KEY):
+        print("❌ Не заданы API ключи")
+        exit(1)
+
+    supervisor = Supervisor(bot, args.workers)
+    supervisor.create_buffers()
+    supervisor.restore_state()
+    bot.journal.load()
+    REGISTRY.register_collector(supervisor.metrics)
+
+    async def run():
+        bot.send_telegram_message.start()
+        serve_task = asyncio.ensure_future(supervisor.serve())
+        while not os.path.exists(supervisor.ipc_path):
+            await asyncio.sleep(0.01)
+        for shard in supervisor.shards:
+            supervisor.start_shard(shard)
+        tasks = [
+            serve_task,
+            supervisor.watch(),
+            bot.run_telegram_bot(commands={'shards': supervisor.get_shards}),
+            bot.run_user_data_stream(),
+            bot.snapshots.run(supervisor.capture_state),
+            bot.journal.run(),
+        ]
+        if bot.METRICS_PORT:
+            tasks.append(start_metrics_server(port=bot.METRICS_PORT))
+        await asyncio.gather(*tasks)
+
+    try:
+        asyncio.run(run())
+    finally:
+        supervisor.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+from candle_store import CandleBuffer, APPENDED
+from indicators import StreamingIndicators
+from strategy import indicator_settings
+
+
+# === Состояние одного торгового инструмента ===
+# Свечи и индикаторы хранятся отдельно для каждого интервала,
+# позиция и флаги управления — общие для символа.
+class SymbolState:
+    def __init__(self, symbol, intervals, capacity=1000, features=(), make_buffer=None):
+        self.symbol = symbol
+        self.intervals = list(intervals)
+        # make_buffer(symbol, interval, capacity) — своё хранилище свечей (кольцо в разделяемой памяти у шарда)
+        make_buffer = make_buffer or (lambda symbol, interval, capacity: CandleBuffer(capacity=capacity))
+        self.candles = {interval: make_buffer(symbol, interval, capacity) for interval in self.intervals}
+        # features — индикаторы, запрошенные стратегиями сверх стандартных (см. strategy_runtime.py)
+        self.indicators = {
+            interval: StreamingIndicators(**indicator_settings(), features=features) for interval in self.intervals
+        }
+
+        # === Переменные управления позицией ===
+        self.active_position = None  # 'long' / 'short' / None
+        self.entry_price = 0.0
+        self.oco_set = False
+        self.position_closed_recently = False
+        self.last_position_close_time = 0
+        self.last_price = None  # цена закрытия последней свечи по любому интервалу
+
+    POSITION_FIELDS = (
+        'active_position', 'entry_price', 'oco_set', 'position_closed_recently', 'last_position_close_time', 'last_price'
+    )
+
+    def seed(self, interval, df):
+        candles = self.candles[interval]
+        candles.extend(df)
+        self.indicators[interval].seed(candles['Close'])
+        if len(candles):
+            self.last_price = candles.last('Close')
+        return len(candles)
+
+    # Свечи и индикаторы интервала с нуля — история не продолжает восстановленные свечи
+    # (снимок старше суток): иначе в кольце остался бы разрыв, а индикаторы досчитались
+    # бы поверх восстановленного состояния
+    def reset(self, interval):
+        self.candles[interval].clear()
+        features = list(self.indicators[interval].features)
+        self.indicators[interval] = StreamingIndicators(**indicator_settings(), features=features)
+
+    # Догрузка пропуска поверх уже прогретого состояния: индикаторы обновляются только новыми свечами
+    def append_history(self, interval, df):
+        candles = self.candles[interval]
+        indicators = self.indicators[interval]
+        appended = []
+        times = df.index.as_unit('ms').asi8
+        for timestamp, row in zip(times, df[['Open', 'High', 'Low', 'Close', 'Volume']].to_numpy()):
+            if candles.append(int(timestamp), *row) == APPENDED:
+                indicators.update(float(row[3]))
+                appended.append((int(timestamp), *map(float, row)))
+        if appended:
+            self.last_price = appended[-1][4]
+        return appended
+
+    # === Снимок для тёплого перезапуска ===
+    def capture(self):
+        data = {name: getattr(self, name) for name in self.POSITION_FIELDS}
+        data['indicators'] = {
+            interval: (self.candles[interval].last_time, self.indicators[interval]) for interval in self.intervals
+        }
+        return data
+
+    def apply_capture(self, data):
+        for name in self.POSITION_FIELDS:
+            if name in data and name != 'last_price':
+                setattr(self, name, data[name])
+        if self.last_price is None:
+            self.last_price = data.get('last_price')
+
+    # records — записи журнала snapshot.RECORD. Сохранённые индикаторы берутся, только если
+    # свеча, на которой их сняли, есть в журнале и настройки не менялись; иначе — пересчёт.
+    def restore(self, interval, records, indicators=None, indicators_time=None):
+        candles = self.candles[interval]
+        use_saved = (
+            indicators is not None and indicators_time is not None and len(records) > 0
+            and records['time'][0] <= indicators_time <= records['time'][-1]
+            and _same_settings(indicators, self.indicators[interval])
+        )
+        if use_saved:
+            self.indicators[interval] = indicators
+        for r in records:
+            status = candles.append(int(r['time']), r['open'], r['high'], r['low'], r['close'], r['volume'])
+            if use_saved and status == APPENDED and r['time'] > indicators_time:
+                indicators.update(float(r['close']))
+        if not use_saved:
+            self.indicators[interval].seed(candles['Close'])
+        if len(candles):
+            self.last_price = candles.last('Close')
+        return use_saved
+
+
+def _same_settings(a, b):
+    return (a.window, a.sma_window, a.ema_fast.alpha, a.ema_slow.alpha, a.ema_signal.alpha, set(a.features)) == \
+        (b.window, b.sma_window, b.ema_fast.alpha, b.ema_slow.alpha, b.ema_signal.alpha, set(b.features))
+
+
+def build_symbol_states(symbols, intervals, capacity=1000, features=(), make_buffer=None):
+    return {symbol: SymbolState(symbol, intervals, capacity, features, make_buffer) for symbol in symbols}
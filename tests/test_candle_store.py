@@ -0,0 +1,110 @@
+import os
+
+import numpy as np
+import pytest
+
+import candle_store
+from candle_store import APPENDED, DUPLICATE, OUT_OF_ORDER, SEQ, CandleBuffer, SharedCandleBuffer
+
+
+def fill(buffer, count, start=0):
+    for i in range(start, start + count):
+        buffer.append(i * 60_000, i, i + 0.5, i - 0.5, i + 0.25, 1.0)
+
+
+@pytest.fixture
+def shared():
+    buffer = SharedCandleBuffer.create(f"test_candles_{os.getpid()}", capacity=4)
+    yield buffer
+    buffer.unlink()
+
+
+def test_ring_wraps_and_keeps_last_candles_contiguous():
+    buffer = CandleBuffer(capacity=4)
+    fill(buffer, 7)
+
+    assert len(buffer) == 4
+    assert buffer.count == 7
+    assert list(buffer.times) == [i * 60_000 for i in (3, 4, 5, 6)]
+    assert list(buffer['Open']) == [3.0, 4.0, 5.0, 6.0]
+    assert buffer['Close'].base is not None   # срез, а не копия
+    assert buffer.last() == 6.25
+    assert buffer.last('High') == 6.5
+
+
+def test_append_rejects_duplicates_and_out_of_order():
+    buffer = CandleBuffer(capacity=4)
+    fill(buffer, 3)
+
+    assert buffer.append(2 * 60_000, 0, 0, 0, 0, 0) == DUPLICATE
+    assert buffer.append(60_000, 0, 0, 0, 0, 0) == OUT_OF_ORDER
+    assert buffer.append(3 * 60_000, 3, 3, 3, 3, 3) == APPENDED
+    assert buffer.count == 4
+
+
+def test_copy_after_overflow_is_independent():
+    buffer = CandleBuffer(capacity=4)
+    fill(buffer, 9)
+
+    other = buffer.copy()
+    fill(buffer, 2, start=9)
+
+    assert list(other['Open']) == [5.0, 6.0, 7.0, 8.0]
+    assert other.last() == 8.25
+    assert other.count == 9
+    assert list(buffer['Open']) == [7.0, 8.0, 9.0, 10.0]
+
+
+def test_shared_ring_wraps_like_local(shared):
+    local = CandleBuffer(capacity=4)
+    fill(local, 6)
+    fill(shared, 6)
+
+    reader = SharedCandleBuffer.attach(shared.shm.name, capacity=4)
+    try:
+        assert len(reader) == 4 and reader.count == 6
+        np.testing.assert_array_equal(reader.times, local.times)
+        np.testing.assert_array_equal(reader['Close'], local['Close'])
+        assert reader.last() == local.last()
+        assert int(shared._header[SEQ]) % 2 == 0
+    finally:
+        reader.close()
+
+
+def test_shared_copy_waits_for_writer(shared, monkeypatch):
+    fill(shared, 5)
+    shared._header[SEQ] += 1                  # писатель посреди append()
+    sleeps = []
+
+    def finish_write(delay):
+        sleeps.append(delay)
+        shared._header[SEQ] += 1
+
+    monkeypatch.setattr(candle_store.time, 'sleep', finish_write)
+    other = shared.copy()
+
+    assert len(sleeps) == 1
+    assert other.count == 5
+    assert list(other['Open']) == [1.0, 2.0, 3.0, 4.0]
+
+
+def test_shared_copy_retries_torn_read(shared, monkeypatch):
+    fill(shared, 5)
+    read = CandleBuffer.copy
+    calls = []
+
+    # Пока читатель копирует, писатель успевает добавить свечу — seq сдвигается на 2
+    def racing_copy(buffer):
+        calls.append(buffer.count)
+        other = read(buffer)
+        if len(calls) == 1:
+            fill(shared, 1, start=5)
+        return other
+
+    monkeypatch.setattr(CandleBuffer, 'copy', racing_copy)
+    monkeypatch.setattr(candle_store.time, 'sleep', lambda delay: None)
+    other = shared.copy()
+
+    assert calls == [5, 6]
+    assert other.count == 6
+    assert other.last('Open') == 5.0
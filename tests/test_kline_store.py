@@ -0,0 +1,53 @@
+import asyncio
+
+from kline_store import PAGE_LIMIT, KlineStore
+from rate_limit import LOW
+
+
+class PagedGateway:
+    def __init__(self, first_ms, count, step=60_000):
+        self.rows = [[first_ms + i * step, '1', '2', '0.5', '1.5', '10', first_ms + (i + 1) * step - 1]
+                     for i in range(count)]
+        self.calls = []
+
+    async def klines(self, symbol, interval, start_ms=None, end_ms=None, limit=1000, priority=None):
+        self.calls.append((start_ms, priority))
+        page = [k for k in self.rows if start_ms <= k[0] <= end_ms]
+        return page[:limit]
+
+
+def test_fetch_async_pages_through_gateway(tmp_path):
+    first_ms = 1_700_000_000_000 - 1_700_000_000_000 % 86_400_000
+    gateway = PagedGateway(first_ms, PAGE_LIMIT + 10)
+    store = KlineStore(str(tmp_path))
+
+    fetched = asyncio.run(store.fetch_async(gateway, 'BTCUSDT', '1m', first_ms, first_ms + 10**9))
+
+    assert fetched == PAGE_LIMIT + 10
+    assert len(gateway.calls) == 2
+    assert all(priority == LOW for _, priority in gateway.calls)
+    assert store.time_range('BTCUSDT', '1m')[0] == first_ms
+
+
+class PagedClient:
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def get_klines(self, symbol, interval, startTime, endTime, limit):
+        self.calls.append(startTime)
+        return [k for k in self.rows if startTime <= k[0] <= endTime][:limit]
+
+
+def test_sync_does_not_page_gap_before_window(tmp_path):
+    day_ms = 86_400_000
+    first_ms = 1_700_000_000_000 - 1_700_000_000_000 % day_ms
+    store = KlineStore(str(tmp_path))
+    store.write('BTCUSDT', '1m', [[first_ms], [1], [2], [0.5], [1.5], [10]])   # свеча за 90 дней до окна
+
+    start_ms = first_ms + 90 * day_ms
+    client = PagedClient(PagedGateway(start_ms, 30).rows)
+    fetched = store.sync(client, 'BTCUSDT', '1m', start_ms, start_ms + 30 * 60_000, pause=0)
+
+    assert client.calls == [start_ms]
+    assert fetched == 30
@@ -0,0 +1,35 @@
+import asyncio
+
+from notifier import TelegramNotifier
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append(text)
+
+
+def test_messages_before_loop_wait_for_start():
+    notifier = TelegramNotifier('0:test', '1', batch_window=0.01, min_interval=0)
+    notifier._bot = FakeBot()
+    notifier("до запуска")   # без event loop: без asyncio.run и вложенных циклов
+
+    assert notifier._bot.sent == []
+    asyncio.run(notifier.flush())
+    assert notifier._bot.sent == ["до запуска"]
+
+
+def test_batch_is_packed_into_one_message():
+    notifier = TelegramNotifier('0:test', '1', batch_window=0.05, min_interval=0)
+    notifier._bot = FakeBot()
+
+    async def run():
+        notifier.start()
+        notifier("первое")
+        notifier("второе")
+        await notifier.stop()
+
+    asyncio.run(run())
+    assert notifier._bot.sent == ["первое\n\nвторое"]
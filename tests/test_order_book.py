@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from kline_codec import DepthUpdate
+from order_book import BUY, SELL, OrderBook, OrderBookManager
+
+
+class SnapshotGateway:
+    def __init__(self, *snapshots):
+        self.snapshots = list(snapshots)
+        self.calls = 0
+
+    async def depth(self, symbol, limit):
+        self.calls += 1
+        return self.snapshots.pop(0)
+
+
+def snapshot(last_update_id, bids=((99.0, 1.0),), asks=((101.0, 1.0),)):
+    return {'lastUpdateId': last_update_id, 'bids': [[str(p), str(q)] for p, q in bids],
+            'asks': [[str(p), str(q)] for p, q in asks]}
+
+
+def update(first_id, final_id, prev_final_id, bids=(), asks=()):
+    return DepthUpdate('BTCUSDT', first_id, final_id, prev_final_id, final_id, list(bids), list(asks))
+
+
+async def settle(manager):
+    for _ in range(10):
+        await asyncio.sleep(0)
+    assert all(task.done() for task in manager._resyncs.values())
+
+
+def test_snapshot_applies_buffered_diffs_from_first_applicable_event():
+    gateway = SnapshotGateway(snapshot(102))
+    manager = OrderBookManager(gateway, ['BTCUSDT'], retry_delay=0)
+
+    async def run():
+        manager.on_depth(update(90, 99, 89, bids=[(98.0, 5.0)]))        # старше снимка — отбрасывается
+        manager.on_depth(update(100, 105, 99, bids=[(99.5, 2.0)]))      # U <= 102 <= u — первое применяемое
+        manager.on_depth(update(106, 110, 105, asks=[(100.5, 3.0)]))
+        await settle(manager)
+
+    asyncio.run(run())
+    book = manager.get('BTCUSDT')
+    assert book is not None
+    assert book.last_update_id == 110
+    assert list(book.bids.prices) == [99.0, 99.5]
+    assert list(book.asks.prices) == [100.5, 101.0]
+    assert gateway.calls == 1
+
+
+def test_pu_mismatch_triggers_resync():
+    gateway = SnapshotGateway(snapshot(100), snapshot(120, bids=((97.0, 4.0),)))
+    manager = OrderBookManager(gateway, ['BTCUSDT'], retry_delay=0)
+
+    async def run():
+        manager.on_depth(update(100, 101, 99))
+        await settle(manager)
+        assert manager.get('BTCUSDT') is not None
+        manager.on_depth(update(110, 115, 105))                          # pu=105, а последний u=101
+        assert manager.get('BTCUSDT') is None
+        manager.on_depth(update(116, 121, 115))
+        await settle(manager)
+
+    asyncio.run(run())
+    book = manager.get('BTCUSDT')
+    assert manager.gaps == 1
+    assert gateway.calls == 2
+    assert book.last_update_id == 121
+    assert list(book.bids.prices) == [97.0]
+
+
+def test_zero_quantity_removes_level():
+    book = OrderBook('BTCUSDT')
+    book.load_snapshot(snapshot(10, bids=((98.0, 1.0), (99.0, 2.0)), asks=((101.0, 1.0), (102.0, 2.0))))
+
+    assert book.apply(update(10, 11, 9, bids=[(99.0, 0.0)], asks=[(101.0, 0.0), (103.0, 0.0)]))
+    assert list(book.bids.prices) == [98.0]
+    assert list(book.asks.prices) == [102.0]
+    assert book.best_bid == 98.0 and book.best_ask == 102.0
+
+
+def test_cost_to_fill_walks_levels_and_reports_shortfall():
+    book = OrderBook('BTCUSDT')
+    book.load_snapshot(snapshot(1, bids=((99.0, 1.0), (98.0, 1.0)), asks=((101.0, 1.0), (102.0, 2.0))))
+
+    fill = book.cost_to_fill(BUY, 2.0)
+    assert fill['filled'] == 2.0
+    assert fill['cost'] == pytest.approx(101.0 + 102.0)
+    assert fill['avg_price'] == pytest.approx(101.5)
+    assert fill['worst_price'] == 102.0
+    assert fill['slippage'] == pytest.approx(101.5 / 100.0 - 1)
+
+    fill = book.cost_to_fill(SELL, 5.0)                                  # на стороне bid всего 2.0
+    assert fill['filled'] == 2.0
+    assert fill['avg_price'] == pytest.approx(98.5)
+    assert fill['worst_price'] == 98.0
+
+    book.bids.load([])
+    empty = book.cost_to_fill(SELL, 1.0)
+    assert empty['filled'] == 0.0 and empty['avg_price'] is None
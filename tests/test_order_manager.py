@@ -0,0 +1,97 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+from execution import ExchangeAPIError
+from order_manager import BracketError, OrderManager
+from paper_exchange import PaperExchange, PaperGateway
+
+
+class RecordingGateway(PaperGateway):
+    def __init__(self, exchange):
+        super().__init__(exchange)
+        self.calls = []
+
+    async def create_order(self, **params):
+        self.calls.append(('create_order', params['type']))
+        return await super().create_order(**params)
+
+    async def batch_orders(self, orders):
+        self.calls.append(('batch_orders', tuple(o['type'] for o in orders)))
+        return await super().batch_orders(orders)
+
+
+def make_manager(price=100.0):
+    exchange = PaperExchange(balance=10_000.0, fee_rate=0.0, slippage=0.0)
+    exchange.on_price('BTCUSDT', price)
+    gateway = RecordingGateway(exchange)
+    return OrderManager(gateway), gateway, exchange
+
+
+def test_entry_is_acknowledged_before_protection_batch():
+    manager, gateway, exchange = make_manager()
+    entry, brackets, latencies = asyncio.run(manager.place_bracket('BTCUSDT', 'BUY', 0.002, 101.0, 99.0))
+
+    assert gateway.calls == [('create_order', 'MARKET'),
+                             ('batch_orders', ('TAKE_PROFIT_MARKET', 'STOP_MARKET'))]
+    assert entry['status'] == 'FILLED'
+    assert [o['type'] for o in brackets] == ['TAKE_PROFIT_MARKET', 'STOP_MARKET']
+    assert set(latencies) == {'entry', 'protection'}
+
+
+def test_rejected_entry_sends_no_protection():
+    manager, gateway, _ = make_manager()
+    with pytest.raises(BracketError):
+        asyncio.run(manager.place_bracket('ETHUSDT', 'BUY', 0.002, 101.0, 99.0))
+    assert gateway.calls == [('create_order', 'MARKET')]
+
+
+def test_cancel_siblings_cancels_remaining_leg():
+    manager, _, exchange = make_manager()
+    _, brackets, _ = asyncio.run(manager.place_bracket('BTCUSDT', 'BUY', 0.002, 101.0, 99.0))
+    stop_loss = [o for o in brackets if o['type'] == 'STOP_MARKET']
+
+    canceled, failed = asyncio.run(manager.cancel_siblings('BTCUSDT', stop_loss))
+    assert failed == []
+    assert [o['status'] for o in canceled] == ['CANCELED']
+    assert exchange.orders[stop_loss[0]['orderId']]['status'] == 'CANCELED'
+
+
+class FailingBatchGateway(RecordingGateway):
+    def __init__(self, exchange, fail_legs=False):
+        super().__init__(exchange)
+        self.fail_legs = fail_legs
+
+    async def batch_orders(self, orders):
+        self.calls.append(('batch_orders', tuple(o['type'] for o in orders)))
+        raise aiohttp.ClientConnectionError("соединение сброшено")
+
+    async def create_order(self, **params):
+        if self.fail_legs and params.get('type') != 'MARKET':
+            self.calls.append(('create_order', params['type']))
+            raise ExchangeAPIError(400, '{"code": -1001, "msg": "Internal error"}')
+        return await super().create_order(**params)
+
+
+def test_failed_protection_batch_retries_each_leg():
+    exchange = PaperExchange(balance=10_000.0, fee_rate=0.0, slippage=0.0)
+    exchange.on_price('BTCUSDT', 100.0)
+    gateway = FailingBatchGateway(exchange)
+    _, brackets, _ = asyncio.run(OrderManager(gateway).place_bracket('BTCUSDT', 'BUY', 0.002, 101.0, 99.0))
+
+    assert gateway.calls == [('create_order', 'MARKET'), ('batch_orders', ('TAKE_PROFIT_MARKET', 'STOP_MARKET')),
+                             ('create_order', 'TAKE_PROFIT_MARKET'), ('create_order', 'STOP_MARKET')]
+    assert [o['type'] for o in brackets] == ['TAKE_PROFIT_MARKET', 'STOP_MARKET']
+
+
+def test_failed_protection_batch_flattens_position():
+    exchange = PaperExchange(balance=10_000.0, fee_rate=0.0, slippage=0.0)
+    exchange.on_price('BTCUSDT', 100.0)
+    gateway = FailingBatchGateway(exchange, fail_legs=True)
+    with pytest.raises(BracketError) as error:
+        asyncio.run(OrderManager(gateway).place_bracket('BTCUSDT', 'BUY', 0.002, 101.0, 99.0))
+
+    assert set(error.value.errors) == {'take_profit', 'stop_loss'}
+    assert gateway.calls[-1] == ('create_order', 'MARKET')   # закрытие позиции по рынку
+    assert 'BTCUSDT' not in exchange.positions
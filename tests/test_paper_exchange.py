@@ -0,0 +1,64 @@
+import asyncio
+
+import numpy as np
+
+from headless import import_bot
+from kline_store import KlineStore
+from paper_exchange import PaperExchange, PaperGateway, replay
+from symbol_state import build_symbol_states
+
+
+def synthetic_store(root, symbol, first_ms, count, step=60_000):
+    rng = np.random.default_rng(3)
+    closes = 30_000 * np.exp(np.cumsum(rng.normal(0, 0.002, count)))
+    opens = np.concatenate([[closes[0]], closes[:-1]])
+    rows = [first_ms + np.arange(count) * step, opens, np.maximum(opens, closes) * 1.001,
+            np.minimum(opens, closes) * 0.999, closes, rng.uniform(1, 10, count)]
+    store = KlineStore(str(root))
+    store.write(symbol, '1m', rows)
+    return store
+
+
+def test_replay_uses_own_bot_instance(tmp_path):
+    first_ms = 1_700_000_000_000 - 1_700_000_000_000 % 86_400_000
+    store = synthetic_store(tmp_path, 'BTCUSDT', first_ms, 600)
+    start_ms = first_ms + 300 * 60_000
+
+    result = replay('BTCUSDT', '1m', start_ms, warmup=300, store=store)
+
+    import bot
+    assert result['candles'] == 300
+    # Прогон идёт на своём экземпляре бота: состояние модуля bot не затронуто
+    assert all(len(candles) == 0 for state in bot.symbol_states.values() for candles in state.candles.values())
+    assert bot.trader.order_cache.orders == {}
+
+
+def test_bot_cancels_sibling_leg_after_take_profit():
+    bot = import_bot()
+    exchange = PaperExchange(balance=10_000.0, fee_rate=0.0, slippage=0.0)
+    exchange.on_price('BTCUSDT', 100.0)
+    events = []
+    exchange.listeners.append(events.append)
+    states = build_symbol_states(['BTCUSDT'], ['1m'], features=bot.strategy_registry.requirements())
+    states['BTCUSDT'].last_price = 100.0
+    trader = bot.Trader(PaperGateway(exchange), states, bot.strategy_registry, notify=lambda message: None,
+                        clock=exchange)
+    trader.order_cache.synced = True
+
+    async def drain():
+        while events:
+            await trader.process_user_event(events.pop(0))
+
+    async def run():
+        await trader.place_order('BTCUSDT', 'buy', 0.002)
+        await drain()
+        exchange.on_price('BTCUSDT', 200.0)   # срабатывает тейк-профит
+        stop_loss = next(o for o in exchange.orders.values() if o['type'] == 'STOP_MARKET')
+        assert stop_loss['status'] == 'NEW'   # reduceOnly-нога биржа сама не снимает
+        await drain()
+        return stop_loss
+
+    stop_loss = asyncio.run(run())
+    assert stop_loss['status'] == 'CANCELED'
+    assert exchange.open_orders('BTCUSDT') == []
+    assert not trader.order_cache.has_active_orders('BTCUSDT')
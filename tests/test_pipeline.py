@@ -0,0 +1,49 @@
+import asyncio
+
+from kline_codec import DepthUpdate, Kline
+from pipeline import BLOCK, KlinePipeline
+
+
+class ScriptedDecoder:
+    # Кадр — уже готовый результат разбора; исключение поднимается, как из настоящего декодера
+    skipped = skipped_ticks = 0
+
+    def decode(self, message):
+        if isinstance(message, Exception):
+            raise message
+        return message
+
+
+def kline(open_time, closed=True):
+    return Kline('BTCUSDT', '1m', open_time, open_time + 59_999, 1.0, 2.0, 0.5, 1.5, 10.0, closed)
+
+
+def test_failing_callbacks_do_not_stop_pipeline():
+    closed = []
+
+    async def on_closed(symbol, interval):
+        closed.append((symbol, interval))
+
+    def on_depth(update):
+        raise RuntimeError("стакан рассинхронизирован")
+
+    def on_kline(k):
+        if k.open_time == 0:
+            raise RuntimeError("бумажная биржа")
+
+    pipeline = KlinePipeline(lambda k: True, on_closed, job_policy=BLOCK, decoder=ScriptedDecoder(), on_kline=on_kline, on_depth=on_depth)
+    depth = DepthUpdate('BTCUSDT', 1, 2, 0, 0, [], [])
+
+    async def run():
+        task = asyncio.create_task(pipeline.run())
+        for message in (depth, KeyError('k'), kline(0), kline(60_000)):
+            await pipeline.feed(message)
+        for _ in range(20):
+            await asyncio.sleep(0)
+        assert not task.done()
+        task.cancel()
+
+    asyncio.run(run())
+    assert closed == [('BTCUSDT', '1m'), ('BTCUSDT', '1m')]
+    assert pipeline.parse_errors == 1
+    assert pipeline.callback_errors == 2
@@ -0,0 +1,107 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limit
+from rate_limit import HIGH, LOW, NORMAL, RateLimitGovernor, order_count, request_weight
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+        self._yield = asyncio.sleep
+
+    def monotonic(self):
+        return self.now
+
+    # Отдаёт управление другим задачам и только потом «проходит» время. Как и настоящий
+    # sleep, просыпается чуть позже срока: иначе ошибка округления оставляет ведру долю токена
+    async def sleep(self, delay):
+        self.sleeps.append(delay)
+        await self._yield(0)
+        self.now += delay + 1e-6
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, 'time', SimpleNamespace(monotonic=clock.monotonic))
+    monkeypatch.setattr(rate_limit, 'asyncio', SimpleNamespace(sleep=clock.sleep))
+    return clock
+
+
+def test_request_weight_and_order_count():
+    assert request_weight('GET', '/fapi/v1/openOrders', {'symbol': 'BTCUSDT'}) == 1
+    assert request_weight('GET', '/fapi/v1/openOrders') == 40
+    assert request_weight('GET', '/fapi/v1/depth', {'limit': 1000}) == 20
+    assert request_weight('GET', '/fapi/v1/klines', {'limit': 1500}) == 10
+    assert request_weight('POST', '/fapi/v1/order') == 0
+    batch = json.dumps([{'symbol': 'BTCUSDT'}] * 3)
+    assert order_count('POST', '/fapi/v1/batchOrders', {'batchOrders': batch}) == 3
+    assert order_count('POST', '/fapi/v1/order') == 1
+    assert order_count('DELETE', '/fapi/v1/order') == 0
+
+
+def test_weight_accounting_and_server_sync(clock):
+    governor = RateLimitGovernor(weight_limit=100, order_limit_10s=10, order_limit_1m=50)
+
+    async def run():
+        await governor.acquire(weight=20, priority=NORMAL)
+        await governor.acquire(weight=5, orders=3, priority=HIGH)
+
+    asyncio.run(run())
+    buckets = governor.metrics()['buckets']
+    assert buckets['weight_1m']['used'] == 25
+    assert buckets['orders_10s']['used'] == 3
+    assert buckets['orders_1m']['used'] == 3
+    assert clock.sleeps == []
+
+    # Сервер насчитал больше — верим ему; меньше — локальный счёт не уменьшается
+    governor.update(200, {'X-MBX-USED-WEIGHT-1M': '60', 'X-MBX-ORDER-COUNT-10S': '1'})
+    assert governor.weight.used == 60
+    assert governor.orders_10s.used == 3
+
+    clock.now += 30   # за полминуты ведро веса восполняется наполовину
+    assert governor.metrics()['buckets']['weight_1m']['used'] == 60
+    governor.weight._refill(clock.now)
+    assert governor.weight.used == pytest.approx(10)
+
+
+def test_high_priority_preempts_low(clock):
+    governor = RateLimitGovernor(weight_limit=100)
+    done = []
+
+    async def request(priority, weight):
+        await governor.acquire(weight=weight, priority=priority)
+        done.append(rate_limit.PRIORITY_NAMES[priority])
+
+    async def run():
+        await governor.acquire(weight=60, priority=HIGH)
+        # LOW занимает не больше половины ведра и ждёт; HIGH проходит сразу
+        await asyncio.gather(request(LOW, 1), request(HIGH, 30))
+
+    asyncio.run(run())
+    assert done == ['high', 'low']
+    assert governor.waits == {'high': 0, 'normal': 0, 'low': 1}
+    assert governor.weight.tokens >= 50 - 1 - 1e-9   # LOW дождался резерва для важных запросов
+
+
+@pytest.mark.parametrize('status, headers, pause', [
+    (429, {'Retry-After': '5'}, 5.0),
+    (418, {'Retry-After': '120'}, 120.0),
+    (418, {}, 60.0),
+])
+def test_ban_blocks_all_priorities_until_retry_after(clock, status, headers, pause):
+    governor = RateLimitGovernor()
+    governor.update(status, headers)
+    assert governor.bans == 1
+    assert governor.metrics()['banned_for'] == pause
+
+    started = clock.now
+    asyncio.run(governor.acquire(weight=1, priority=HIGH))
+    assert clock.sleeps == [pause]
+    assert clock.now - started == pytest.approx(pause)
+    assert governor.waits['high'] == 1
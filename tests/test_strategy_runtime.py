@@ -0,0 +1,48 @@
+import pytest
+
+from strategy_runtime import BUY, SELL, Intent, arbitrate
+
+
+def intents(*votes):
+    return [Intent(name, side, weight) for name, side, weight in votes]
+
+
+# (намерения, min_net) → (сторона, net, стратегии в решении)
+CASES = [
+    ('opposing cancel out',
+     intents(('rsi_macd', BUY, 1.0), ('grid', SELL, 1.0)), 0.0,
+     (None, 0.0, ['rsi_macd', 'grid'])),
+    ('same side sums',
+     intents(('rsi_macd', BUY, 1.0), ('grid', BUY, 0.5)), 0.0,
+     (BUY, 1.5, ['rsi_macd', 'grid'])),
+    ('same side sell sums',
+     intents(('rsi_macd', SELL, 1.0), ('grid', SELL, 2.0)), 0.0,
+     (SELL, -3.0, ['rsi_macd', 'grid'])),
+    ('heavier vote wins and is attributed',
+     intents(('rsi_macd', BUY, 1.0), ('grid', SELL, 2.0)), 0.0,
+     (SELL, -1.0, ['grid'])),
+    ('majority wins over single opponent',
+     intents(('a', BUY, 1.0), ('b', SELL, 1.0), ('c', BUY, 1.0)), 0.0,
+     (BUY, 1.0, ['a', 'c'])),
+    ('net at min_net is no trade',
+     intents(('rsi_macd', BUY, 1.0), ('grid', SELL, 0.5)), 0.5,
+     (None, 0.5, ['rsi_macd', 'grid'])),
+    ('net above min_net trades',
+     intents(('rsi_macd', BUY, 1.0)), 0.5,
+     (BUY, 1.0, ['rsi_macd'])),
+]
+
+
+@pytest.mark.parametrize('votes, min_net, expected', [case[1:] for case in CASES], ids=[case[0] for case in CASES])
+def test_arbitrate(votes, min_net, expected):
+    side, net, strategies = expected
+    decision = arbitrate(votes, min_net, quantity=0.01)
+
+    assert decision.side == side
+    assert decision.net == pytest.approx(net)
+    assert [i.strategy for i in decision.intents] == strategies
+    assert decision.quantity == (0.01 if side else 0.0)
+
+
+def test_arbitrate_without_intents_is_none():
+    assert arbitrate([]) is None
@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+import pytest
+
+from supervisor import Supervisor
+
+
+class FakeProcess:
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.exitcode = None if alive else 1
+        self.pid = 0
+
+    def is_alive(self):
+        return self.alive
+
+    def crash(self):
+        self.alive, self.exitcode = False, 1
+
+    def terminate(self):
+        self.crash()
+
+    def join(self, timeout=None):
+        pass
+
+
+class FixedBackoff:
+    def __init__(self, delay):
+        self.delay = delay
+
+    def next_delay(self):
+        return self.delay
+
+    def reset(self):
+        pass
+
+
+@pytest.fixture
+def supervisor():
+    sent = []
+    bot = SimpleNamespace(SYMBOLS=['BTCUSDT', 'ETHUSDT'], METRICS_PORT=0, send_telegram_message=sent.append,
+                          trader=SimpleNamespace(has_active_orders=None, monitor_active_orders=None))
+    supervisor = Supervisor(bot, workers=2)
+    supervisor.started = []
+    supervisor.sent = sent
+
+    def start_shard(shard):
+        supervisor.started.append(shard.index)
+        shard.process = FakeProcess()
+
+    supervisor.start_shard = start_shard
+    for shard in supervisor.shards:
+        shard.process = FakeProcess()
+    yield supervisor
+    supervisor.close()
+
+
+def test_restart_delay_does_not_block_other_shards(supervisor):
+    first, second = supervisor.shards
+    backoffs = {first.index: FixedBackoff(30.0), second.index: FixedBackoff(2.0)}
+
+    first.process.crash()
+    supervisor._check_shards(backoffs, now=100.0)
+    assert first.restart_at == 130.0
+    assert first.restarts == 1
+    assert supervisor.started == []
+
+    # Пока первый шард ждёт своей паузы, падение второго замечается и перезапускается вовремя
+    second.process.crash()
+    supervisor._check_shards(backoffs, now=101.0)
+    assert second.restart_at == 103.0
+    supervisor._check_shards(backoffs, now=103.0)
+    assert supervisor.started == [second.index]
+    assert second.restart_at is None
+
+    supervisor._check_shards(backoffs, now=129.0)
+    assert supervisor.started == [second.index]
+    supervisor._check_shards(backoffs, now=130.0)
+    assert supervisor.started == [second.index, first.index]
+    assert first.restarts == 1 and second.restarts == 1
+    assert len(supervisor.sent) == 2
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from symbol_state import SymbolState
+
+
+def candles(first_ms, count, seed, step=60_000):
+    rng = np.random.default_rng(seed)
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, count)))
+    index = pd.to_datetime(first_ms + np.arange(count) * step, unit='ms')
+    return pd.DataFrame({'Open': closes, 'High': closes * 1.01, 'Low': closes * 0.99, 'Close': closes,
+                         'Volume': np.ones(count)}, index=index)
+
+
+def test_reset_before_seed_discards_stale_state():
+    stale = candles(1_700_000_000_000, 300, seed=1)
+    fresh = candles(1_700_000_000_000 + 3 * 86_400_000, 300, seed=2)
+
+    restored = SymbolState('BTCUSDT', ['1m'], capacity=500, features=['sma:200'])
+    restored.seed('1m', stale)
+    restored.reset('1m')
+    restored.seed('1m', fresh)
+
+    clean = SymbolState('BTCUSDT', ['1m'], capacity=500, features=['sma:200'])
+    clean.seed('1m', fresh)
+
+    assert len(restored.candles['1m']) == 300
+    assert restored.candles['1m'].times[0] == clean.candles['1m'].times[0]
+    assert restored.indicators['1m'].latest == clean.indicators['1m'].latest
+    assert set(restored.indicators['1m'].features) == {'sma:200'}
@@ -0,0 +1,89 @@
+import pytest
+
+from trade_journal import FILL, TradeJournal, TradeStats, read_journal, replay_stats
+
+
+def order_event(side, quantity, price, realized=0.0, fee=0.0, asset='USDT', order_type='MARKET', time_ms=0, order_id=1):
+    return {'e': 'ORDER_TRADE_UPDATE', 'E': time_ms, 'o': {
+        's': 'BTCUSDT', 'i': order_id, 'S': side, 'o': order_type, 'x': 'TRADE', 'X': 'FILLED',
+        'l': str(quantity), 'L': str(price), 'rp': str(realized), 'n': str(fee), 'N': asset, 'T': time_ms,
+    }}
+
+
+def fill(side, quantity, price, realized=0.0, fee=0.0, asset='USDT', strategy='grid', time_ms=0, order_type='MARKET'):
+    return (time_ms, FILL, side, 'BTCUSDT', strategy, order_type, 'FILLED', 1, price, quantity, realized, fee, asset)
+
+
+def test_round_trip_closes_trade():
+    stats = TradeStats(keep_trades=True)
+    stats.apply(fill(1, 0.002, 100.0, fee=0.1, time_ms=1_000))
+    stats.apply(fill(-1, 0.002, 110.0, realized=0.02, fee=0.1, time_ms=61_000, order_type='TAKE_PROFIT_MARKET'))
+
+    total = stats.total
+    assert total.trades == 1 and total.fills == 2
+    assert total.net == pytest.approx(0.02 - 0.2)
+    assert total.wins == 0
+    assert total.avg_hold_seconds == pytest.approx(60.0)
+    assert stats.strategies['grid'].trades == 1
+    assert stats.open == {}
+    assert stats.closed[0][2] == 'long' and stats.closed[0][5] == 'take_profit'
+
+
+def test_reversal_closes_and_opens_remainder():
+    stats = TradeStats()
+    stats.apply(fill(1, 0.002, 100.0, strategy='grid', time_ms=0))
+    stats.apply(fill(-1, 0.003, 105.0, realized=0.01, strategy='rsi_macd', time_ms=5_000))
+
+    assert stats.strategies['grid'].trades == 1
+    assert stats.strategies['grid'].wins == 1
+    trade = stats.open['BTCUSDT']
+    assert trade.quantity == pytest.approx(-0.001)
+    assert trade.strategy == 'rsi_macd'
+    assert trade.opened_ms == 5_000 and trade.entry_price == 105.0
+
+
+def test_scale_in_averages_entry_price():
+    stats = TradeStats()
+    stats.apply(fill(-1, 0.001, 100.0))
+    stats.apply(fill(-1, 0.001, 110.0))
+    assert stats.open['BTCUSDT'].entry_price == pytest.approx(105.0)
+    stats.apply(fill(1, 0.002, 100.0, realized=0.01))
+    assert stats.total.trades == 1 and stats.total.wins == 1
+
+
+def test_foreign_commission_kept_out_of_pnl():
+    stats = TradeStats()
+    stats.apply(fill(1, 0.002, 100.0, fee=0.0003, asset='BNB'))
+    stats.apply(fill(-1, 0.002, 101.0, realized=0.002, fee=0.0003, asset='BNB'))
+    assert stats.total.fees == 0.0
+    assert stats.total.net == pytest.approx(0.002)
+    assert stats.total.wins == 1
+    assert stats.other_fees == {'BNB': pytest.approx(0.0006)}
+
+
+def test_journal_replays_to_same_aggregates(tmp_path):
+    journal = TradeJournal(str(tmp_path), fsync=False)
+    journal.record_signal(0, 'BTCUSDT', 'grid', 'buy', 100.0)
+    journal.attribute('BTCUSDT', 'grid')
+    journal.record_order_event(order_event('BUY', 0.002, 100.0, fee=0.08, time_ms=0))
+    journal.record_order_event(order_event('SELL', 0.002, 99.0, realized=-0.002, fee=0.08, time_ms=30_000,
+                                           order_type='STOP_MARKET', order_id=2))
+    journal.flush()
+
+    replayed = replay_stats(read_journal(journal.path))
+    assert replayed.summary()['total'] == journal.stats.summary()['total']
+    assert replayed.strategies['grid'].trades == 1
+    assert replayed.closed[0][5] == 'stop_loss'
+
+    reloaded = TradeJournal(str(tmp_path))
+    assert reloaded.load() == 3
+    assert reloaded.stats.total.signals == 1
+
+
+def test_load_truncates_torn_record(tmp_path):
+    journal = TradeJournal(str(tmp_path), fsync=False)
+    journal.record_signal(0, 'BTCUSDT', 'grid', 'sell', 100.0)
+    journal.flush()
+    with open(journal.path, 'ab') as f:
+        f.write(b'\x00' * 7)
+    assert TradeJournal(str(tmp_path)).load() == 1
@@ -0,0 +1,156 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+import websockets.exceptions
+
+import websocket_handler
+from websocket_handler import Backoff, BinanceFuturesWebSocketManager
+
+DROP = object()   # соединение обрывается
+
+
+def frame(stream, event_time, **data):
+    return json.dumps({'stream': stream, 'data': {'e': 'aggTrade', 'E': event_time, **data}})
+
+
+class FakeSocket:
+    def __init__(self, script):
+        self.script = list(script)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def recv(self):
+        await asyncio.sleep(0)   # соединения читают вперемешку
+        if not self.script:
+            await asyncio.Event().wait()
+        item = self.script.pop(0)
+        if item is DROP:
+            raise ConnectionResetError("сеть пропала")
+        return item
+
+
+# Источник сообщений: каждое подключение получает следующий сценарий по порядку
+class FakeSource:
+    def __init__(self, *scripts):
+        self.scripts = list(scripts)
+        self.connects = 0
+
+    def connect(self, url):
+        self.connects += 1
+        return FakeSocket(self.scripts.pop(0) if self.scripts else [])
+
+
+@pytest.fixture
+def source(monkeypatch):
+    def install(*scripts):
+        fake = FakeSource(*scripts)
+        monkeypatch.setattr(websocket_handler, 'websockets',
+                            SimpleNamespace(connect=fake.connect, exceptions=websockets.exceptions))
+        return fake
+    return install
+
+
+async def run_until(manager, done, timeout=2.0):
+    task = asyncio.create_task(manager.start())
+    try:
+        for _ in range(int(timeout / 0.01)):
+            if done():
+                return
+            await asyncio.sleep(0.01)
+        raise AssertionError("не дождались событий")
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+def test_hot_standby_delivers_each_event_once(source):
+    a, b, c, d = (frame('btcusdt@aggTrade', 1000 + i, a=i) for i in range(4))
+    source([a, b, c], [b, a, c, d])
+    received = []
+
+    async def callback(msg):
+        received.append(msg['a'])
+
+    manager = BinanceFuturesWebSocketManager(['BTCUSDT'], '1m', callback, connections=2)
+
+    asyncio.run(run_until(manager, lambda: len(received) == 4))
+    assert sorted(received) == [0, 1, 2, 3]
+
+
+def test_single_connection_does_not_dedup(source):
+    a = frame('btcusdt@aggTrade', 1000, a=1)
+    source([a, a])
+    received = []
+
+    async def callback(msg):
+        received.append(msg['a'])
+
+    manager = BinanceFuturesWebSocketManager(['BTCUSDT'], '1m', callback)
+
+    asyncio.run(run_until(manager, lambda: len(received) == 2))
+    assert received == [1, 1]
+
+
+def test_resume_backfills_after_full_outage(source):
+    fake = source([frame('btcusdt@aggTrade', 1000, a=1), DROP], [frame('btcusdt@aggTrade', 2000, a=2)])
+    events = []
+
+    async def callback(msg):
+        events.append(('frame', msg['a']))
+
+    async def on_resume(down_since_ms):
+        events.append(('resume', down_since_ms))
+
+    manager = BinanceFuturesWebSocketManager(['BTCUSDT'], '1m', callback, on_resume=on_resume,
+                                             backoff_base=0.001)
+
+    asyncio.run(run_until(manager, lambda: len(events) == 3))
+    assert fake.connects == 2
+    assert [kind for kind, _ in events] == ['frame', 'resume', 'frame']   # догрузка до новых кадров
+    assert isinstance(events[1][1], int)
+
+
+def test_no_resume_while_standby_connection_is_up(source):
+    fake = source([DROP], [], [frame('btcusdt@aggTrade', 1000, a=1)])
+    resumes, received = [], []
+
+    async def callback(msg):
+        received.append(msg['a'])
+
+    async def on_resume(down_since_ms):
+        resumes.append(down_since_ms)
+
+    manager = BinanceFuturesWebSocketManager(['BTCUSDT'], '1m', callback, connections=2, on_resume=on_resume,
+                                             backoff_base=0.001)
+
+    asyncio.run(run_until(manager, lambda: received == [1]))
+    assert fake.connects == 3
+    assert resumes == []
+
+
+def test_backoff_full_jitter_bounds(monkeypatch):
+    bounds = []
+    monkeypatch.setattr(websocket_handler, 'random',
+                        SimpleNamespace(uniform=lambda low, high: bounds.append((low, high)) or high))
+    backoff = Backoff(base=0.5, cap=4.0)
+
+    delays = [backoff.next_delay() for _ in range(6)]
+    assert bounds == [(0, 0.5), (0, 1.0), (0, 2.0), (0, 4.0), (0, 4.0), (0, 4.0)]
+    assert delays == [0.5, 1.0, 2.0, 4.0, 4.0, 4.0]
+
+    backoff.reset()
+    backoff.next_delay()
+    assert bounds[-1] == (0, 0.5)
+
+
+def test_backoff_delays_stay_within_cap():
+    backoff = Backoff(base=0.5, cap=30.0)
+    for attempt in range(20):
+        delay = backoff.next_delay()
+        assert 0 <= delay <= min(30.0, 0.5 * 2 ** attempt)
@@ -0,0 +1,114 @@
+import logging
+import re
+
+from kline_codec import Kline
+
+logger = logging.getLogger(__name__)
+
+# === Свечи из потока сделок aggTrade ===
+# Один поток aggTrade на символ даёт сколько угодно своих таймфреймов:
+#   15s, 30s, 1m …  — свечи по времени
+#   v50, v2.5       — свечи по объёму (закрываются, когда набран объём в базовой валюте)
+#   t500            — свечи по числу сделок
+# Каждая сделка обрабатывается за один проход, закрытые бары уходят тем же потребителям,
+# что и биржевые kline. Время открытия баров строго растёт, чтобы CandleBuffer не счёл
+# соседние бары дубликатами.
+
+TIME_UNITS_MS = {'s': 1000, 'm': 60_000, 'h': 3_600_000}
+_SPEC = re.compile(r'^(?:(?P<count>\d+)(?P<unit>[smh])|v(?P<volume>\d+(?:\.\d+)?)|t(?P<ticks>\d+))$')
+
+
+def parse_bar_spec(spec):
+    match = _SPEC.match(spec)
+    if not match:
+        raise ValueError(f"Неизвестный таймфрейм: {spec} (ожидается 15s / 1m / v50 / t500)")
+    if match['count']:
+        return 'time', int(match['count']) * TIME_UNITS_MS[match['unit']]
+    if match['volume']:
+        return 'volume', float(match['volume'])
+    return 'tick', int(match['ticks'])
+
+
+def is_bar_spec(spec):
+    return _SPEC.match(spec) is not None
+
+
+class BarBuilder:
+    __slots__ = ('symbol', 'spec', 'kind', 'size', 'open_time', 'high', 'low', 'open', 'close',
+                 'volume', 'trades', 'last_time', '_last_open')
+
+    def __init__(self, symbol, spec):
+        self.symbol = symbol
+        self.spec = spec
+        self.kind, self.size = parse_bar_spec(spec)
+        self.open_time = None   # None — бар ещё не начат
+        self._last_open = -1
+
+    def update(self, price, quantity, trade_time):
+        closed = None
+        if self.kind == 'time':
+            bucket = trade_time - trade_time % self.size
+            if self.open_time is not None and bucket != self.open_time:
+                closed = self._close(self.open_time + self.size - 1)
+            if self.open_time is None:
+                self._start(bucket, price)
+        elif self.open_time is None:
+            self._start(max(trade_time, self._last_open + 1), price)
+
+        if price > self.high:
+            self.high = price
+        elif price < self.low:
+            self.low = price
+        self.close = price
+        self.volume += quantity
+        self.trades += 1
+        self.last_time = trade_time
+
+        # Бары по объёму и числу сделок закрываются на сделке, добравшей порог (сделка не делится)
+        if self.kind == 'volume' and self.volume >= self.size:
+            return closed or self._close(trade_time)
+        if self.kind == 'tick' and self.trades >= self.size:
+            return closed or self._close(trade_time)
+        return closed
+
+    # Незакрытый бар (для графиков и мониторинга)
+    def forming(self):
+        if self.open_time is None:
+            return None
+        return Kline(self.symbol, self.spec, self.open_time, self.last_time,
+                     self.open, self.high, self.low, self.close, self.volume, False)
+
+    def _start(self, open_time, price):
+        self.open_time = open_time
+        self._last_open = open_time
+        self.open = self.high = self.low = self.close = price
+        self.volume = 0.0
+        self.trades = 0
+
+    def _close(self, close_time):
+        bar = Kline(self.symbol, self.spec, self.open_time, close_time,
+                    self.open, self.high, self.low, self.close, self.volume, True)
+        self.open_time = None
+        return bar
+
+
+# === Все таймфреймы всех символов: сделка → список закрытых баров ===
+class TradeBarAggregator:
+    def __init__(self, symbols, specs):
+        self.builders = {symbol: [BarBuilder(symbol, spec) for spec in specs] for symbol in symbols}
+        self.trades = 0
+
+    def update(self, trade):
+        builders = self.builders.get(trade.symbol)
+        if not builders:
+            return []
+        self.trades += 1
+        bars = []
+        for builder in builders:
+            bar = builder.update(trade.price, trade.quantity, trade.time)
+            if bar is not None:
+                bars.append(bar)
+        return bars
+
+    def forming(self, symbol):
+        return [bar for bar in (b.forming() for b in self.builders.get(symbol, [])) if bar is not None]
@@ -0,0 +1,358 @@
+import argparse
+import asyncio
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# === Журнал сделок: сигналы, ордера и исполнения ===
+# Файл только на дозапись: {root}/trades.bin — записи фиксированного размера (RECORD).
+# Горячий путь кладёт запись в список и сразу обновляет агрегаты TradeStats за O(1),
+# на диск записи уходят из фоновой задачи в отдельном потоке (как журнал свечей snapshot.py).
+# При старте файл проигрывается в агрегаты; тот же файл читают анализ и бэктест — без REST.
+
+SIGNAL = 1   # намерение стратегии (side, цена закрытия свечи)
+ORDER = 2    # ордер принят, отменён или истёк (ORDER_TRADE_UPDATE)
+FILL = 3     # исполнение: цена и объём сделки, реализованный PnL и комиссия биржи
+KIND_NAMES = {SIGNAL: 'signal', ORDER: 'order', FILL: 'fill'}
+
+RECORD = np.dtype([
+    ('time', '<i8'), ('kind', 'u1'), ('side', 'i1'), ('symbol', 'S16'), ('strategy', 'S16'),
+    ('order_type', 'S20'), ('status', 'S16'), ('order_id', '<i8'),
+    ('price', '<f8'), ('quantity', '<f8'), ('realized_pnl', '<f8'), ('commission', '<f8'), ('commission_asset', 'S8'),
+])
+DEFAULT_ROOT = os.getenv("TRADE_JOURNAL_DIR", "data/journal")
+ORDER_EVENTS = ('NEW', 'CANCELED', 'EXPIRED')   # типы исполнения x, которые журналируются как ORDER
+EXIT_REASONS = {'TAKE_PROFIT_MARKET': 'take_profit', 'STOP_MARKET': 'stop_loss'}
+QTY_EPSILON = 1e-9
+
+
+def side_sign(side):
+    return 1 if str(side).lower() == 'buy' else -1
+
+
+# Комиссия в котируемой валюте символа (USDT у BTCUSDT) складывается с PnL; в другой (BNB со скидкой) — нет
+def is_quote_fee(symbol, asset):
+    return not asset or symbol.endswith(asset)
+
+
+# === Агрегаты ===
+class StrategyStats:
+    __slots__ = ('signals', 'orders', 'fills', 'trades', 'wins', 'realized', 'fees', 'hold_ms', 'best', 'worst')
+
+    def __init__(self):
+        self.signals = 0
+        self.orders = 0
+        self.fills = 0
+        self.trades = 0       # закрытых сделок (позиция вернулась в ноль)
+        self.wins = 0
+        self.realized = 0.0   # реализованный PnL биржи по всем исполнениям
+        self.fees = 0.0
+        self.hold_ms = 0
+        self.best = None
+        self.worst = None
+
+    @property
+    def net(self):
+        return self.realized - self.fees
+
+    @property
+    def win_rate(self):
+        return self.wins / self.trades if self.trades else 0.0
+
+    @property
+    def avg_hold_seconds(self):
+        return self.hold_ms / self.trades / 1000 if self.trades else 0.0
+
+    def summary(self):
+        return {
+            'signals': self.signals, 'orders': self.orders, 'fills': self.fills, 'trades': self.trades,
+            'wins': self.wins, 'win_rate': self.win_rate, 'realized_pnl': self.realized, 'fees': self.fees,
+            'net_pnl': self.net, 'avg_hold_seconds': self.avg_hold_seconds, 'best': self.best, 'worst': self.worst,
+        }
+
+
+# Позиция от первого исполнения до возврата в ноль
+class OpenTrade:
+    __slots__ = ('strategy', 'quantity', 'opened_ms', 'entry_price', 'realized', 'fees')
+
+    def __init__(self, strategy, opened_ms, entry_price):
+        self.strategy = strategy
+        self.quantity = 0.0   # знак — сторона
+        self.opened_ms = opened_ms
+        self.entry_price = entry_price
+        self.realized = 0.0
+        self.fees = 0.0
+
+
+class TradeStats:
+    def __init__(self, keep_trades=False):
+        self.total = StrategyStats()
+        self.strategies = {}   # стратегия → StrategyStats
+        self.open = {}         # symbol → OpenTrade
+        self.records = 0
+        self.other_fees = {}   # актив → комиссии не в котируемой валюте (в net_pnl не входят)
+        # Закрытые сделки в формате backtest.TRADE_COLUMNS — только для разбора журнала, не в боте
+        self.closed = [] if keep_trades else None
+
+    def _targets(self, strategy):
+        stats = self.strategies.get(strategy)
+        if stats is None:
+            stats = self.strategies[strategy] = StrategyStats()
+        return self.total, stats
+
+    # Запись — кортеж полей в порядке RECORD, строки уже декодированы
+    def apply(self, row):
+        (time_ms, kind, side, symbol, strategy, order_type, status, _order_id,
+         price, quantity, realized, commission, commission_asset) = row
+        self.records += 1
+        if kind == SIGNAL:
+            for stats in self._targets(strategy):
+                stats.signals += 1
+        elif kind == ORDER:
+            if status == 'NEW':
+                for stats in self._targets(strategy):
+                    stats.orders += 1
+        elif kind == FILL:
+            if not is_quote_fee(symbol, commission_asset):
+                self.other_fees[commission_asset] = self.other_fees.get(commission_asset, 0.0) + commission
+                commission = 0.0
+            self._fill(time_ms, side, symbol, strategy, order_type, price, quantity, realized, commission)
+
+    def _fill(self, time_ms, side, symbol, strategy, order_type, price, quantity, realized, commission):
+        trade = self.open.get(symbol)
+        if trade is None:
+            trade = self.open[symbol] = OpenTrade(strategy, time_ms, price)
+        for stats in self._targets(trade.strategy):
+            stats.fills += 1
+            stats.realized += realized
+            stats.fees += commission
+        trade.realized += realized
+        trade.fees += commission
+        before = trade.quantity
+        after = before + side * quantity
+        if abs(after) < QTY_EPSILON:
+            self._close(symbol, trade, time_ms, price, order_type)
+        elif before and after * before < 0:
+            # Разворот одним исполнением: старая сделка закрыта, остаток открывает новую
+            self._close(symbol, trade, time_ms, price, order_type)
+            trade = self.open[symbol] = OpenTrade(strategy, time_ms, price)
+            trade.quantity = after
+        else:
+            if abs(after) > abs(before):
+                # Усреднение цены входа при доборе
+                trade.entry_price = (trade.entry_price * abs(before) + price * (abs(after) - abs(before))) / abs(after)
+            trade.quantity = after
+
+    def _close(self, symbol, trade, time_ms, price, order_type):
+        del self.open[symbol]
+        net = trade.realized - trade.fees
+        hold_ms = max(0, time_ms - trade.opened_ms)
+        for stats in self._targets(trade.strategy):
+            stats.trades += 1
+            stats.wins += net > 0
+            stats.hold_ms += hold_ms
+            stats.best = net if stats.best is None else max(stats.best, net)
+            stats.worst = net if stats.worst is None else min(stats.worst, net)
+        if self.closed is not None:
+            self.closed.append((
+                trade.opened_ms, time_ms, 'long' if trade.quantity > 0 else 'short', trade.entry_price, price,
+                EXIT_REASONS.get(order_type, order_type.lower() or 'market'), net, trade.fees
+            ))
+
+    def summary(self):
+        return {
+            'records': self.records,
+            'other_fees': dict(self.other_fees),
+            'total': self.total.summary(),
+            'strategies': {name: stats.summary() for name, stats in self.strategies.items()},
+            'open': {symbol: {'strategy': t.strategy, 'quantity': t.quantity, 'entry_price': t.entry_price,
+                              'opened_ms': t.opened_ms} for symbol, t in self.open.items()},
+        }
+
+
+# === Журнал ===
+# root=None — только агрегаты в памяти (прогон paper_exchange.replay, бенчмарк)
+class TradeJournal:
+    def __init__(self, root=DEFAULT_ROOT, flush_interval=1.0, fsync=True):
+        self.root = root
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.stats = TradeStats()
+        self._pending = []
+        self._strategies = {}   # symbol → стратегия последнего входа: ей приписываются исполнения позиции
+        self.flushes = 0
+
+    @property
+    def path(self):
+        return os.path.join(self.root, 'trades.bin') if self.root else None
+
+    # === Горячий путь ===
+    def _record(self, row):
+        self.stats.apply(row)
+        if self.root:
+            self._pending.append(row)
+
+    def record_signal(self, time_ms, symbol, strategy, side, price):
+        self._record((time_ms, SIGNAL, side_sign(side), symbol, strategy, '', '', 0, price, 0.0, 0.0, 0.0, ''))
+
+    # Вызывается до отправки входа: исполнение из user data stream может прийти раньше ответа REST
+    def attribute(self, symbol, strategy):
+        self._strategies[symbol] = strategy
+
+    # ORDER_TRADE_UPDATE user data stream → запись ORDER или FILL
+    def record_order_event(self, event):
+        o = event['o']
+        execution = o.get('x')
+        symbol = o['s']
+        trade = self.stats.open.get(symbol)
+        strategy = trade.strategy if trade is not None else self._strategies.get(symbol, '')
+        time_ms = int(o.get('T') or event.get('E') or 0)
+        if execution == 'TRADE':
+            quantity = float(o.get('l') or 0)
+            if quantity <= 0:
+                return
+            self._record((time_ms, FILL, side_sign(o['S']), symbol, strategy, o.get('o', ''), o.get('X', ''),
+                          int(o['i']), float(o.get('L') or 0), quantity, float(o.get('rp') or 0),
+                          float(o.get('n') or 0), o.get('N') or ''))
+        elif execution in ORDER_EVENTS:
+            self._record((time_ms, ORDER, side_sign(o['S']), symbol, strategy, o.get('o', ''), execution,
+                          int(o['i']), float(o.get('p') or 0) or float(o.get('sp') or 0), float(o.get('q') or 0),
+                          0.0, 0.0, ''))
+
+    # === Фоновая запись ===
+    async def run(self):
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                pending, self._pending = self._pending, []
+                if pending:
+                    await asyncio.to_thread(self._write, pending)
+        finally:
+            self.flush()
+
+    def flush(self):
+        pending, self._pending = self._pending, []
+        if pending:
+            self._write(pending)
+
+    def _write(self, rows):
+        os.makedirs(self.root, exist_ok=True)
+        records = np.array(rows, dtype=RECORD)
+        with open(self.path, 'ab') as f:
+            f.write(records.tobytes())
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        self.flushes += 1
+
+    # === Восстановление агрегатов при старте ===
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        size = os.path.getsize(self.path)
+        if size % RECORD.itemsize:
+            # Хвост от записи, оборванной при сбое, отрезается до первой дозаписи
+            os.truncate(self.path, size - size % RECORD.itemsize)
+            logger.warning("⚠️ Журнал %s: отрезана неполная запись", self.path)
+        records = read_journal(self.path)
+        for row in decode_rows(records):
+            self.stats.apply(row)
+        for symbol, trade in self.stats.open.items():
+            self._strategies[symbol] = trade.strategy
+        logger.info("📒 Журнал сделок: %d записей", len(records))
+        return len(records)
+
+    def metrics(self):
+        stats = self.stats
+        by_strategy = dict(stats.strategies)
+        return [
+            ('bot_journal_records', "Записей в журнале сделок", {(): stats.records}),
+            ('bot_journal_realized_pnl', "Реализованный PnL за вычетом комиссий",
+             {(('strategy', name),): s.net for name, s in by_strategy.items()}),
+            ('bot_journal_trades', "Закрытых сделок", {(('strategy', name),): s.trades for name, s in by_strategy.items()}),
+            ('bot_journal_wins', "Прибыльных сделок", {(('strategy', name),): s.wins for name, s in by_strategy.items()}),
+        ]
+
+
+# === Чтение журнала для анализа и бэктеста ===
+def read_journal(path=None, kinds=None):
+    path = path or os.path.join(DEFAULT_ROOT, 'trades.bin')
+    if not os.path.exists(path):
+        return np.empty(0, dtype=RECORD)
+    count = os.path.getsize(path) // RECORD.itemsize
+    if count == 0:
+        return np.empty(0, dtype=RECORD)
+    records = np.array(np.memmap(path, dtype=RECORD, mode='r', shape=(count,)))
+    if kinds is not None:
+        records = records[np.isin(records['kind'], kinds)]
+    return records
+
+
+def decode_rows(records):
+    for row in records.tolist():
+        yield tuple(value.decode() if isinstance(value, bytes) else value for value in row)
+
+
+def replay_stats(records, keep_trades=True):
+    stats = TradeStats(keep_trades=keep_trades)
+    for row in decode_rows(records):
+        stats.apply(row)
+    return stats
+
+
+def journal_frame(records):
+    import pandas as pd
+
+    frame = pd.DataFrame(records)
+    for column in ('symbol', 'strategy', 'order_type', 'status', 'commission_asset'):
+        frame[column] = frame[column].str.decode('ascii')
+    frame['kind'] = frame['kind'].map(KIND_NAMES)
+    frame['time'] = pd.to_datetime(frame['time'], unit='ms')
+    return frame.set_index('time')
+
+
+# Закрытые сделки журнала в формате backtest.run_backtest — живые результаты сравниваются с бэктестом
+def journal_trades(records, stats=None):
+    import pandas as pd
+    from backtest import TRADE_COLUMNS
+
+    stats = stats or replay_stats(records)
+    trades = pd.DataFrame(stats.closed, columns=TRADE_COLUMNS)
+    trades['entry_time'] = pd.to_datetime(trades['entry_time'], unit='ms')
+    trades['exit_time'] = pd.to_datetime(trades['exit_time'], unit='ms')
+    return trades
+
+
+if __name__ == "__main__":
+    from backtest import summarize
+
+    parser = argparse.ArgumentParser(description="Статистика по журналу сделок бота")
+    parser.add_argument('path', nargs='?', default=os.path.join(DEFAULT_ROOT, 'trades.bin'))
+    parser.add_argument('--trades', help="куда сохранить закрытые сделки (CSV, колонки как у backtest.py)")
+    parser.add_argument('--records', help="куда сохранить все записи журнала (CSV)")
+    args = parser.parse_args()
+
+    records = read_journal(args.path)
+    print(f"📒 {args.path}: {len(records)} записей")
+    if not len(records):
+        raise SystemExit(0)
+    stats = replay_stats(records)
+    for name, s in [('всего', stats.total)] + sorted(stats.strategies.items()):
+        print(f"📊 {name}: сигналов {s.signals} | ордеров {s.orders} | сделок {s.trades} | win rate {s.win_rate:.1%} | "
+              f"PnL {s.net:+.2f}$ | комиссии {s.fees:.2f}$ | ср. удержание {s.avg_hold_seconds / 60:.1f} мин")
+    if stats.other_fees:
+        print("🪙 Комиссии не в котируемой валюте (не входят в PnL): "
+              + ", ".join(f"{amount:.6f} {asset}" for asset, amount in stats.other_fees.items()))
+    trades = journal_trades(records, stats)
+    if len(trades):
+        summary = summarize(trades['pnl'].to_numpy(), trades['fees'].to_numpy())
+        print(f"📉 Макс. просадка: {summary['max_drawdown']:.2f}$ | Profit factor: {summary['profit_factor']:.2f}")
+    if args.trades:
+        trades.to_csv(args.trades, index=False)
+        print(f"💾 Сделки сохранены в {args.trades}")
+    if args.records:
+        journal_frame(records).to_csv(args.records)
+        print(f"💾 Записи сохранены в {args.records}")
@@ -1,43 +1,183 @@
 import asyncio
 import json
 import logging
+import random
+import re
+import time
+
 import websockets
 
+from metrics import WS_DUPLICATES, WS_FIRST, WS_MESSAGES, WS_RECONNECTS
+
 logger = logging.getLogger(__name__)
 
+FUTURES_WS_URL = "wss://stream.binancefuture.com"
+
+def kline_streams(symbols, intervals):
+    if isinstance(symbols, str):
+        symbols = [symbols]
+    if isinstance(intervals, str):
+        intervals = [intervals]
+    return [f"{symbol.lower()}@kline_{interval}" for symbol in symbols for interval in intervals]
+
+
+def aggtrade_streams(symbols):
+    if isinstance(symbols, str):
+        symbols = [symbols]
+    return [f"{symbol.lower()}@aggTrade" for symbol in symbols]
+
+
+def depth_streams(symbols, speed='100ms'):
+    if isinstance(symbols, str):
+        symbols = [symbols]
+    return [f"{symbol.lower()}@depth@{speed}" for symbol in symbols]
+
+
+# === Переподключение: экспоненциальная пауза со случайным разбросом ===
+# «Full jitter»: пауза равномерно в [0, min(cap, base · 2^n)] — соединения и процессы
+# не переподключаются синхронно, после удачного подключения счётчик сбрасывается.
+class Backoff:
+    def __init__(self, base=0.5, cap=30.0):
+        self.base = base
+        self.cap = cap
+        self.attempts = 0
+
+    def next_delay(self):
+        delay = random.uniform(0, min(self.cap, self.base * 2 ** self.attempts))
+        self.attempts += 1
+        return delay
+
+    def reset(self):
+        self.attempts = 0
+
+
+_FRAME_STREAM = re.compile(r'"stream":\s*"([^"]+)"')
+_FRAME_EVENT_TIME = re.compile(r'"E":\s*(\d+)')
+_FRAME_ID = re.compile(r'"[au]":\s*(\d+)')   # aggTrade — a, depthUpdate — u; у kline хватает E
+
+
+# Ключ события для отсева дубликатов: (поток, время события, id сделки/обновления стакана)
+def frame_key(frame):
+    if isinstance(frame, bytes):
+        frame = frame.decode()
+    stream, event_time, event_id = _FRAME_STREAM.search(frame), _FRAME_EVENT_TIME.search(frame), _FRAME_ID.search(frame)
+    return (stream and stream.group(1), event_time and event_time.group(1), event_id and event_id.group(1))
+
+
+# Последние size ключей: первый кадр проходит, его копии с других соединений отбрасываются
+class FrameDeduplicator:
+    def __init__(self, size=8192):
+        self.size = size
+        self._seen = {}
+
+    def first(self, key):
+        if key in self._seen:
+            return False
+        self._seen[key] = None
+        if len(self._seen) > self.size:
+            del self._seen[next(iter(self._seen))]
+        return True
+
+
+# === Один WebSocket на много потоков через комбинированный эндпоинт /stream ===
+# connections > 1 — горячий резерв: все соединения открыты параллельно с одинаковыми потоками,
+# каждое событие принимается с того, что доставил его первым. on_resume(down_since_ms) ждут
+# после полного обрыва (не осталось ни одного соединения) до чтения кадров — догрузка свечей по REST.
 class BinanceFuturesWebSocketManager:
-    def __init__(self, symbol: str, interval: str, callback):
-        self.symbol = symbol.lower()
-        self.interval = interval
+    def __init__(self, symbols, intervals, callback, raw=False, trade_symbols=(), depth_symbols=(),
+                 connections=1, on_resume=None, on_connect=None, backoff_base=0.5, backoff_cap=30.0):
+        # aggTrade нужен только для своих таймфреймов (trade_bars.py), @depth — для локального стакана
+        self.streams = kline_streams(symbols, intervals) + aggtrade_streams(trade_symbols) + depth_streams(depth_symbols)
         self.callback = callback
-        self.connected = False
-        self.websocket = None
+        self.raw = raw  # передавать в callback сырой кадр без разбора JSON
+        self.connections = max(1, connections)
+        self.on_resume = on_resume
+        self.on_connect = on_connect   # sync: после каждого установленного соединения
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._dedup = FrameDeduplicator() if self.connections > 1 else None
+        self._messages = WS_MESSAGES.labels('market')
+        self._duplicates = WS_DUPLICATES.labels('market')
+        self._sockets = {}           # номер соединения → websocket
+        self._down_since_ms = None   # начало полного обрыва
+        self._resume_lock = asyncio.Lock()
+        self._request_id = 0
+
+    @property
+    def url(self):
+        return f"{FUTURES_WS_URL}/stream?streams={'/'.join(self.streams)}"
+
+    @property
+    def connected(self):
+        return bool(self._sockets)
 
     async def start(self):
-        stream = f"{self.symbol}@kline_{self.interval}"
-        url = f"wss://stream.binancefuture.com/ws/{stream}"
-        logger.info(f"🚀 Подключение к WebSocket: {url}")
+        await asyncio.gather(*(self._run_connection(n) for n in range(self.connections)))
 
+    async def _run_connection(self, n):
+        backoff = Backoff(self.backoff_base, self.backoff_cap)
+        first = WS_FIRST.labels(str(n))
         while True:
+            url = self.url
+            logger.info(f"🚀 Подключение к WebSocket #{n}: {len(self.streams)} потоков")
+            logger.debug("🔗 %s", url)
             try:
                 async with websockets.connect(url) as ws:
-                    self.websocket = ws
-                    self.connected = True
-                    logger.info("🔌 Соединение установлено")
-                    await self._listen(ws)
+                    logger.info("🔌 Соединение #%d установлено", n)
+                    backoff.reset()
+                    if self.on_connect:
+                        self.on_connect()
+                    await self._resume()
+                    self._sockets[n] = ws
+                    await self._listen(ws, first)
             except Exception as e:
-                logger.error(f"❌ Ошибка WebSocket: {e}")
-                self.connected = False
-                logger.info("🔄 Переподключение через 5 секунд...")
-                await asyncio.sleep(5)
+                logger.error(f"❌ Ошибка WebSocket #{n}: {e}")
+            finally:
+                self._sockets.pop(n, None)
+                if not self._sockets and self._down_since_ms is None:
+                    self._down_since_ms = int(time.time() * 1000)
+                    logger.warning("📴 Нет ни одного соединения с биржей")
+            delay = backoff.next_delay()
+            logger.info("🔄 Переподключение #%d через %.1f с...", n, delay)
+            await asyncio.sleep(delay)
+            WS_RECONNECTS.labels('market').inc()
 
-    async def _listen(self, ws):
+    # Первое восстановившееся соединение догружает пропуск; кадры, пришедшие тем временем,
+    # ждут в буфере сокета и обрабатываются уже после догрузки
+    async def _resume(self):
+        async with self._resume_lock:
+            down_since, self._down_since_ms = self._down_since_ms, None
+            if down_since is None or self.on_resume is None:
+                return
+            logger.info("🩹 Связь восстановлена после %.1f с обрыва — догружаем пропуск",
+                        (time.time() * 1000 - down_since) / 1000)
+            try:
+                await self.on_resume(down_since)
+            except Exception as e:
+                logger.error("❌ Ошибка догрузки после обрыва: %s", e)
+
+    async def _listen(self, ws, first=None):
+        dedup = self._dedup
         try:
             while True:
                 message = await ws.recv()
-                logger.debug("📩 Получено сырое сообщение: %s", message[:200] + "..." if len(message) > 200 else message)
+                self._messages.inc()
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("📩 Получено сырое сообщение: %s", message[:200] + "..." if len(message) > 200 else message)
+                if dedup is not None:
+                    if not dedup.first(frame_key(message)):
+                        self._duplicates.inc()
+                        continue
+                    first.inc()
+                if self.raw:
+                    # Разбор делает следующая стадия конвейера — здесь только чтение сокета
+                    await self.callback(message)
+                    continue
                 try:
                     msg = json.loads(message)
+                    # Комбинированный поток оборачивает событие в {"stream": ..., "data": ...}
+                    if 'data' in msg:
+                        msg = msg['data']
                     await self.callback(msg)
                 except json.JSONDecodeError as ve:
                     logger.error("❌ Ошибка парсинга JSON: %s", ve)
@@ -46,8 +186,102 @@ class BinanceFuturesWebSocketManager:
         except websockets.exceptions.ConnectionClosed as e:
             logger.warning("⚠️ Соединение закрыто: %s", e)
 
+    # === Подписка на лету (без переподключения) ===
+    async def subscribe(self, symbols, intervals):
+        streams = [s for s in kline_streams(symbols, intervals) if s not in self.streams]
+        if not streams:
+            return
+        self.streams.extend(streams)
+        await self._send_method('SUBSCRIBE', streams)
+
+    async def unsubscribe(self, symbols, intervals):
+        streams = [s for s in kline_streams(symbols, intervals) if s in self.streams]
+        if not streams:
+            return
+        self.streams = [s for s in self.streams if s not in streams]
+        await self._send_method('UNSUBSCRIBE', streams)
+
+    async def _send_method(self, method, streams):
+        # Без соединений новый список потоков применится при переподключении
+        for ws in list(self._sockets.values()):
+            self._request_id += 1
+            await ws.send(json.dumps({'method': method, 'params': streams, 'id': self._request_id}))
+        if self._sockets:
+            logger.info("📡 %s: %s", method, ", ".join(streams))
+
+    async def stop(self):
+        for ws in list(self._sockets.values()):
+            await ws.close()
+        if self._sockets:
+            self._sockets.clear()
+            logger.info("🛑 WebSocket остановлен")
+
+
+# === User data stream: события по нашим ордерам и позициям ===
+class BinanceUserDataStream:
+    def __init__(self, gateway, callback, on_connect=None, on_disconnect=None, keepalive_interval=30 * 60):
+        self.gateway = gateway
+        self.callback = callback
+        self.on_connect = on_connect          # сверка состояния по REST после (пере)подключения
+        self.on_disconnect = on_disconnect
+        self.keepalive_interval = keepalive_interval
+        self.connected = False
+        self.websocket = None
+
+    async def start(self):
+        backoff = Backoff()
+        while True:
+            keepalive_task = None
+            try:
+                listen_key = await self.gateway.new_listen_key()
+                async with websockets.connect(f"{FUTURES_WS_URL}/ws/{listen_key}") as ws:
+                    self.websocket = ws
+                    self.connected = True
+                    backoff.reset()
+                    logger.info("🔌 User data stream подключён")
+                    keepalive_task = asyncio.create_task(self._keepalive())
+                    if self.on_connect:
+                        await self.on_connect()
+                    await self._listen(ws)
+            except Exception as e:
+                logger.error(f"❌ Ошибка user data stream: {e}")
+            finally:
+                if keepalive_task:
+                    keepalive_task.cancel()
+
+            self.connected = False
+            WS_RECONNECTS.labels('user').inc()
+            if self.on_disconnect:
+                self.on_disconnect()
+            delay = backoff.next_delay()
+            logger.info("🔄 Переподключение user data stream через %.1f с...", delay)
+            await asyncio.sleep(delay)
+
+    async def _keepalive(self):
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            try:
+                await self.gateway.keepalive_listen_key()
+                logger.debug("🔑 listenKey продлён")
+            except Exception as e:
+                logger.error(f"❌ Не удалось продлить listenKey: {e}")
+
+    async def _listen(self, ws):
+        try:
+            while True:
+                msg = json.loads(await ws.recv())
+                WS_MESSAGES.labels('user').inc()
+                if msg.get('e') == 'listenKeyExpired':
+                    logger.warning("⚠️ listenKey истёк — переподключаемся")
+                    return
+                try:
+                    await self.callback(msg)
+                except Exception as e:
+                    logger.error("❌ Ошибка в обработчике user data: %s", e)
+        except websockets.exceptions.ConnectionClosed as e:
+            logger.warning("⚠️ User data stream закрыт: %s", e)
+
     async def stop(self):
         if self.websocket:
             await self.websocket.close()
             self.connected = False
-            logger.info("🛑 WebSocket остановлен")
\ No newline at end of file